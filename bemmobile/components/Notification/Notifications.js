@@ -12,7 +12,8 @@ const Notifications = ({ navigation,unreadNotifications, onClose, onUpdateUnread
     const dispatch = useContext(MyDispatchContext);
 
     const [notifications, setNotifications] = useState([]);
-    const [page, setPage] = useState(1);
+    // API phân trang con trỏ: trang kế tiếp lấy theo URL `next` của trang trước
+    const [nextPageUrl, setNextPageUrl] = useState(null);
     const [hasMore, setHasMore] = useState(true);
     const [loading, setLoading] = useState(false);
     const [errorMsg, setErrorMsg] = useState(null);
@@ -36,20 +37,20 @@ const Notifications = ({ navigation,unreadNotifications, onClose, onUpdateUnread
     // Reset notifications khi component được mở
     useEffect(() => {
         setNotifications([]);
-        setPage(1);
+        setNextPageUrl(null);
         setHasMore(true);
         if (user) {
-            fetchNotifications(1);
+            fetchNotifications();
         }
     }, [user]);
 
     // Hàm lấy danh sách thông báo cá nhân
-    const fetchNotifications = async (pageNum) => {
+    const fetchNotifications = async (url = endpoints.myNotifications, append = false) => {
         if (loading || !user) return;
         
         setLoading(true);
         try {
-            console.log(`>>> Notifications.js - Đang tải thông báo trang ${pageNum}`);
+            console.log(`>>> Notifications.js - Đang tải thông báo ${url}`);
             const token = await AsyncStorage.getItem('token');
             console.log('>>> Notifications.js - Token:', token);
             if (!token) {
@@ -59,21 +60,25 @@ const Notifications = ({ navigation,unreadNotifications, onClose, onUpdateUnread
             }
             
             const api = authApis(token);
-            const response = await api.get(`${endpoints.myNotifications}?page=${pageNum}`, {
+            const response = await api.get(url, {
                 headers: { 'Authorization': `Bearer ${token}` },
             });
 
             console.log('>>> Notifications.js - API Response:', response.data);
 
             const newNotifications = response.data.results || response.data || [];
-            console.log(`>>> Notifications.js - Trang ${pageNum} - Nhận được ${newNotifications.length} thông báo`);
+            console.log(`>>> Notifications.js - Nhận được ${newNotifications.length} thông báo`);
             
-            if (pageNum === 1) {
-                setNotifications(newNotifications);
+            if (append) {
+                setNotifications(prev => {
+                    const ids = new Set(prev.map(n => n.id));
+                    return [...prev, ...newNotifications.filter(n => !ids.has(n.id))];
+                });
             } else {
-                setNotifications(prev => [...prev, ...newNotifications]);
+                setNotifications(newNotifications);
             }
             
+            setNextPageUrl(response.data.next);
             setHasMore(!!response.data.next);
             setErrorMsg(null);
         } catch (err) {
@@ -200,10 +205,15 @@ const Notifications = ({ navigation,unreadNotifications, onClose, onUpdateUnread
 
     // Xử lý tải thêm thông báo
     const handleLoadMore = () => {
-        if (hasMore && !loading) {
-            console.log('>>> Notifications.js - Tải thêm trang', page + 1);
-            setPage((prev) => prev + 1);
-            fetchNotifications(page + 1);
+        if (hasMore && nextPageUrl && !loading) {
+            // Chuyển nextPageUrl về path tương đối nếu là URL tuyệt đối
+            let url = nextPageUrl;
+            if (url.startsWith('http')) {
+                const idx = url.indexOf('/', 8); // Bỏ qua "https://"
+                url = idx !== -1 ? url.substring(idx) : url;
+            }
+            console.log('>>> Notifications.js - Tải thêm', url);
+            fetchNotifications(url, true);
         }
     };
 
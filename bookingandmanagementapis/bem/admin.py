@@ -7,7 +7,7 @@ from ckeditor_uploader.widgets import CKEditorUploadingWidget
 from django.urls import path
 from .models import (
     User, Event, Tag, Ticket, Payment, Review, DiscountCode, Notification,
-    ChatMessage, EventTrendingLog, UserNotification,DeviceToken
+    ChatMessage, EventTrendingLog, UserNotification,DeviceToken, FailedTask, OutboxEmail
 )
 
 # Form tùy chỉnh cho Event
@@ -205,6 +205,23 @@ class DeviceTokenAdmin(admin.ModelAdmin):
         return super().get_queryset(request).select_related('user')
     
 
+# Admin cho FailedTask (job nền lỗi)
+class FailedTaskAdmin(admin.ModelAdmin):
+    list_display = ['id', 'name', 'attempts', 'created_at']
+    search_fields = ['name', 'error']
+    list_filter = ['name', 'created_at']
+    readonly_fields = ['name', 'args', 'kwargs', 'error', 'attempts', 'created_at']
+    list_per_page = 20
+
+
+# Admin cho OutboxEmail (hàng đợi email)
+class OutboxEmailAdmin(admin.ModelAdmin):
+    list_display = ['id', 'subject', 'to', 'status', 'attempts', 'created_at', 'sent_at']
+    search_fields = ['subject', 'to']
+    list_filter = ['status', 'created_at']
+    readonly_fields = ['claimed_at', 'sent_at', 'created_at']
+    list_per_page = 20
+
 
 # Custom Admin Site
 class MyAdminSite(admin.AdminSite):
@@ -248,4 +265,6 @@ admin_site.register(Notification, NotificationAdmin)
 admin_site.register(ChatMessage, ChatMessageAdmin)
 admin_site.register(EventTrendingLog, EventTrendingLogAdmin)
 admin_site.register(UserNotification, UserNotificationAdmin)
-admin_site.register(DeviceToken, DeviceTokenAdmin)  
\ No newline at end of file
+admin_site.register(DeviceToken, DeviceTokenAdmin)  
+admin_site.register(FailedTask, FailedTaskAdmin)
+admin_site.register(OutboxEmail, OutboxEmailAdmin)
@@ -6,3 +6,6 @@ class BemConfig(AppConfig):
 
     def ready(self):
         import bem.signals
+        from . import scheduler
+        if scheduler.should_start():
+            scheduler.start()
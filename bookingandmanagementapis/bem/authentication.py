@@ -1,5 +1,18 @@
+import hashlib
+import time
+
+from django.conf import settings
 from django.contrib.auth.backends import ModelBackend
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import router, transaction
+from django.utils import timezone
+from oauth2_provider.models import AccessToken
+from rest_framework.authentication import BaseAuthentication
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
 
 UserModel = get_user_model()
 
@@ -19,3 +32,116 @@ class EmailOrUsernameModelBackend(ModelBackend):
         if user.check_password(password) and self.user_can_authenticate(user):
             return user
         return None
+
+
+class CachedToken:
+    """request.auth của CachedTokenAuthentication: thông tin token đã xác thực (đọc từ cache)."""
+
+    def __init__(self, user_id, scope, expires):
+        self.user_id = user_id
+        self.scope = scope
+        self.expires = expires  # timestamp
+
+    def is_expired(self):
+        return time.time() >= self.expires
+
+    def allow_scopes(self, scopes):
+        return not scopes or set(scopes).issubset(self.scope.split())
+
+    def is_valid(self, scopes=None):
+        return not self.is_expired() and self.allow_scopes(scopes)
+
+
+def _token_key(checksum):
+    return f'bem:auth-token:{checksum}'
+
+
+def _user_key(user_id):
+    return f'bem:auth-user:{user_id}'
+
+
+# Trường của User được cache cho xác thực/phân quyền; các trường khác (total_spent, avatar...) bị defer
+# và được đọc mới từ DB khi truy cập, save() chỉ ghi các trường đã nạp
+USER_CACHE_FIELDS = [
+    f.attname for f in UserModel._meta.concrete_fields
+    if f.attname in ('id', 'username', 'email', 'role', 'is_active', 'is_staff', 'is_superuser')
+]
+
+
+def invalidate_token(checksum):
+    # Sau commit: request song song không nạp lại token cũ vào cache trước khi việc xóa được ghi
+    transaction.on_commit(lambda: cache.delete(_token_key(checksum)))
+
+
+def invalidate_user(user_id):
+    transaction.on_commit(lambda: cache.delete(_user_key(user_id)))
+
+
+class CachedTokenAuthentication(BaseAuthentication):
+    """
+    Xác thực REST bằng OAuth2 access token hoặc JWT với một lần đọc cache thay vì truy vấn DB mỗi request.
+
+    Loại token được chọn theo định dạng: JWT có dạng header.payload.signature, token OAuth2 không có dấu chấm,
+    nên mỗi request chỉ thử một cách. Token đã xác thực được cache (khóa là sha256 của token) với user id,
+    scope và hạn dùng, tối đa AUTH_TOKEN_CACHE_SECONDS và không quá hạn của token. User được cache riêng theo id,
+    chỉ các trường USER_CACHE_FIELDS (đủ cho permission class), trong AUTH_USER_CACHE_SECONDS; request.user là
+    instance với các trường còn lại bị defer nên view không đọc / save() bản cũ của total_spent, avatar...
+    Cache hit: xác thực không tốn truy vấn nào. Token bị thu hồi/đăng xuất (AccessToken bị xóa) hoặc User được
+    lưu / bị khóa sẽ bị xóa khỏi cache (bem/signals.py); với cache mặc định
+    locmem việc xóa chỉ có hiệu lực trong tiến trình thực hiện thu hồi, cần cache dùng chung (Redis) khi chạy
+    nhiều tiến trình.
+    """
+    www_authenticate_realm = 'api'
+
+    def authenticate(self, request):
+        header = request.META.get('HTTP_AUTHORIZATION', '').split()
+        if len(header) != 2 or header[0].lower() != 'bearer':
+            return None
+        token = header[1]
+        checksum = hashlib.sha256(token.encode()).hexdigest()
+        is_jwt = token.count('.') == 2
+
+        entry = cache.get(_token_key(checksum))
+        if entry is None or time.time() >= entry['expires']:
+            entry = self._validate_jwt(token) if is_jwt else self._validate_oauth2(checksum)
+            if entry is None:
+                return None
+            timeout = min(settings.AUTH_TOKEN_CACHE_SECONDS, int(entry['expires'] - time.time()))
+            if timeout > 0:
+                cache.set(_token_key(checksum), entry, timeout)
+
+        user = self._get_user(entry['user_id'])
+        if user is None or not user.is_active:
+            if is_jwt:
+                raise AuthenticationFailed('User not found or inactive', code='user_inactive')
+            return None
+        return user, CachedToken(entry['user_id'], entry['scope'], entry['expires'])
+
+    def _validate_oauth2(self, checksum):
+        access_token = AccessToken.objects.filter(token_checksum=checksum).values('user_id', 'scope', 'expires').first()
+        if access_token is None or access_token['user_id'] is None or access_token['expires'] <= timezone.now():
+            return None
+        return {'user_id': access_token['user_id'], 'scope': access_token['scope'],
+                'expires': access_token['expires'].timestamp()}
+
+    def _validate_jwt(self, token):
+        # Chữ ký/hạn dùng sai -> InvalidToken (401) như JWTAuthentication
+        validated = JWTAuthentication().get_validated_token(token.encode())
+        try:
+            user_id = validated[jwt_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken('Token contained no recognizable user identification')
+        return {'user_id': user_id, 'scope': '', 'expires': float(validated['exp'])}
+
+    def _get_user(self, user_id):
+        key = _user_key(user_id)
+        values = cache.get(key)
+        if values is None:
+            values = UserModel.objects.filter(pk=user_id).values_list(*USER_CACHE_FIELDS).first()
+            if values is None:
+                return None
+            cache.set(key, values, settings.AUTH_USER_CACHE_SECONDS)
+        return UserModel.from_db(router.db_for_read(UserModel), USER_CACHE_FIELDS, values)
+
+    def authenticate_header(self, request):
+        return f'Bearer realm="{self.www_authenticate_realm}"'
@@ -0,0 +1,225 @@
+"""
+Ghi tin nhắn chat theo lô (write-behind), bật bằng CHAT_WRITE_BEHIND.
+
+Khi bật, ChatConsumer không INSERT từng tin nhắn: tin nhắn nhận ngay id (lấy trước theo khối CHAT_ID_BLOCK_SIZE
+từ sequence của bảng) và created_at, được broadcast luôn rồi nằm trong bộ đệm của tiến trình. Một thread nền ghi
+bộ đệm bằng bulk_create sau CHAT_FLUSH_MILLISECONDS kể từ tin nhắn đầu tiên, hoặc ngay khi đủ CHAT_FLUSH_BATCH_SIZE
+tin nhắn. Lô ghi lỗi (DB tạm thời không dùng được) được giữ lại và ghi ở lần sau; dòng vi phạm ràng buộc
+(sự kiện / người gửi đã bị xóa) bị bỏ riêng để không chặn cả lô và được thu hồi khỏi phòng
+(chat.message_dropped, bem/rosters.py) vì client đã nhận tin nhắn đó. Lô lỗi CHAT_FLUSH_MAX_ATTEMPTS lần liên tiếp
+(ví dụ DataError) được ghi lại từng dòng: dòng lỗi không phải do mất kết nối DB cũng bị bỏ, thu hồi và lưu vào
+FailedTask, để một tin nhắn hỏng không nằm mãi trong bộ đệm.
+
+Đánh đổi của chế độ này: tin nhắn được hiển thị trước khi bền vững. Bộ đệm được ghi hết khi tiến trình thoát
+(atexit), nhưng nếu tiến trình bị kill đột ngột (SIGKILL, OOM, mất máy) thì các tin nhắn chưa ghi (tối đa một
+cửa sổ CHAT_FLUSH_MILLISECONDS, hoặc nhiều hơn nếu DB đang lỗi) đã được người khác thấy nhưng mất hẳn.
+Chỉ bật khi chấp nhận được điều đó.
+
+Hỗ trợ PostgreSQL và SQLite; khi tắt hoặc với backend khác tin nhắn được INSERT ngay như trước.
+Lệnh bench_chat_throughput đo số tin nhắn/giây của hai chế độ.
+"""
+import atexit
+import logging
+import threading
+import time
+import traceback
+from collections import defaultdict, deque
+
+from channels.db import database_sync_to_async
+from django.conf import settings
+from django.db import IntegrityError, InterfaceError, OperationalError, close_old_connections, connection, transaction
+
+from . import rosters
+from .models import ChatMessage, FailedTask
+
+logger = logging.getLogger(__name__)
+
+SUPPORTED_VENDORS = ('postgresql', 'sqlite')
+# Lỗi do DB tạm thời không dùng được: giữ tin nhắn lại dù lô đã lỗi nhiều lần
+TRANSIENT_ERRORS = (OperationalError, InterfaceError)
+
+_lock = threading.Lock()
+# Chỉ một lần flush tại một thời điểm (thread nền và atexit)
+_flush_lock = threading.Lock()
+_pending = []
+_ids = deque()
+_has_pending = threading.Event()
+_batch_full = threading.Event()
+_flusher = None
+
+
+def enabled():
+    return settings.CHAT_WRITE_BEHIND and connection.vendor in SUPPORTED_VENDORS
+
+
+async def save(message):
+    """Lưu một ChatMessage mới (write-behind nếu bật, ngược lại INSERT ngay); trả về message đã có id."""
+    if not enabled():
+        await database_sync_to_async(message.save)(force_insert=True)
+        return message
+    message.id = _take_id()
+    while message.id is None:
+        await database_sync_to_async(_refill)()
+        message.id = _take_id()
+    _add(message)
+    return message
+
+
+def pending_count():
+    with _lock:
+        return len(_pending)
+
+
+def _take_id():
+    with _lock:
+        return _ids.popleft() if _ids else None
+
+
+def _refill():
+    ids = _reserve_ids(settings.CHAT_ID_BLOCK_SIZE)
+    with _lock:
+        _ids.extend(ids)
+
+
+def _reserve_ids(n):
+    """Lấy trước n id chưa dùng (PostgreSQL: nextval của sequence; SQLite: tăng sqlite_sequence)."""
+    table = ChatMessage._meta.db_table
+    with transaction.atomic(), connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute("SELECT nextval(pg_get_serial_sequence(%s, 'id')) FROM generate_series(1, %s)", [table, n])
+            return [row[0] for row in cursor.fetchall()]
+        # Bảng AUTOINCREMENT của SQLite chưa có dòng sqlite_sequence cho tới lần INSERT đầu tiên
+        cursor.execute(
+            f"INSERT INTO sqlite_sequence (name, seq) SELECT %s, (SELECT COALESCE(MAX(id), 0) FROM {table}) "
+            "WHERE NOT EXISTS (SELECT 1 FROM sqlite_sequence WHERE name = %s)", [table, table]
+        )
+        cursor.execute("UPDATE sqlite_sequence SET seq = seq + %s WHERE name = %s", [n, table])
+        cursor.execute("SELECT seq FROM sqlite_sequence WHERE name = %s", [table])
+        last = cursor.fetchone()[0]
+        return list(range(last - n + 1, last + 1))
+
+
+def _add(message):
+    with _lock:
+        _pending.append(message)
+        _has_pending.set()
+        if len(_pending) >= settings.CHAT_FLUSH_BATCH_SIZE:
+            _batch_full.set()
+    _ensure_flusher()
+
+
+def _ensure_flusher():
+    global _flusher
+    if _flusher is None and settings.BUFFER_FLUSH_THREADS:
+        with _lock:
+            if _flusher is None:
+                _flusher = threading.Thread(target=_flush_loop, name='bem-chat-flush', daemon=True)
+                _flusher.start()
+
+
+def _flush_loop():
+    while True:
+        _has_pending.wait()
+        # Gom thêm tin nhắn trong cửa sổ flush, trừ khi đã đủ một lô
+        _batch_full.wait(settings.CHAT_FLUSH_MILLISECONDS / 1000)
+        close_old_connections()
+        try:
+            flush()
+            if len(_ids) < settings.CHAT_ID_BLOCK_SIZE // 2:
+                _refill()
+        except Exception as e:
+            logger.error(f"Chat flush failed, {pending_count()} messages kept for retry: {e}")
+            time.sleep(1)
+        finally:
+            close_old_connections()
+
+
+def flush():
+    """Ghi bộ đệm xuống DB theo lô CHAT_FLUSH_BATCH_SIZE dòng. Trả về số tin nhắn đã ghi."""
+    global _pending
+    with _flush_lock:
+        with _lock:
+            pending, _pending = _pending, []
+            _has_pending.clear()
+            _batch_full.clear()
+        written = 0
+        size = settings.CHAT_FLUSH_BATCH_SIZE
+        for i in range(0, len(pending), size):
+            batch = pending[i:i + size]
+            try:
+                written += _write(batch)
+            except Exception:
+                # batch chỉ còn các dòng chưa ghi: trả về đầu bộ đệm cùng phần sau để lần flush sau ghi tiếp
+                for message in batch:
+                    message._flush_failures = _failures(message) + 1
+                with _lock:
+                    _pending[:0] = batch + pending[i + size:]
+                    _has_pending.set()
+                raise
+        return written
+
+
+def _failures(message):
+    return getattr(message, '_flush_failures', 0)
+
+
+def _write(batch):
+    """Ghi một lô; dòng đã ghi hoặc đã bỏ được xóa khỏi batch, phần còn lại là phần cần giữ khi có lỗi."""
+    if max(map(_failures, batch)) < settings.CHAT_FLUSH_MAX_ATTEMPTS:
+        try:
+            with transaction.atomic():
+                ChatMessage.objects.bulk_create(batch)
+            written = len(batch)
+            batch.clear()
+            return written
+        except IntegrityError:
+            pass
+    # Một dòng vi phạm ràng buộc làm hỏng cả lô, hoặc lô đã lỗi quá CHAT_FLUSH_MAX_ATTEMPTS lần:
+    # ghi lại từng dòng, bỏ các dòng lỗi; mất kết nối DB thì dừng và giữ phần còn lại
+    written = 0
+    dropped = defaultdict(list)
+    try:
+        while batch:
+            message = batch[0]
+            try:
+                with transaction.atomic():
+                    ChatMessage.objects.bulk_create([message])
+                written += 1
+            except TRANSIENT_ERRORS:
+                raise
+            except Exception as e:
+                logger.error(f"Dropping chat message {message.id} of event {message.event_id}: {e}")
+                _dead_letter(message)
+                dropped[message.event_id].append(message.id)
+            batch.pop(0)
+    finally:
+        for event_id, ids in dropped.items():
+            rosters.retract_chat_messages(event_id, ids)
+    return written
+
+
+def _dead_letter(message):
+    try:
+        FailedTask.objects.create(
+            name='chat_buffer.write',
+            kwargs={
+                'id': message.id, 'event_id': message.event_id, 'sender_id': message.sender_id,
+                'receiver_id': message.receiver_id, 'message': message.message,
+                'created_at': message.created_at.isoformat(), 'is_from_organizer': message.is_from_organizer,
+            },
+            attempts=_failures(message) + 1, error=traceback.format_exc(),
+        )
+    except Exception as e:
+        logger.error(f"Could not record dropped chat message {message.id}: {e}")
+
+
+def _flush_at_exit():
+    if not settings.BUFFER_FLUSH_THREADS:
+        return
+    try:
+        flush()
+    except Exception as e:
+        logger.error(f"Chat flush at exit failed, {pending_count()} messages lost: {e}")
+
+
+atexit.register(_flush_at_exit)
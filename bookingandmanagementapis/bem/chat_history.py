@@ -0,0 +1,174 @@
+"""
+Lịch sử chat gần đây của mỗi phòng (sự kiện), giữ trong bộ nhớ của tiến trình.
+
+Mỗi phòng có một ring buffer CHAT_HISTORY_SIZE tin nhắn mới nhất (đã serialize), được đọc từ DB bằng một truy vấn
+khi có kết nối đầu tiên của tiến trình vào phòng và được giữ tới khi kết nối cuối cùng rời phòng. Trong thời gian đó
+tiến trình nhận mọi tin nhắn của phòng qua channel layer (chat_message, và chat.history_append cho tin nhắn riêng)
+nên ring buffer luôn đầy đủ; tin nhắn tạo ngoài WebSocket (REST, job, admin) hoặc bị xóa sẽ gửi chat.history_changed
+(bem/rosters.py) để phòng đọc lại từ DB. Khung JSON lịch sử gửi lúc connect (CHAT_HISTORY_INITIAL tin nhắn,
+kèm roster hiện tại) được encode một lần và dùng chung cho mọi kết nối tới khi phòng có tin nhắn mới.
+
+Client có thể xem tin nhắn cũ hơn bằng {"action": "history", "before_id": <id>}: trả về từ ring buffer nếu đủ,
+ngược lại một truy vấn DB theo (created_at, id).
+
+Chỉ dùng từ event loop của ASGI (không có khóa). Các kết nối vào phòng chưa nạp cùng chờ một lần đọc DB
+(Room.loading); chat.history_changed đến trong lúc đọc tăng Room.generation nên kết quả cũ bị bỏ và đọc lại.
+"""
+import asyncio
+import bisect
+import json
+
+from channels.db import database_sync_to_async
+from django.conf import settings
+from django.db.models import Q, Subquery
+from django.utils.dateparse import parse_datetime
+
+from .models import ChatMessage
+from .serializers import ChatMessageSerializer
+
+_rooms = {}
+
+
+class Room:
+    __slots__ = ('members', 'loaded', 'loading', 'generation', 'complete', 'entries', 'ids', 'frame')
+
+    def __init__(self):
+        self.members = 0
+        self.loaded = False
+        # Task đọc DB đang chạy (None nếu không có); generation tăng mỗi lần lịch sử bị đánh dấu thay đổi
+        self.loading = None
+        self.generation = 0
+        self.reset()
+
+    def reset(self):
+        # (created_at, id, data) từ cũ tới mới; data không có 'participants' (gắn roster hiện tại khi gửi)
+        self.entries = []
+        self.ids = set()
+        # True nếu entries là toàn bộ lịch sử của phòng (DB có ít hơn CHAT_HISTORY_SIZE tin nhắn)
+        self.complete = False
+        self.frame = None
+
+    def add(self, data):
+        if data['id'] in self.ids:
+            return
+        entry = (parse_datetime(data['created_at']), data['id'], {k: v for k, v in data.items() if k != 'participants'})
+        bisect.insort(self.entries, entry)
+        self.ids.add(data['id'])
+        if len(self.entries) > settings.CHAT_HISTORY_SIZE:
+            self.ids.discard(self.entries.pop(0)[1])
+            self.complete = False
+        self.frame = None
+
+
+def join(event_id):
+    """Một kết nối của tiến trình vào phòng (gọi sau group_add để không lỡ tin nhắn)."""
+    room = _rooms.get(event_id)
+    if room is None:
+        room = _rooms[event_id] = Room()
+    room.members += 1
+
+
+def leave(event_id):
+    room = _rooms.get(event_id)
+    if room is not None:
+        room.members -= 1
+        if room.members <= 0:
+            del _rooms[event_id]
+
+
+def append(data):
+    """Thêm tin nhắn (dạng ChatMessageSerializer) vào phòng của nó nếu tiến trình đang giữ phòng; bỏ qua nếu trùng id."""
+    room = _rooms.get(data['event'])
+    if room is not None:
+        room.add(data)
+
+
+def changed(event_id):
+    """Lịch sử thay đổi ngoài WebSocket: đọc lại từ DB ở lần cần kế tiếp."""
+    room = _rooms.get(event_id)
+    if room is not None:
+        room.generation += 1
+        room.loaded = False
+        room.reset()
+
+
+def roster_changed(event_id):
+    room = _rooms.get(event_id)
+    if room is not None:
+        room.frame = None
+
+
+def _with_roster(entries, participants):
+    return [dict(data, participants=participants) for _, _, data in entries]
+
+
+def _read_recent(event_id, participants):
+    messages = list(
+        ChatMessage.objects.filter(event_id=event_id).select_related('sender', 'receiver')
+        .order_by('-created_at', '-id')[:settings.CHAT_HISTORY_SIZE]
+    )
+    return ChatMessageSerializer(
+        messages, many=True, context={'participants_by_event': {event_id: participants}}
+    ).data
+
+
+async def _room(event_id, participants):
+    # Kết nối chưa join() (không được giữ lại) vẫn dùng được, chỉ không có cache
+    room = _rooms.get(event_id) or Room()
+    while not room.loaded:
+        if room.loading is None:
+            room.loading = asyncio.ensure_future(_load(room, event_id, participants))
+        # shield: kết nối đang chờ bị hủy (disconnect) không hủy lần đọc của các kết nối khác
+        await asyncio.shield(room.loading)
+    return room
+
+
+async def _load(room, event_id, participants):
+    generation = room.generation
+    try:
+        recent = await database_sync_to_async(_read_recent)(event_id, participants)
+        # changed() trong lúc đọc: kết quả có thể đã cũ, vòng lặp của _room() đọc lại
+        if room.generation != generation:
+            return
+        # Tin nhắn nhận qua channel layer trong lúc đọc DB đã nằm trong entries, add() bỏ qua trùng lặp
+        for data in recent:
+            room.add(data)
+        room.complete = len(recent) < settings.CHAT_HISTORY_SIZE
+        room.loaded = True
+    finally:
+        room.loading = None
+
+
+async def history_frame(event_id, participants):
+    """Khung {"history": [...]} (mới nhất trước) đã encode JSON cho kết nối mới vào phòng."""
+    room = await _room(event_id, participants)
+    if room.frame is None:
+        recent = room.entries[-settings.CHAT_HISTORY_INITIAL:][::-1]
+        room.frame = json.dumps({'history': _with_roster(recent, participants)})
+    return room.frame
+
+
+def _read_older(event_id, before_id, created_at, participants, limit):
+    messages = ChatMessage.objects.filter(event_id=event_id).select_related('sender', 'receiver')
+    if created_at is None:
+        created_at = Subquery(ChatMessage.objects.filter(pk=before_id, event_id=event_id).values('created_at')[:1])
+    messages = messages.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=before_id))
+    data = ChatMessageSerializer(
+        list(messages.order_by('-created_at', '-id')[:limit + 1]), many=True,
+        context={'participants_by_event': {event_id: participants}}
+    ).data
+    return list(data[:limit]), len(data) > limit
+
+
+async def older(event_id, before_id, participants, limit=None):
+    """Tối đa `limit` tin nhắn cũ hơn tin nhắn before_id (mới nhất trước). Trả về (danh sách, còn tin nhắn cũ hơn)."""
+    limit = limit or settings.CHAT_HISTORY_PAGE_SIZE
+    room = await _room(event_id, participants)
+    index = next((i for i, entry in enumerate(room.entries) if entry[1] == before_id), None)
+    created_at = None
+    if index is not None:
+        created_at = room.entries[index][0]
+        if index > limit or room.complete:
+            page = room.entries[max(index - limit, 0):index][::-1]
+            return _with_roster(page, participants), index > limit
+    return await database_sync_to_async(_read_older)(event_id, before_id, created_at, participants, limit)
@@ -1,21 +1,35 @@
 import json
 import logging
+import time
 from channels.generic.websocket import AsyncWebsocketConsumer
 from channels.db import database_sync_to_async
-from django.utils import timezone
 from bem.serializers import ChatMessageSerializer
-from oauth2_provider.models import AccessToken
+from bem import chat_buffer, chat_history, middleware
+from bem.rosters import event_participants
 
 logger = logging.getLogger(__name__)
 
+
 class ChatConsumer(AsyncWebsocketConsumer):
+    """
+    Phòng chat của một sự kiện (ws/chat/<event_id>/).
+
+    Quyền truy cập được kiểm tra một lần khi connect rồi giữ trong kết nối: hạn token (Principal của
+    TokenAuthMiddleware), thời gian kết thúc và organizer của sự kiện, vé đã thanh toán, roster người tham gia.
+    Tin nhắn chỉ kiểm tra trên dữ liệu này; kết nối tải lại khi token hết hạn hoặc khi nhận
+    chat.access_changed / chat.event_changed / chat.auth_changed qua channel layer (bem/rosters.py).
+    Mỗi tin nhắn chỉ còn một câu INSERT, hoặc không câu nào khi bật CHAT_WRITE_BEHIND (bem/chat_buffer.py).
+    Lịch sử gửi khi connect lấy từ ring buffer của phòng (bem/chat_history.py); client xem tin nhắn cũ hơn bằng
+    {"action": "history", "before_id": <id>}.
+    """
+
     async def connect(self):
-        from bem.models import ChatMessage, Event, Ticket, User
         logger.debug(f"WebSocket connect attempt for event_id={self.scope['url_route']['kwargs']['event_id']}")
-        
-        self.event_id = self.scope['url_route']['kwargs']['event_id']
+
+        self.event_id = int(self.scope['url_route']['kwargs']['event_id'])
         self.room_group_name = f'chat_{self.event_id}'
         self.user = self.scope['user']
+        self.principal = self.scope.get('principal')
 
         # Authentication check
         if not self.user or not self.user.is_authenticated:
@@ -26,59 +40,40 @@ class ChatConsumer(AsyncWebsocketConsumer):
         logger.info(f"Authenticated user: {self.user.username} (ID: {self.user.id})")
 
         try:
-            # Fetch event data from database
-            event_data = await database_sync_to_async(
-                lambda: Event.objects.filter(id=self.event_id).values('id', 'end_time', 'organizer_id').first()
-            )()
-            if not event_data:
-                raise Event.DoesNotExist
-
-            logger.debug(f"Found event: {event_data['id']}, end_time={event_data['end_time']}")
-
-            # Check event end time
-            now = await database_sync_to_async(timezone.now)()
-            if event_data['end_time'] < now:
+            if not await self._load_context():
+                await self.accept()
+                await self.send(text_data=json.dumps({'error': 'Sự kiện không tồn tại.'}))
+                await self.close(code=4005)
+                return
+
+            if self._event_ended():
                 logger.error(f"Event {self.event_id} has ended")
                 await self.accept()
                 await self.send(text_data=json.dumps({'error': 'Sự kiện đã kết thúc.'}))
                 await self.close(code=4004)
                 return
 
-            # Check access permissions
-            is_organizer = event_data['organizer_id'] == self.user.id
-            has_ticket = await database_sync_to_async(
-                lambda: Ticket.objects.filter(event_id=self.event_id, user=self.user, is_paid=True).exists()
-            )()
-            if not (is_organizer or has_ticket):
+            if not (self.is_organizer or self.has_ticket):
                 logger.error(f"User {self.user.username} has no access to event {self.event_id}")
                 await self.accept()
                 await self.send(text_data=json.dumps({'error': 'Bạn không có quyền truy cập phòng chat.'}))
                 await self.close(code=4004)
                 return
 
-            logger.info(f"User {self.user.username} has access: is_organizer={is_organizer}, has_ticket={has_ticket}")
+            logger.info(f"User {self.user.username} has access: is_organizer={self.is_organizer}, has_ticket={self.has_ticket}")
 
             # Add to event and user-specific groups
             await self.channel_layer.group_add(self.room_group_name, self.channel_name)
             await self.channel_layer.group_add(f'user_{self.user.id}', self.channel_name)
+            chat_history.join(self.event_id)
+            self.joined_history = True
             await self.accept()
             logger.info(f"WebSocket connection successful for user {self.user.username} (ID: {self.user.id}) to event {self.event_id}")
 
-            # Send message history
-            messages = await database_sync_to_async(
-                lambda: list(ChatMessage.objects.filter(event_id=self.event_id).order_by('-created_at')[:50])
-            )()
-            serializer_data = await database_sync_to_async(
-                lambda: ChatMessageSerializer(messages, many=True).data
-            )()
-            await self.send(text_data=json.dumps({'history': serializer_data}))
-            logger.debug(f"Sent {len(messages)} recent messages to user {self.user.username}")
-
-        except Event.DoesNotExist:
-            logger.error(f"Event {self.event_id} not found")
-            await self.accept()
-            await self.send(text_data=json.dumps({'error': 'Sự kiện không tồn tại.'}))
-            await self.close(code=4005)
+            # Send message history: khung JSON dùng chung của phòng
+            await self.send(text_data=await chat_history.history_frame(self.event_id, self.participants))
+            logger.debug(f"Sent recent messages to user {self.user.username}")
+
         except Exception as e:
             logger.error(f"Error in connect: {str(e)}")
             await self.accept()
@@ -93,55 +88,127 @@ class ChatConsumer(AsyncWebsocketConsumer):
         await self.channel_layer.group_discard(room_group_name, self.channel_name)
         if hasattr(self, 'user') and self.user.is_authenticated:
             await self.channel_layer.group_discard(f'user_{self.user.id}', self.channel_name)
+        if getattr(self, 'joined_history', False):
+            chat_history.leave(self.event_id)
+            self.joined_history = False
 
-    async def receive(self, text_data):
-        from bem.models import ChatMessage, Event, User, Ticket
-        logger.debug(f"Received message for event {self.event_id}: {text_data}")
+    # Ngữ cảnh quyền truy cập của kết nối
 
-        try:
-            # Validate token
-            auth_header = dict(self.scope['headers']).get(b'authorization', b'').decode()
-            if auth_header.startswith('Bearer '):
-                token = auth_header.replace('Bearer ', '')
-                token_obj = await database_sync_to_async(AccessToken.objects.get)(token=token)
-                is_valid = await database_sync_to_async(lambda: token_obj.is_valid())()
-                if not is_valid:
-                    logger.error(f"Invalid or expired token for user {self.user.username}")
-                    await self.send(text_data=json.dumps({'error': 'Token không hợp lệ.'}))
-                    await self.close(code=4001)
-                    return
-            else:
-                logger.error(f"No valid Bearer token in receive for user {self.user.username}")
+    async def _load_context(self):
+        """Đọc sự kiện, vé và roster bằng một lần chuyển sang thread. False nếu sự kiện không tồn tại."""
+        context = await database_sync_to_async(self._read_context)()
+        if context is None:
+            return False
+        event, self.has_ticket, participants = context
+        self.event_end = event['end_time'].timestamp()
+        self.organizer_id = event['organizer_id']
+        self.event_title = event['title']
+        self.is_organizer = self.organizer_id == self.user.id
+        # id -> username của những người có thể nhận tin nhắn riêng
+        self.roster = {p['id']: p['username'] for p in participants}
+        self.roster[self.organizer_id] = event['organizer__username']
+        self.participants = participants
+        self.context_stale = False
+        return True
+
+    def _read_context(self):
+        from bem.models import Event
+        event = Event.objects.filter(id=self.event_id).values(
+            'end_time', 'organizer_id', 'organizer__username', 'title'
+        ).first()
+        if event is None:
+            return None
+        participants = event_participants(self.event_id)
+        has_ticket = any(p['id'] == self.user.id for p in participants)
+        return event, has_ticket, participants
+
+    def _event_ended(self):
+        return time.time() >= self.event_end
+
+    async def _revalidate_token(self):
+        auth_header = dict(self.scope['headers']).get(b'authorization', b'').decode()
+        principal = None
+        if auth_header.startswith('Bearer '):
+            principal = await middleware.authenticate(auth_header[len('Bearer '):].strip())
+        if principal is None or principal.id != self.user.id:
+            return False
+        self.principal = principal
+        return True
+
+    async def _check_access(self):
+        """Kiểm tra quyền gửi tin nhắn; gửi lỗi, đóng kết nối và trả về False nếu không còn quyền."""
+        if self.principal is None or self.principal.is_expired():
+            if not await self._revalidate_token():
+                logger.error(f"Invalid or expired token for user {self.user.username}")
                 await self.send(text_data=json.dumps({'error': 'Token không hợp lệ.'}))
                 await self.close(code=4001)
-                return
+                return False
 
-            # Check event
-            event = await database_sync_to_async(
-                lambda: Event.objects.select_related('organizer').get(id=self.event_id)
-            )()
-            now = await database_sync_to_async(timezone.now)()
-            if event.end_time < now:
-                logger.error(f"Event {self.event_id} has ended in receive")
-                await self.send(text_data=json.dumps({'error': 'Sự kiện đã kết thúc.'}))
-                await self.close(code=4004)
-                return
+        if self.context_stale and not await self._load_context():
+            logger.error(f"Event {self.event_id} not found in receive")
+            await self.send(text_data=json.dumps({'error': 'Sự kiện không tồn tại.'}))
+            await self.close(code=4005)
+            return False
 
-            # Check sender's access permissions
-            is_organizer = await database_sync_to_async(
-                lambda: event.organizer_id == self.user.id
-            )()
-            has_ticket = await database_sync_to_async(
-                lambda: Ticket.objects.filter(event=event, user=self.user, is_paid=True).exists()
-            )()
-            if not (is_organizer or has_ticket):
-                logger.error(f"User {self.user.username} has no access to event {self.event_id}")
-                await self.send(text_data=json.dumps({'error': 'Bạn không có quyền truy cập phòng chat.'}))
-                await self.close(code=4004)
+        if self._event_ended():
+            logger.error(f"Event {self.event_id} has ended in receive")
+            await self.send(text_data=json.dumps({'error': 'Sự kiện đã kết thúc.'}))
+            await self.close(code=4004)
+            return False
+
+        if not (self.is_organizer or self.has_ticket):
+            logger.error(f"User {self.user.username} has no access to event {self.event_id}")
+            await self.send(text_data=json.dumps({'error': 'Bạn không có quyền truy cập phòng chat.'}))
+            await self.close(code=4004)
+            return False
+        return True
+
+    # Thông báo thay đổi từ bem/rosters.py: kiểm tra lại ở tin nhắn kế tiếp
+
+    async def chat_access_changed(self, event):
+        self.context_stale = True
+        chat_history.roster_changed(self.event_id)
+
+    async def chat_event_changed(self, event):
+        self.context_stale = True
+
+    async def chat_auth_changed(self, event):
+        self.principal = None
+
+    async def chat_history_changed(self, event):
+        chat_history.changed(self.event_id)
+
+    async def chat_message_dropped(self, event):
+        # Tin nhắn write-behind không ghi được (sự kiện / người gửi đã bị xóa): gỡ khỏi lịch sử và khỏi client
+        chat_history.changed(self.event_id)
+        await self.send(text_data=json.dumps({'dropped': event['ids']}))
+
+    async def chat_history_append(self, event):
+        # Tin nhắn riêng không đi qua phòng: chỉ cập nhật lịch sử, không gửi cho client
+        chat_history.append(event['message'])
+
+    async def _send_older(self, before_id):
+        try:
+            before_id = int(before_id)
+        except (TypeError, ValueError):
+            await self.send(text_data=json.dumps({'error': 'Dữ liệu không hợp lệ.'}))
+            return
+        messages, has_more = await chat_history.older(self.event_id, before_id, self.participants)
+        await self.send(text_data=json.dumps({'history': messages, 'before_id': before_id, 'has_more': has_more}))
+
+    async def receive(self, text_data):
+        from bem.models import ChatMessage, User
+        logger.debug(f"Received message for event {self.event_id}: {text_data}")
+
+        try:
+            if not await self._check_access():
                 return
 
             # Process message
             text_data_json = json.loads(text_data)
+            if text_data_json.get('action') == 'history':
+                await self._send_older(text_data_json.get('before_id'))
+                return
             message = text_data_json['message'].strip()
             receiver_id = text_data_json.get('receiver_id')
 
@@ -154,49 +221,45 @@ class ChatConsumer(AsyncWebsocketConsumer):
                 await self.send(text_data=json.dumps({'error': 'Tin nhắn quá dài.'}))
                 return
 
-            # Check receiver's access if specified
+            # Người nhận phải là organizer hoặc có trong roster của sự kiện
             receiver = None
             if receiver_id:
                 try:
-                    receiver = await database_sync_to_async(
-                        lambda: User.objects.get(id=receiver_id)
-                    )()
-                    has_access = await database_sync_to_async(
-                        lambda: receiver.id == event.organizer_id or Ticket.objects.filter(event=event, user=receiver, is_paid=True).exists()
-                    )()
-                    if not has_access:
-                        logger.warning(f"Receiver {receiver_id} has no access to event {self.event_id}")
-                        await self.send(text_data=json.dumps({'error': 'Người nhận không tham gia sự kiện này.'}))
-                        return
-                except User.DoesNotExist:
-                    logger.error(f"Receiver {receiver_id} does not exist")
-                    await self.send(text_data=json.dumps({'error': 'Người nhận không tồn tại.'}))
+                    receiver_id = int(receiver_id)
+                except (TypeError, ValueError):
+                    receiver_id = None
+                if receiver_id not in self.roster:
+                    logger.warning(f"Receiver {receiver_id} has no access to event {self.event_id}")
+                    await self.send(text_data=json.dumps({'error': 'Người nhận không tham gia sự kiện này.'}))
                     return
+                receiver = User(id=receiver_id, username=self.roster[receiver_id])
 
-            # Save message
-            chat_message = await database_sync_to_async(ChatMessage.objects.create)(
-                event=event,
+            # Save message: một câu INSERT (hoặc vào bộ đệm ghi theo lô nếu bật CHAT_WRITE_BEHIND), sender/receiver chỉ cần id
+            chat_message = ChatMessage(
+                event_id=self.event_id,
                 sender=self.user,
                 receiver=receiver,
                 message=message,
-                is_from_organizer=is_organizer
+                is_from_organizer=self.is_organizer
             )
-            serializer_data = await database_sync_to_async(
-                lambda: ChatMessageSerializer(chat_message).data
-            )()
-            message_data = serializer_data
+            # Được broadcast tới phòng ngay dưới đây, signal không cần báo lịch sử chat thay đổi
+            chat_message._broadcast = True
+            chat_message = await chat_buffer.save(chat_message)
+            message_data = ChatMessageSerializer(
+                chat_message, context={'participants_by_event': {self.event_id: self.participants}}
+            ).data
             logger.debug(f"Saved message: {message_data}")
 
             # Gửi push notification nếu là tin nhắn riêng
             if receiver:
-                from bem.utils import send_fcm_v1
-                message_body = f"{self.user.username} - {event.title}: {message[:50]}..."
-                await database_sync_to_async(send_fcm_v1)(
-                    receiver,
+                from bem.tasks import send_push
+                message_body = f"{self.user.username} - {self.event_title}: {message[:50]}..."
+                await database_sync_to_async(send_push.delay)(
+                    [receiver.id],
                     title="Tin nhắn mới",
                     body=message_body,
                     data={
-                        "event_id": str(event.id),
+                        "event_id": str(self.event_id),
                         "message_id": str(chat_message.id),
                         "type": "chat_message"
                     }
@@ -212,6 +275,11 @@ class ChatConsumer(AsyncWebsocketConsumer):
                     })
                     # Send message back to sender for history update
                     await self.send(text_data=json.dumps({'message': message_data}))
+                    # Lịch sử chat của phòng ở mọi tiến trình
+                    await self.channel_layer.group_send(self.room_group_name, {
+                        'type': 'chat.history_append',
+                        'message': message_data,
+                    })
                     logger.info(f"Private message sent to user {receiver_id}")
                 else:
                     await self.channel_layer.group_send(self.room_group_name, {
@@ -224,21 +292,14 @@ class ChatConsumer(AsyncWebsocketConsumer):
                 logger.warning(f"Could not send message to {receiver_id if receiver_id else 'group'}: {str(e)}")
                 await self.send(text_data=json.dumps({'warning': 'Tin nhắn đã lưu nhưng người nhận hiện không online.'}))
 
-        except Event.DoesNotExist:
-            logger.error(f"Event {self.event_id} not found in receive")
-            await self.send(text_data=json.dumps({'error': 'Sự kiện không tồn tại.'}))
-            await self.close(code=4005)
-        except json.JSONDecodeError:
+        except (json.JSONDecodeError, KeyError, AttributeError):
             logger.error(f"Invalid JSON data: {text_data}")
             await self.send(text_data=json.dumps({'error': 'Dữ liệu không hợp lệ.'}))
-        except AccessToken.DoesNotExist:
-            logger.error(f"Token not found in receive for user {self.user.username}")
-            await self.send(text_data=json.dumps({'error': 'Token không hợp lệ.'}))
-            await self.close(code=4001)
         except Exception as e:
             logger.error(f"Error in receive: {str(e)}")
             await self.send(text_data=json.dumps({'error': 'Không thể xử lý tin nhắn.'}))
 
     async def chat_message(self, event):
+        chat_history.append(event['message'])
         await self.send(text_data=json.dumps({'message': event['message']}))
-        logger.debug(f"Sent message to client: {event['message']}")
\ No newline at end of file
+        logger.debug(f"Sent message to client: {event['message']}")
@@ -0,0 +1,119 @@
+"""
+Tìm sự kiện gần một vị trí (events/nearby/) mà không quét toàn bảng.
+
+Event.geohash (GEOHASH_PRECISION ký tự, có index) được tính từ latitude/longitude khi lưu sự kiện.
+Vùng tìm (bán kính quanh một điểm hoặc bbox của màn hình bản đồ) được phủ bằng tối đa 4 ô geohash có
+cạnh không nhỏ hơn vùng tìm; mỗi ô là một điều kiện geohash LIKE 'prefix%' (startswith). Trên PostgreSQL
+Django tạo kèm index varchar_pattern_ops (_like) cho cột db_index nên LIKE dùng được index với mọi collation;
+so sánh khoảng theo chuỗi thì phụ thuộc collation của DB. Ứng viên được lọc tiếp
+bằng bbox chính xác, rồi tính khoảng cách haversine (NumPy) và sắp xếp theo khoảng cách.
+"""
+import math
+
+import numpy as np
+from django.db.models import Q
+
+EARTH_RADIUS_KM = 6371.0088
+GEOHASH_PRECISION = 9
+_BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+
+
+def encode(lat, lon, precision=GEOHASH_PRECISION):
+    lat_range, lon_range = [-90.0, 90.0], [-180.0, 180.0]
+    chars, bits, bit_count, even = [], 0, 0, True
+    while len(chars) < precision:
+        # Bit chẵn chia kinh độ, bit lẻ chia vĩ độ
+        bounds, value = (lon_range, lon) if even else (lat_range, lat)
+        mid = (bounds[0] + bounds[1]) / 2
+        if value >= mid:
+            bits, bounds[0] = bits * 2 + 1, mid
+        else:
+            bits, bounds[1] = bits * 2, mid
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            chars.append(_BASE32[bits])
+            bits = bit_count = 0
+    return ''.join(chars)
+
+
+def cell_size(precision):
+    """(chiều cao theo độ vĩ, chiều rộng theo độ kinh) của một ô geohash."""
+    bits = 5 * precision
+    return 180.0 / 2 ** (bits // 2), 360.0 / 2 ** ((bits + 1) // 2)
+
+
+def covering_prefixes(south, west, north, east):
+    """Tối đa 4 prefix geohash phủ bbox (west <= east); None nếu vùng lớn hơn một ô cấp 1."""
+    precision = 0
+    while precision < GEOHASH_PRECISION:
+        height, width = cell_size(precision + 1)
+        if height < north - south or width < east - west:
+            break
+        precision += 1
+    if precision == 0:
+        return None
+    # Ô không nhỏ hơn bbox nên bbox cắt nhiều nhất 2x2 ô, đều chứa một góc của bbox
+    return sorted({encode(lat, lon, precision) for lat in (south, north) for lon in (west, east)})
+
+
+def split_bbox(south, west, north, east):
+    """Tách bbox đi qua kinh tuyến 180 (west > east) thành hai bbox."""
+    if west <= east:
+        return [(south, west, north, east)]
+    return [(south, west, north, 180.0), (south, -180.0, north, east)]
+
+
+def bbox_around(lat, lon, radius_km):
+    d_lat = math.degrees(radius_km / EARTH_RADIUS_KM)
+    south, north = max(lat - d_lat, -90.0), min(lat + d_lat, 90.0)
+    cos_lat = math.cos(math.radians(max(abs(south), abs(north))))
+    if cos_lat < 1e-6 or north == 90.0 or south == -90.0:
+        # Gần cực: lấy mọi kinh độ
+        return [(south, -180.0, north, 180.0)]
+    d_lon = math.degrees(radius_km / (EARTH_RADIUS_KM * cos_lat))
+    if d_lon >= 180.0:
+        return [(south, -180.0, north, 180.0)]
+    west, east = lon - d_lon, lon + d_lon
+    if west < -180.0:
+        west += 360.0
+    if east > 180.0:
+        east -= 360.0
+    return split_bbox(south, west, north, east)
+
+
+def haversine_km(lat, lon, lats, lons):
+    lat, lon, lats, lons = np.radians(lat), np.radians(lon), np.radians(lats), np.radians(lons)
+    a = np.sin((lats - lat) / 2) ** 2 + np.cos(lat) * np.cos(lats) * np.sin((lons - lon) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def _box_condition(boxes):
+    condition = Q()
+    for south, west, north, east in boxes:
+        box = Q(latitude__gte=south, latitude__lte=north, longitude__gte=west, longitude__lte=east)
+        prefixes = covering_prefixes(south, west, north, east)
+        if prefixes:
+            cells = Q()
+            for prefix in prefixes:
+                cells |= Q(geohash__startswith=prefix)
+            box &= cells
+        condition |= box
+    return condition
+
+
+def nearby(queryset, lat, lon, radius_km=None, bbox=None, limit=100):
+    """
+    [(event_id, khoảng cách km)] tăng dần theo khoảng cách tới (lat, lon), trong bán kính radius_km
+    và/hoặc trong bbox (south, west, north, east). Chỉ đọc id và tọa độ của các ứng viên.
+    """
+    boxes = split_bbox(*bbox) if bbox else bbox_around(lat, lon, radius_km)
+    rows = np.array(
+        queryset.filter(_box_condition(boxes)).values_list('id', 'latitude', 'longitude'), dtype=np.float64
+    ).reshape(-1, 3)
+    distances = haversine_km(lat, lon, rows[:, 1], rows[:, 2])
+    if radius_km is not None:
+        keep = distances <= radius_km
+        rows, distances = rows[keep], distances[keep]
+    order = np.argsort(distances, kind='stable')[:limit]
+    return list(zip(rows[order, 0].astype(np.int64).tolist(), distances[order].tolist()))
@@ -0,0 +1,146 @@
+"""
+Outbox email: view/job chỉ ghi OutboxEmail, flush_outbox() gửi theo lô.
+
+Mỗi lần flush mở một kết nối (get_connection) và gửi nhiều mail trên cùng phiên SMTP/TLS,
+mở lại sau EMAIL_MAX_PER_CONNECTION mail; tốc độ gửi bị giới hạn bởi EMAIL_MAX_PER_SECOND.
+Các dòng được nhận bằng select_for_update(skip_locked) nên nhiều tiến trình flush cùng lúc
+không gửi trùng; dòng 'sending' quá EMAIL_CLAIM_TIMEOUT_SECONDS (tiến trình chết giữa chừng) được nhận lại.
+Mail lỗi chờ EMAIL_RETRY_BACKOFF_SECONDS * 2^(lần thử - 1) giây (next_attempt_at) rồi mới được nhận lại ở một lần
+flush sau, nên SMTP lỗi ngắn không làm hết lượt thử ngay; quá EMAIL_MAX_ATTEMPTS thì thành failed.
+"""
+import logging
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import OutboxEmail
+
+logger = logging.getLogger(__name__)
+
+_flush_pending = threading.Event()
+
+
+def queue_emails(messages):
+    """Ghi nhiều mail vào outbox. messages: iterable (subject, body, recipient_list). Trả về số mail."""
+    rows = [
+        OutboxEmail(subject=subject[:255], body=body, from_email=settings.EMAIL_HOST_USER or '', to=list(to))
+        for subject, body, to in messages if any(to)
+    ]
+    OutboxEmail.objects.bulk_create(rows, batch_size=1000)
+    if rows:
+        _schedule_flush()
+    return len(rows)
+
+
+def queue_email(subject, body, recipient_list):
+    return queue_emails([(subject, body, recipient_list)])
+
+
+def _schedule_flush():
+    # Cờ chỉ được đặt khi transaction đã commit: rollback thì không có job flush nào và cờ không bị kẹt
+    if settings.TASK_BACKEND == 'eager':
+        _enqueue_flush()
+    else:
+        transaction.on_commit(_enqueue_flush)
+
+
+def _enqueue_flush():
+    # Gộp nhiều lần queue trong cùng tiến trình thành một job flush
+    if not _flush_pending.is_set():
+        _flush_pending.set()
+        from . import tasks
+        tasks.flush_email_outbox.delay()
+
+
+def _claim(batch_size):
+    now = timezone.now()
+    stale = now - timedelta(seconds=settings.EMAIL_CLAIM_TIMEOUT_SECONDS)
+    with transaction.atomic():
+        # Dòng bị bỏ dở ở lần thử cuối không còn lượt nhận lại
+        OutboxEmail.objects.filter(
+            status='sending', claimed_at__lt=stale, attempts__gte=settings.EMAIL_MAX_ATTEMPTS
+        ).update(status='failed', error='Claim timed out')
+        ids = list(
+            OutboxEmail.objects.select_for_update(skip_locked=True)
+            .filter(
+                status__in=['pending', 'sending'],
+                attempts__lt=settings.EMAIL_MAX_ATTEMPTS,
+            )
+            .filter(Q(next_attempt_at__isnull=True) | Q(next_attempt_at__lte=now))
+            .exclude(status='sending', claimed_at__gte=stale)
+            .order_by('created_at')
+            .values_list('id', flat=True)[:batch_size]
+        )
+        OutboxEmail.objects.filter(pk__in=ids).update(status='sending', claimed_at=now, attempts=F('attempts') + 1)
+    return list(OutboxEmail.objects.filter(pk__in=ids).order_by('created_at'))
+
+
+class _Throttle:
+    def __init__(self, per_second):
+        self.interval = 1.0 / per_second if per_second else 0
+        self.next_at = time.monotonic()
+
+    def wait(self):
+        if self.interval:
+            delay = self.next_at - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            self.next_at = max(self.next_at, time.monotonic()) + self.interval
+
+
+def flush_outbox(limit=None, batch_size=None):
+    """Gửi mail đang chờ trong outbox. Trả về danh sách số liệu từng lô {'sent', 'failed', 'seconds'}."""
+    _flush_pending.clear()
+    batch_size = batch_size or settings.EMAIL_BATCH_SIZE
+    throttle = _Throttle(settings.EMAIL_MAX_PER_SECOND)
+    connection = get_connection(fail_silently=False)
+    on_connection = 0
+    total = 0
+    metrics = []
+    try:
+        while limit is None or total < limit:
+            batch = _claim(batch_size if limit is None else min(batch_size, limit - total))
+            if not batch:
+                break
+            started = time.monotonic()
+            sent, failed = [], {}
+            for email in batch:
+                if on_connection >= settings.EMAIL_MAX_PER_CONNECTION:
+                    connection.close()
+                    on_connection = 0
+                throttle.wait()
+                message = EmailMessage(email.subject, email.body, email.from_email or None, email.to,
+                                       connection=connection)
+                try:
+                    connection.open()
+                    connection.send_messages([message])
+                    sent.append(email.id)
+                    on_connection += 1
+                except Exception as e:
+                    failed[email.id] = str(e)
+                    # Kết nối có thể đã hỏng: mở lại cho mail tiếp theo
+                    connection.close()
+                    on_connection = 0
+
+            OutboxEmail.objects.filter(pk__in=sent).update(status='sent', sent_at=timezone.now(), error='')
+            for email in batch:
+                if email.id in failed:
+                    exhausted = email.attempts >= settings.EMAIL_MAX_ATTEMPTS
+                    backoff = settings.EMAIL_RETRY_BACKOFF_SECONDS * 2 ** (email.attempts - 1)
+                    OutboxEmail.objects.filter(pk=email.id).update(
+                        status='failed' if exhausted else 'pending', error=failed[email.id],
+                        next_attempt_at=timezone.now() + timedelta(seconds=backoff)
+                    )
+            batch_metrics = {'sent': len(sent), 'failed': len(failed), 'seconds': round(time.monotonic() - started, 3)}
+            logger.info(f"Email outbox batch: {batch_metrics}")
+            metrics.append(batch_metrics)
+            total += len(batch)
+    finally:
+        connection.close()
+    return metrics
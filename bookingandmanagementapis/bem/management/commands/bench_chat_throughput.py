@@ -0,0 +1,116 @@
+import asyncio
+import logging
+import time
+from datetime import timedelta
+
+from channels.db import database_sync_to_async
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import override_settings
+from django.utils import timezone
+from oauth2_provider.models import AccessToken, Application
+
+from bem import chat_buffer
+from bem.middleware import TokenAuthMiddleware
+from bem.models import ChatMessage, Event, Ticket, User
+from bem.routing import websocket_urlpatterns
+
+
+class Command(BaseCommand):
+    help = ('Load test for the event chat: concurrent WebSocket clients send public messages through ChatConsumer '
+            '(each waits for its ack before the next message), once with a synchronous INSERT per message and '
+            'once with CHAT_WRITE_BEHIND. Uses the configured database and channel layer; test data is deleted afterwards')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clients', type=int, default=50)
+        parser.add_argument('--messages', type=int, default=40, help='Messages per client')
+        parser.add_argument('--keep', action='store_true', help='Do not delete the generated event and users')
+
+    def handle(self, *args, **options):
+        clients, per_client = options['clients'], options['messages']
+        if connection.vendor not in chat_buffer.SUPPORTED_VENDORS:
+            raise CommandError(f"Write-behind is not supported on {connection.vendor}.")
+
+        # Log từng tin nhắn của consumer làm sai lệch số đo
+        logging.getLogger('bem').setLevel(logging.WARNING)
+        logging.getLogger('django.channels').setLevel(logging.WARNING)
+
+        tag = timezone.now().strftime('%Y%m%d%H%M%S%f')
+        organizer = User.objects.create_user(f'chatbench_org_{tag}', f'chatbench_org_{tag}@example.com', role='organizer')
+        attendees = [
+            User.objects.create_user(f'chatbench_{tag}_{i}', f'chatbench_{tag}_{i}@example.com')
+            for i in range(clients)
+        ]
+        now = timezone.now()
+        event = Event.objects.create(
+            organizer=organizer, title=f'Chat bench {tag}', description='chat load test', category='other',
+            start_time=now, end_time=now + timedelta(days=1),
+            location='-', latitude=0, longitude=0, total_tickets=clients, ticket_price=0,
+        )
+        application = Application.objects.create(
+            name=f'chatbench {tag}', user=organizer, client_type='confidential', authorization_grant_type='password'
+        )
+        tokens = []
+        for user in attendees:
+            Ticket.objects.create(event=event, user=user, is_paid=True)
+            token = AccessToken.objects.create(
+                user=user, application=application, token=f'chatbench-{tag}-{user.pk}',
+                expires=now + timedelta(hours=1), scope='read write websocket'
+            )
+            tokens.append(token.token)
+        self.stdout.write(f"Seeded event {event.pk} with {clients} attendees ({connection.vendor})")
+
+        total = clients * per_client
+        try:
+            for label, write_behind in (('INSERT per message', False), ('write-behind (CHAT_WRITE_BEHIND)', True)):
+                with override_settings(CHAT_WRITE_BEHIND=write_behind):
+                    elapsed, drain = asyncio.run(self._run(event.pk, tokens, per_client))
+                rows = ChatMessage.objects.filter(event=event).count()
+                line = f"{label:<34} {total} messages in {elapsed:6.2f}s {total / elapsed:8.0f} msg/s"
+                if write_behind:
+                    line += f" (final flush {drain * 1000:.1f} ms, {(total / (elapsed + drain)):.0f} msg/s persisted)"
+                self.stdout.write(line)
+                if rows != total:
+                    raise CommandError(f"Expected {total} stored messages, found {rows}.")
+                ChatMessage.objects.filter(event=event).delete()
+        finally:
+            if not options['keep']:
+                event.delete()
+                User.objects.filter(pk__in=[organizer.pk] + [u.pk for u in attendees]).delete()
+        self.stdout.write(self.style.SUCCESS("All messages persisted."))
+
+    async def _run(self, event_id, tokens, per_client):
+        app = TokenAuthMiddleware(URLRouter(websocket_urlpatterns))
+        clients = [
+            WebsocketCommunicator(app, f'/ws/chat/{event_id}/', headers=[(b'authorization', f'Bearer {t}'.encode())])
+            for t in tokens
+        ]
+        for client in clients:
+            connected, _ = await client.connect()
+            if not connected:
+                raise CommandError("WebSocket connection refused.")
+            await client.receive_from()  # lịch sử chat
+
+        async def send_all(index, client):
+            for n in range(per_client):
+                await client.send_json_to({'message': f'bench {index}-{n}'})
+                # Bỏ qua tin nhắn broadcast của client khác cho tới khi nhận ack của chính mình
+                while True:
+                    frame = await client.receive_json_from(timeout=30)
+                    if 'status' in frame:
+                        break
+                    if 'error' in frame or 'warning' in frame:
+                        raise CommandError(f"Chat error: {frame}")
+
+        started = time.perf_counter()
+        await asyncio.gather(*(send_all(i, c) for i, c in enumerate(clients)))
+        elapsed = time.perf_counter() - started
+
+        started = time.perf_counter()
+        await database_sync_to_async(chat_buffer.flush)()
+        drain = time.perf_counter() - started
+        for client in clients:
+            await client.disconnect()
+        return elapsed, drain
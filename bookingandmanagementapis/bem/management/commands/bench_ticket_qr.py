@@ -0,0 +1,52 @@
+import time
+import uuid
+from types import SimpleNamespace
+
+import cloudinary
+from cloudinary.uploader import upload
+from cloudinary.utils import cloudinary_url
+from django.core.management.base import BaseCommand
+
+from bem.qr_codes import QR_FOLDER, render_qr_png, render_ticket_qr, ticket_qr_url
+
+
+class Command(BaseCommand):
+    help = 'Benchmark stored (Cloudinary) vs on-demand ticket QR codes for purchase and listing'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tickets', type=int, default=200)
+        parser.add_argument('--upload', type=int, default=0,
+                            help='Also time N real Cloudinary uploads (needs CLOUDINARY_* credentials)')
+
+    def _timed(self, label, fn, n):
+        started = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - started
+        self.stdout.write(f"{label:<45} {elapsed * 1000:9.1f} ms total {elapsed * 1e6 / n:10.1f} us/ticket")
+
+    def handle(self, *args, **options):
+        n = options['tickets']
+        uuids = [str(uuid.uuid4()) for _ in range(n)]
+        render_ticket_qr.cache_clear()
+
+        self.stdout.write(f"Purchase path ({n} tickets)")
+        self._timed("stored: render PNG per ticket", lambda: [render_qr_png(u) for u in uuids], n)
+        if options['upload']:
+            m = options['upload']
+            self._timed(f"stored: render + upload ({m} tickets)",
+                        lambda: [upload(render_qr_png(u), folder=QR_FOLDER, public_id=u) for u in uuids[:m]], m)
+        self.stdout.write("on-demand: nothing to do at purchase time")
+
+        self.stdout.write(f"\nServing path ({n} tickets)")
+        self._timed("on-demand: first render (LRU miss)", lambda: [render_ticket_qr(u, 'png') for u in uuids], n)
+        self._timed("on-demand: repeat render (LRU hit)", lambda: [render_ticket_qr(u, 'png') for u in uuids], n)
+        self._timed("on-demand: first render SVG", lambda: [render_ticket_qr(u, 'svg') for u in uuids], n)
+
+        self.stdout.write(f"\nListing path ({n} tickets)")
+        cloud_name = cloudinary.config().cloud_name or 'demo'
+        self._timed("stored: cloudinary_url per row",
+                    lambda: [cloudinary_url(f"{QR_FOLDER}/{u}", cloud_name=cloud_name) for u in uuids], n)
+        tickets = [SimpleNamespace(uuid=u, qr_code=None) for u in uuids]
+        ticket_qr_url(tickets[0])  # nạp URLconf trước khi đo
+        self._timed("on-demand: ticket_qr_url per row", lambda: [ticket_qr_url(t) for t in tickets], n)
+        self.stdout.write(render_ticket_qr.cache_info().__repr__())
@@ -0,0 +1,71 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+import numpy as np
+
+from bem import trending
+from bem.models import Event, EventTrendingLog, User
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Benchmark per-row calculate_score against the vectorized bulk rescoring (runs in a rolled-back transaction)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--events', type=int, default=100000)
+        parser.add_argument('--per-row', type=int, default=1000,
+                            help='Number of events to time with EventTrendingLog.calculate_score')
+
+    def _timed(self, label, fn, n):
+        started = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - started
+        self.stdout.write(f"{label:<45} {elapsed:8.2f} s total {elapsed * 1e6 / n:10.1f} us/event")
+        return elapsed
+
+    def handle(self, *args, **options):
+        n = options['events']
+        rng = np.random.default_rng(0)
+        try:
+            with transaction.atomic():
+                organizer = User.objects.create_user('bench-organizer', 'bench@example.com', role='organizer')
+                now = timezone.now()
+                total = rng.integers(50, 5000, n)
+                events = Event.objects.bulk_create([
+                    Event(
+                        organizer=organizer, title=f'Bench {i}', description='-', category='music',
+                        start_time=now + timedelta(days=30), end_time=now + timedelta(days=31), location='-', latitude=0, longitude=0, ticket_price=0,
+                        total_tickets=int(total[i]), sold_tickets=int(rng.integers(0, total[i])),
+                    )
+                    for i in range(n)
+                ], batch_size=5000)
+                EventTrendingLog.objects.bulk_create([
+                    EventTrendingLog(event=e, view_count=int(v)) for e, v in zip(events, rng.integers(0, 10000, n))
+                ], batch_size=5000)
+                self.stdout.write(f"Seeded {n} events")
+
+                m = min(options['per_row'], n)
+                logs = list(EventTrendingLog.objects.select_related('event')[:m])
+                per_row = self._timed(f"calculate_score per row ({m} events)",
+                                      lambda: [log.calculate_score() for log in logs], m)
+                bulk = self._timed(f"rescore_events ({n} events)", lambda: trending.rescore_events(), n)
+                self.stdout.write(f"Estimated per-row time for {n} events: {per_row / m * n:.1f} s "
+                                  f"({per_row / m * n / bulk:.0f}x slower)")
+
+                self.stdout.write(f"Score formula only (NumPy, {n} events): {self._score_only(n, rng) * 1000:.1f} ms")
+                raise Rollback
+        except Rollback:
+            pass
+
+    def _score_only(self, n, rng):
+        sold = rng.integers(0, 5000, n)
+        started = time.perf_counter()
+        trending.compute_scores(sold, sold + 100, rng.integers(0, 60, n), rng.integers(0, 10000, n),
+                                rng.integers(0, 50, n))
+        return time.perf_counter() - started
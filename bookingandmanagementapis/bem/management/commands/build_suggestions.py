@@ -0,0 +1,18 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from bem import suggestions
+
+
+class Command(BaseCommand):
+    help = 'Precompute suggested events for users'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, action='append', dest='user_ids',
+                            help='Only this user id (repeatable; default: every active user)')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        count = suggestions.build(options['user_ids'], rebuild_events=True)
+        self.stdout.write(f"Built suggestions for {count} user(s) in {time.perf_counter() - started:.2f}s.")
@@ -0,0 +1,17 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from bem import search
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the full-text search index of events'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=search.BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        count = search.rebuild(batch_size=options['batch_size'])
+        self.stdout.write(f"Indexed {count} event(s) in {time.perf_counter() - started:.2f}s.")
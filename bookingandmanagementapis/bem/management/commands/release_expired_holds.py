@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+from bem.reservations import release_expired_holds, resync_inventory
+
+
+class Command(BaseCommand):
+    help = 'Release seats held by unpaid tickets whose hold has expired'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--event', type=int, help='Only release holds of this event')
+        parser.add_argument('--resync', action='store_true',
+                            help='Recount sold/reserved tickets from the Ticket table afterwards')
+
+    def handle(self, *args, **options):
+        released = release_expired_holds(event_id=options['event'])
+        self.stdout.write(f"Released {released} expired hold(s).")
+        if options['resync']:
+            event_ids = [options['event']] if options['event'] else None
+            updated = resync_inventory(event_ids)
+            self.stdout.write(f"Resynced inventory of {updated} event(s).")
@@ -0,0 +1,35 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from bem import trending
+
+
+class Command(BaseCommand):
+    help = 'Recompute trending and interest scores of events in bulk'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dirty', action='store_true',
+                            help='Only events with pending changes (default: every active event)')
+        parser.add_argument('--weights', help='JSON object overriding TRENDING_WEIGHTS, e.g. \'{"views": 0.4}\'')
+        parser.add_argument('--batch-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        weights = None
+        if options['weights']:
+            try:
+                weights = json.loads(options['weights'])
+            except ValueError as e:
+                raise CommandError(f"Invalid --weights: {e}")
+            unknown = set(weights) - set(trending.get_weights())
+            if unknown:
+                raise CommandError(f"Unknown weight(s): {', '.join(sorted(unknown))}")
+
+        started = time.perf_counter()
+        trending.flush()
+        if options['dirty']:
+            count = trending.rescore_dirty()
+        else:
+            count = trending.rescore_events(weights=weights, batch_size=options['batch_size'])
+        self.stdout.write(f"Rescored {count} event(s) in {time.perf_counter() - started:.2f}s.")
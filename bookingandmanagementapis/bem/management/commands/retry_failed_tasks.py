@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+from bem.models import FailedTask
+from bem.tasks import registry
+
+
+class Command(BaseCommand):
+    help = 'Re-run background tasks from the dead-letter table (FailedTask)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--name', help='Only retry tasks with this name')
+
+    def handle(self, *args, **options):
+        failed = FailedTask.objects.order_by('created_at')
+        if options['name']:
+            failed = failed.filter(name=options['name'])
+        retried = succeeded = 0
+        for item in failed:
+            task = registry.get(item.name)
+            if task is None:
+                self.stderr.write(f"Unknown task {item.name}, skipping #{item.pk}")
+                continue
+            retried += 1
+            item.delete()  # Nếu lại lỗi, Task.run ghi một dead letter mới
+            if task.run(item.args, item.kwargs, backoff=False):
+                succeeded += 1
+        self.stdout.write(f"Retried {retried} task(s), {succeeded} succeeded.")
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+from bem.mailer import flush_outbox
+
+
+class Command(BaseCommand):
+    help = 'Send pending emails from the outbox over a reused SMTP connection'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, help='Send at most this many emails')
+        parser.add_argument('--batch-size', type=int, help='Emails claimed per batch')
+
+    def handle(self, *args, **options):
+        metrics = flush_outbox(limit=options['limit'], batch_size=options['batch_size'])
+        for i, batch in enumerate(metrics, 1):
+            self.stdout.write(f"Batch {i}: sent={batch['sent']} failed={batch['failed']} in {batch['seconds']}s")
+        sent = sum(batch['sent'] for batch in metrics)
+        failed = sum(batch['failed'] for batch in metrics)
+        self.stdout.write(f"Sent {sent} email(s), {failed} failed.")
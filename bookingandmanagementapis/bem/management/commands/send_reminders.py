@@ -0,0 +1,21 @@
+from datetime import datetime, time
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from bem.reminders import send_due_reminders
+
+
+class Command(BaseCommand):
+    help = 'Create reminder notifications for upcoming events and deliver them to ticket holders'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date', help='Run as if today were this date (YYYY-MM-DD)')
+
+    def handle(self, *args, **options):
+        now = None
+        if options['date']:
+            day = datetime.strptime(options['date'], '%Y-%m-%d').date()
+            now = timezone.make_aware(datetime.combine(day, time(12)))
+        result = send_due_reminders(now=now)
+        self.stdout.write(f"Reminded {result['recipients']} user(s) for {result['events']} event(s).")
@@ -0,0 +1,86 @@
+import threading
+import time
+from datetime import timedelta
+
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections, connection
+from django.utils import timezone
+
+from bem.models import Event, Ticket, User
+
+
+class Command(BaseCommand):
+    help = ('Concurrency stress test for ticket reservations: many threads book one hot event '
+            'through Ticket.save() and the command verifies that no ticket is oversold')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seats', type=int, default=200)
+        parser.add_argument('--threads', type=int, default=16)
+        parser.add_argument('--attempts', type=int, default=50, help='Booking attempts per thread')
+        parser.add_argument('--keep', action='store_true', help='Do not delete the generated event and users')
+
+    def handle(self, *args, **options):
+        seats, threads, attempts = options['seats'], options['threads'], options['attempts']
+        if connection.vendor == 'sqlite':
+            self.stderr.write("SQLite serialises writers; run against PostgreSQL/MySQL for a meaningful result.")
+
+        tag = timezone.now().strftime('%Y%m%d%H%M%S%f')
+        organizer = User.objects.create_user(f'stress_org_{tag}', f'stress_org_{tag}@example.com', role='organizer')
+        buyers = [
+            User.objects.create_user(f'stress_{tag}_{i}', f'stress_{tag}_{i}@example.com')
+            for i in range(threads)
+        ]
+        now = timezone.now()
+        event = Event.objects.create(
+            organizer=organizer, title=f'Stress {tag}', description='stress test', category='other',
+            start_time=now + timedelta(days=1), end_time=now + timedelta(days=2),
+            location='-', latitude=0, longitude=0, total_tickets=seats, ticket_price=0,
+        )
+
+        booked, sold_out, errors = [0] * threads, [0] * threads, []
+        barrier = threading.Barrier(threads)
+
+        def worker(index):
+            close_old_connections()
+            barrier.wait()
+            try:
+                for _ in range(attempts):
+                    try:
+                        Ticket(event_id=event.pk, user=buyers[index]).save()
+                        booked[index] += 1
+                    except ValidationError:
+                        sold_out[index] += 1
+            except Exception as e:  # lỗi DB (deadlock, lock timeout...) cũng là kết quả cần báo cáo
+                errors.append(repr(e))
+            finally:
+                connection.close()
+
+        pool = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+        started = time.perf_counter()
+        for t in pool:
+            t.start()
+        for t in pool:
+            t.join()
+        elapsed = time.perf_counter() - started
+
+        event.refresh_from_db()
+        rows = Ticket.objects.filter(event=event).count()
+        total_attempts = threads * attempts
+        self.stdout.write(
+            f"{total_attempts} attempts in {elapsed:.2f}s ({total_attempts / elapsed:.0f} req/s): "
+            f"booked={sum(booked)} sold_out={sum(sold_out)} errors={len(errors)}"
+        )
+        self.stdout.write(
+            f"seats={seats} reserved_tickets={event.reserved_tickets} sold_tickets={event.sold_tickets} ticket_rows={rows}"
+        )
+
+        if not options['keep']:
+            event.delete()
+            User.objects.filter(pk__in=[organizer.pk] + [b.pk for b in buyers]).delete()
+
+        if errors:
+            self.stderr.write("\n".join(errors[:5]))
+        if rows > seats or sum(booked) != rows or event.reserved_tickets != rows:
+            raise CommandError("Oversell detected: inventory counters do not match ticket rows.")
+        self.stdout.write(self.style.SUCCESS("No oversell."))
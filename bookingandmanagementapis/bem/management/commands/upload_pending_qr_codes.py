@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+from bem.models import Ticket
+from bem.tasks import upload_ticket_qr
+
+
+class Command(BaseCommand):
+    help = 'Upload QR codes for paid tickets still marked qr_pending (e.g. after a worker restart)'
+
+    def handle(self, *args, **options):
+        uuids = list(Ticket.objects.filter(qr_pending=True, is_paid=True).values_list('uuid', flat=True))
+        done = sum(1 for ticket_uuid in uuids if upload_ticket_qr.run([ticket_uuid], {}))
+        self.stdout.write(f"Uploaded {done}/{len(uuids)} pending QR code(s).")
@@ -1,87 +1,160 @@
+"""
+Xác thực kết nối WebSocket bằng OAuth2 access token (header Authorization: Bearer ..., scope 'websocket').
+
+Token hợp lệ được lưu thành một Principal gọn (id, username, role, scope, hạn dùng) trong cache dùng chung
+(khóa là sha256 của token, tối đa AUTH_TOKEN_CACHE_SECONDS và không quá hạn token), nên khi client kết nối lại
+liên tục phần lớn handshake chỉ tốn một lần đọc cache ngay trên event loop, không truy vấn DB hay thread hop:
+với Redis (CACHE_REDIS_URL) đọc bằng client redis.asyncio thay vì cache.aget() (RedisCache không có aget gốc,
+aget chạy qua sync_to_async); với LocMemCache đọc trực tiếp vì cache nằm trong bộ nhớ, không có I/O.
+Không giữ bản sao riêng trong tiến trình: token bị thu hồi phải bị từ chối ngay ở mọi worker dùng chung cache.
+Khi cache hết: một truy vấn AccessToken select_related user. Hạn dùng trong Principal được tin cậy,
+token bị thu hồi (AccessToken bị xóa) sẽ bị xóa khỏi cache (bem/signals.py).
+
+scope['user'] là User chỉ có id/username/role (đủ cho lọc ORM, gán khóa ngoại và serializer chat),
+không được save(); scope['principal'] là Principal của kết nối.
+"""
+import asyncio
+import hashlib
+import json
 import logging
+import time
+import weakref
+
 from channels.db import database_sync_to_async
+from django.conf import settings
 from django.contrib.auth.models import AnonymousUser
 from django.core.cache import cache
-from django.utils import timezone
+from django.db import transaction
 from oauth2_provider.models import AccessToken
 
 logger = logging.getLogger(__name__)
 
+WEBSOCKET_SCOPE = 'websocket'
+
+
+class Principal:
+    __slots__ = ('id', 'username', 'role', 'scope', 'expires')
+
+    def __init__(self, id, username, role, scope, expires):
+        self.id = id
+        self.username = username
+        self.role = role
+        self.scope = scope
+        self.expires = expires  # timestamp
+
+    def as_record(self):
+        return (self.id, self.username, self.role, self.scope, self.expires)
+
+    def is_expired(self):
+        return time.time() >= self.expires
+
+    def user(self):
+        from .models import User
+        return User(id=self.id, username=self.username, role=self.role, is_active=True)
+
+
+def _key(checksum):
+    return f'bem:ws-principal:{checksum}'
+
+
+# Client Redis gắn với event loop tạo ra nó: mỗi loop một client bất đồng bộ
+_async_clients = weakref.WeakKeyDictionary()
+_sync_client = None
+
+
+def _redis_key(checksum):
+    # Cùng KEY_PREFIX/VERSION với cache mặc định
+    return cache.make_key(_key(checksum))
+
+
+def _get_sync_client():
+    global _sync_client
+    if _sync_client is None:
+        import redis
+        _sync_client = redis.Redis.from_url(settings.CACHE_REDIS_URL)
+    return _sync_client
+
+
+def _get_async_client():
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        from redis import asyncio as aioredis
+        client = _async_clients[loop] = aioredis.Redis.from_url(settings.CACHE_REDIS_URL)
+    return client
+
+
+def _store(checksum, record, timeout):
+    if settings.CACHE_REDIS_URL:
+        _get_sync_client().set(_redis_key(checksum), json.dumps(record), ex=timeout)
+    else:
+        cache.set(_key(checksum), record, timeout)
+
+
+async def _fetch(checksum):
+    if settings.CACHE_REDIS_URL:
+        raw = await _get_async_client().get(_redis_key(checksum))
+        return json.loads(raw) if raw is not None else None
+    return cache.get(_key(checksum))
+
+
+def invalidate(checksum):
+    """Xóa Principal của token (sau khi transaction hiện tại commit)."""
+    def delete():
+        if settings.CACHE_REDIS_URL:
+            _get_sync_client().delete(_redis_key(checksum))
+        else:
+            cache.delete(_key(checksum))
+    transaction.on_commit(delete)
+
+
+def _load_principal(checksum):
+    """Một truy vấn; None nếu token không tồn tại, hết hạn, thiếu scope websocket hoặc user bị khóa."""
+    token = (
+        AccessToken.objects.select_related('user')
+        .only('expires', 'scope', 'user__id', 'user__username', 'user__role', 'user__is_active')
+        .filter(token_checksum=checksum).first()
+    )
+    if token is None or token.user is None or not token.user.is_active:
+        return None
+    principal = Principal(token.user.id, token.user.username, token.user.role, token.scope, token.expires.timestamp())
+    if principal.is_expired() or WEBSOCKET_SCOPE not in principal.scope.split():
+        return None
+    timeout = min(settings.AUTH_TOKEN_CACHE_SECONDS, int(principal.expires - time.time()))
+    if timeout > 0:
+        _store(checksum, principal.as_record(), timeout)
+    return principal
+
+
+async def authenticate(token):
+    checksum = hashlib.sha256(token.encode()).hexdigest()
+    record = await _fetch(checksum)
+    principal = Principal(*record) if record is not None else None
+    if principal is None or principal.is_expired():
+        principal = await database_sync_to_async(_load_principal)(checksum)
+    return principal
+
+
 class TokenAuthMiddleware:
     def __init__(self, inner):
         self.inner = inner
 
     async def __call__(self, scope, receive, send):
-        logger.debug("Starting TokenAuthMiddleware processing")
-        headers = dict(scope['headers'])
-        auth_header = headers.get(b'authorization', b'').decode()
-
+        scope['user'] = AnonymousUser()
+        scope['principal'] = None
+        auth_header = dict(scope['headers']).get(b'authorization', b'').decode()
         if not auth_header.startswith('Bearer '):
             logger.warning("No valid Bearer token provided in Authorization header")
-            scope['user'] = AnonymousUser()
             return await self.inner(scope, receive, send)
 
-        token = auth_header.replace('Bearer ', '')
-        logger.debug(f"Processing token: {token[:10]}... (masked for security)")
-        cache_key = f"token_{token}"
-
-        # Kiểm tra cache với async
-        logger.debug("Checking cache for token")
-        cached_user = await database_sync_to_async(cache.get)(cache_key)
-        if cached_user is not None:
-            try:
-                logger.debug("Verifying token in database")
-                token_exists = await database_sync_to_async(
-                    lambda: AccessToken.objects.filter(token=token, user=cached_user).exists()
-                )()
-                if token_exists:
-                    logger.debug(f"User {cached_user.username} retrieved from cache")
-                    scope['user'] = cached_user
-                    return await self.inner(scope, receive, send)
-                else:
-                    logger.warning("Token found in cache but not in database, clearing cache")
-                    await database_sync_to_async(cache.delete)(cache_key)
-            except Exception as e:
-                logger.error(f"Error validating cached token: {str(e)}")
-                await database_sync_to_async(cache.delete)(cache_key)
-
-        # Kiểm tra token trong database với async
         try:
-            logger.debug("Fetching token from database")
-            token_data = await database_sync_to_async(
-                lambda: AccessToken.objects.filter(token=token).values('user', 'scope', 'expires').first()
-            )()
-            if not token_data:
-                logger.warning("Token not found in database")
-                scope['user'] = AnonymousUser()
-                return await self.inner(scope, receive, send)
-
-            logger.debug("Checking token validity")
-            is_valid = await database_sync_to_async(
-                lambda: token_data['expires'] > timezone.now()
-            )()
-            if is_valid:
-                token_scope = token_data['scope']
-                logger.debug(f"Token scope: {token_scope}")
-                if 'websocket' not in token_scope.split():
-                    logger.warning(f"Token lacks 'websocket' scope: {token_scope}")
-                    scope['user'] = AnonymousUser()
-                    return await self.inner(scope, receive, send)
-
-                user = await database_sync_to_async(lambda: AccessToken.objects.get(token=token).user)()
-                scope['user'] = user
-                logger.debug("Calculating TTL for cache")
-                ttl = await database_sync_to_async(
-                    lambda: int((token_data['expires'] - timezone.now()).total_seconds())
-                )()
-                logger.debug(f"Setting cache with TTL: {ttl}")
-                await database_sync_to_async(cache.set)(cache_key, user, timeout=ttl)
-                logger.info(f"Token valid for user: {user.username}, cached with TTL {ttl}s")
-            else:
-                logger.warning("Token expired or invalid")
-                scope['user'] = AnonymousUser()
+            principal = await authenticate(auth_header[len('Bearer '):].strip())
         except Exception as e:
             logger.error(f"Error processing token: {str(e)}")
-            scope['user'] = AnonymousUser()
-
-        return await self.inner(scope, receive, send)
\ No newline at end of file
+            principal = None
+        if principal is None:
+            logger.warning("Token not found, expired, or lacks 'websocket' scope")
+        else:
+            scope['principal'] = principal
+            scope['user'] = principal.user()
+        return await self.inner(scope, receive, send)
@@ -0,0 +1,41 @@
+# Generated by Django 5.1.6 on 2026-10-18 06:47
+
+import django.core.validators
+from decimal import Decimal
+from django.db import migrations, models
+from django.db.models import Count, Q
+
+
+def resync_sold_tickets(apps, schema_editor):
+    # sold_tickets trước đây có thể bị lệch; tính lại từ số vé đã thanh toán
+    Event = apps.get_model('bem', 'Event')
+    counts = Event.objects.annotate(
+        paid=Count('tickets', filter=Q(tickets__is_paid=True))
+    ).values_list('pk', 'paid')
+    for pk, paid in counts:
+        Event.objects.filter(pk=pk).update(sold_tickets=paid, reserved_tickets=0)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bem', '0004_alter_discountcode_options'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='event',
+            name='reserved_tickets',
+            field=models.IntegerField(default=0, validators=[django.core.validators.MinValueValidator(Decimal('0'))]),
+        ),
+        migrations.AddField(
+            model_name='ticket',
+            name='hold_expires_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='ticket',
+            index=models.Index(fields=['is_paid', 'hold_expires_at'], name='bem_ticket_is_paid_e8500f_idx'),
+        ),
+        migrations.RunPython(resync_sold_tickets, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.6 on 2026-10-18 06:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bem', '0005_event_reserved_tickets_ticket_hold_expires_at_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ticket',
+            name='qr_pending',
+            field=models.BooleanField(default=False),
+        ),
+    ]
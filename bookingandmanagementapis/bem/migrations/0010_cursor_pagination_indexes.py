@@ -0,0 +1,25 @@
+# Generated by Django 5.1.6 on 2026-10-18 07:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bem', '0009_outboxemail'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='eventtrendinglog',
+            index=models.Index(fields=['trending_score', 'event'], name='bem_eventtr_trendin_2a9e9a_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ticket',
+            index=models.Index(fields=['user', 'created_at'], name='bem_ticket_user_id_3aabd7_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='usernotification',
+            index=models.Index(fields=['user', 'created_at'], name='bem_usernot_user_id_90c365_idx'),
+        ),
+    ]
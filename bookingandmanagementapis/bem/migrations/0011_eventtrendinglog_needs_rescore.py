@@ -0,0 +1,18 @@
+# Generated by Django 5.1.6 on 2026-10-18 07:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bem', '0010_cursor_pagination_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='eventtrendinglog',
+            name='needs_rescore',
+            field=models.BooleanField(db_index=True, default=False),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.1.6 on 2026-10-18 07:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bem', '0011_eventtrendinglog_needs_rescore'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='event',
+            index=models.Index(fields=['is_active', 'sold_tickets'], name='bem_event_is_acti_6113fc_idx'),
+        ),
+    ]
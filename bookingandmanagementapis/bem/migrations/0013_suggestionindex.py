@@ -0,0 +1,23 @@
+# Generated by Django 5.1.6 on 2026-10-18 07:28
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bem', '0012_event_hot_ranking_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SuggestionIndex',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='suggestion_index', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('event_ids', models.JSONField(default=list)),
+                ('built_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,84 @@
+# Generated by Django 5.1.6 on 2026-10-18 07:31
+
+import unicodedata
+
+import django.contrib.postgres.search
+from django.db import migrations
+
+# Bản sao cố định của bem/search.py tại thời điểm migration (không import code của app:
+# bem.search phụ thuộc models hiện tại)
+FTS_TABLE = 'bem_event_fts'
+TEXT_FIELDS = ('title', 'location', 'category', 'description')
+CATEGORY_LABELS = {
+    'music': 'Music', 'sports': 'Sports', 'seminar': 'Seminar', 'conference': 'Conference',
+    'festival': 'Festival', 'workshop': 'Workshop', 'party': 'Party', 'competition': 'Competition',
+    'other': 'Other',
+}
+
+
+def normalize(text):
+    text = (text or '').lower().replace('đ', 'd')
+    return ''.join(c for c in unicodedata.normalize('NFD', text) if not unicodedata.combining(c))
+
+
+def index_rows(rows, conn):
+    docs = [
+        (row['id'], normalize(row['title']), normalize(row['location']),
+         normalize(f"{row['category'] or ''} {CATEGORY_LABELS.get(row['category'] or '', '')}"),
+         normalize(row['description']))
+        for row in rows
+    ]
+    if not docs:
+        return
+    with conn.cursor() as cursor:
+        if conn.vendor == 'postgresql':
+            cursor.executemany(
+                "UPDATE bem_event SET search_vector = "
+                "setweight(to_tsvector('simple', %s), 'A') || setweight(to_tsvector('simple', %s), 'B') || "
+                "setweight(to_tsvector('simple', %s), 'B') || setweight(to_tsvector('simple', %s), 'C') "
+                "WHERE id = %s",
+                [(*doc[1:], doc[0]) for doc in docs]
+            )
+        else:
+            cursor.executemany(
+                f"INSERT INTO {FTS_TABLE}(rowid, {', '.join(TEXT_FIELDS)}) VALUES (%s, %s, %s, %s, %s)", docs
+            )
+
+
+def create_search_index(apps, schema_editor):
+    # GIN (PostgreSQL) / FTS5 (SQLite) không khai báo được bằng Meta.indexes cho cả hai backend
+    conn = schema_editor.connection
+    if conn.vendor == 'postgresql':
+        schema_editor.execute("CREATE INDEX bem_event_search_gin ON bem_event USING gin (search_vector)")
+    elif conn.vendor == 'sqlite':
+        schema_editor.execute(
+            f"CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5({', '.join(TEXT_FIELDS)}, tokenize='unicode61')"
+        )
+    else:
+        return
+    Event = apps.get_model('bem', 'Event')
+    index_rows(Event.objects.values('id', *TEXT_FIELDS), conn)
+
+
+def drop_search_index(apps, schema_editor):
+    conn = schema_editor.connection
+    if conn.vendor == 'postgresql':
+        schema_editor.execute("DROP INDEX IF EXISTS bem_event_search_gin")
+    elif conn.vendor == 'sqlite':
+        schema_editor.execute(f"DROP TABLE IF EXISTS {FTS_TABLE}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bem', '0013_suggestionindex'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='event',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
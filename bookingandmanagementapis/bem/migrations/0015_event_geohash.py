@@ -0,0 +1,28 @@
+# Generated by Django 5.1.6 on 2026-10-18 07:35
+
+from django.db import migrations, models
+
+
+def fill_geohash(apps, schema_editor):
+    from bem.geo import encode
+    Event = apps.get_model('bem', 'Event')
+    events = list(Event.objects.only('id', 'latitude', 'longitude'))
+    for event in events:
+        event.geohash = encode(event.latitude, event.longitude)
+    Event.objects.bulk_update(events, ['geohash'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bem', '0014_event_search'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='event',
+            name='geohash',
+            field=models.CharField(blank=True, db_index=True, default='', editable=False, max_length=12),
+        ),
+        migrations.RunPython(fill_geohash, migrations.RunPython.noop),
+    ]
@@ -1,10 +1,13 @@
 from datetime import timedelta
 from django.db import models, transaction
+from django.db.models import F
 from django.utils import timezone
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.contrib.auth.models import AbstractBaseUser, BaseUserManager, PermissionsMixin
 from django.core.exceptions import ValidationError
 from cloudinary.models import CloudinaryField
+from django.contrib.postgres.search import SearchVectorField
+from . import geo
 import uuid
 from decimal import Decimal
 
@@ -108,6 +111,28 @@ class EventQuerySet(models.QuerySet):
     def active(self):
         return self.filter(is_active=True, end_time__gte=timezone.now())
 
+    # Các thao tác tồn kho vé: mỗi thao tác là một câu UPDATE nguyên tử, không đọc trước rồi ghi lại
+    def reserve(self, event_id, quantity=1, paid=False):
+        """Giữ `quantity` chỗ nếu còn đủ vé, trả về True nếu giữ chỗ thành công."""
+        counter = 'sold_tickets' if paid else 'reserved_tickets'
+        return self.filter(
+            pk=event_id,
+            total_tickets__gte=F('sold_tickets') + F('reserved_tickets') + quantity
+        ).update(**{counter: F(counter) + quantity}) == 1
+
+    def confirm_reserved(self, event_id, quantity=1):
+        """Chuyển chỗ đang giữ thành vé đã bán."""
+        return self.filter(pk=event_id).update(
+            reserved_tickets=F('reserved_tickets') - quantity,
+            sold_tickets=F('sold_tickets') + quantity
+        )
+
+    def release_reserved(self, event_id, quantity=1):
+        return self.filter(pk=event_id).update(reserved_tickets=F('reserved_tickets') - quantity)
+
+    def adjust_sold(self, event_id, delta):
+        return self.filter(pk=event_id).update(sold_tickets=F('sold_tickets') + delta)
+
 
 # Sự kiện
 class Event(models.Model):
@@ -134,20 +159,30 @@ class Event(models.Model):
     location = models.CharField(max_length=500)
     latitude = models.FloatField(validators=[MinValueValidator(Decimal('-90')), MaxValueValidator(Decimal('90'))])
     longitude = models.FloatField(validators=[MinValueValidator(Decimal('-180')), MaxValueValidator(Decimal('180'))])
+    # Geohash của (latitude, longitude), tính khi lưu, dùng cho tìm sự kiện gần (bem/geo.py)
+    geohash = models.CharField(max_length=12, blank=True, default='', editable=False, db_index=True)
 
     total_tickets = models.IntegerField(validators=[MinValueValidator(Decimal('0'))])
     ticket_price = models.DecimalField(max_digits=9, decimal_places=2, validators=[MinValueValidator(Decimal('0.00'))])
     sold_tickets = models.IntegerField(default=0, validators=[MinValueValidator(Decimal('0'))])
+    # Số chỗ đang được giữ bởi vé chưa thanh toán (còn hạn giữ chỗ)
+    reserved_tickets = models.IntegerField(default=0, validators=[MinValueValidator(Decimal('0'))])
 
     tags = models.ManyToManyField('Tag', blank=True, related_name='events')
 
     poster = CloudinaryField('poster', null=True, blank=True)
 
+    # Chỉ mục full-text trên PostgreSQL (bem/search.py), chỉ mục GIN được tạo trong migration
+    search_vector = SearchVectorField(null=True, editable=False)
+
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     objects = EventQuerySet.as_manager()
 
+    # Bộ đếm tồn kho chỉ được thay đổi qua EventQuerySet, không ghi đè bằng save()
+    INVENTORY_FIELDS = ('sold_tickets', 'reserved_tickets')
+
     class Meta:
         constraints = [
             models.CheckConstraint(
@@ -158,6 +193,8 @@ class Event(models.Model):
         indexes = [
             models.Index(fields=['start_time', 'end_time']),
             models.Index(fields=['organizer']),
+            # Xếp hạng sự kiện hot (bán chạy) theo cột đếm sold_tickets
+            models.Index(fields=['is_active', 'sold_tickets']),
         ]
 
     def __str__(self):
@@ -171,8 +208,22 @@ class Event(models.Model):
 
     def save(self, *args, **kwargs):
         self.full_clean()
+        self.geohash = geo.encode(self.latitude, self.longitude)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and {'latitude', 'longitude'}.intersection(update_fields):
+            kwargs['update_fields'] = {*update_fields, 'geohash'}
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            # Tránh ghi đè sold_tickets/reserved_tickets cũ trong bộ nhớ lên giá trị đang được cập nhật đồng thời
+            kwargs['update_fields'] = [
+                f.name for f in self._meta.concrete_fields
+                if not f.primary_key and f.name not in self.INVENTORY_FIELDS
+            ]
         super().save(*args, **kwargs)
 
+    @property
+    def available_tickets(self):
+        return max(self.total_tickets - self.sold_tickets - self.reserved_tickets, 0)
+
     #chuyển sang signals.py update_event_status
     # def check_event_status(self):
     #     if timezone.now() > self.end_time:
@@ -193,6 +244,7 @@ class Ticket(models.Model):
     event = models.ForeignKey(Event, on_delete=models.CASCADE, related_name='tickets')
     uuid = models.UUIDField(default=uuid.uuid4, editable=False, unique=True)
     qr_code = CloudinaryField('qr_code', null=True, blank=True)  # Lưu QR code
+    qr_pending = models.BooleanField(default=False)  # QR đang được tạo/upload ở nền
 
     created_at = models.DateTimeField(auto_now_add=True)
     is_paid = models.BooleanField(default=False)
@@ -202,11 +254,15 @@ class Ticket(models.Model):
     check_in_date = models.DateTimeField(null=True, blank=True)
     payment=models.ForeignKey('Payment', on_delete=models.SET_NULL, null=True, blank=True,
                              related_name='tickets')
+    # Hạn giữ chỗ của vé chưa thanh toán, None khi vé đã thanh toán hoặc không giữ chỗ
+    hold_expires_at = models.DateTimeField(null=True, blank=True)
 
     class Meta:
         indexes = [
             models.Index(fields=['user', 'event']),
             models.Index(fields=['qr_code']),
+            models.Index(fields=['is_paid', 'hold_expires_at']),
+            models.Index(fields=['user', 'created_at']),
         ]
         ordering = ['-purchase_date']
 
@@ -214,11 +270,19 @@ class Ticket(models.Model):
         return f"Vé của {self.user} - Sự kiện {self.event.title}"
 
     def save(self, *args, **kwargs):
+        from .reservations import reserve_seats, apply_paid_change, hold_deadline
         with transaction.atomic():
-            if not self.pk:  # Chỉ kiểm tra khi tạo mới
-                # Giả sử event có thuộc tính sold_tickets (tự tính hoặc trường riêng cập nhật)
-                if self.event.sold_tickets >= self.event.total_tickets:
-                    raise ValidationError("Hết vé cho sự kiện này.")
+            if not self.pk:  # Chỉ giữ chỗ khi tạo mới
+                # Một câu UPDATE có điều kiện trên Event, raise ValidationError khi hết vé
+                reserve_seats(self.event_id, paid=self.is_paid)
+                self.hold_expires_at = None if self.is_paid else hold_deadline()
+                self._paid_delta = 1 if self.is_paid else 0
+            elif kwargs.get('update_fields') is None or 'is_paid' in kwargs['update_fields']:
+                self._paid_delta = apply_paid_change(self)
+                if kwargs.get('update_fields') is not None:
+                    kwargs['update_fields'] = {*kwargs['update_fields'], 'hold_expires_at'}
+            else:
+                self._paid_delta = 0
             super().save(*args, **kwargs)
 
     def mark_as_paid(self, paid_at):
@@ -273,10 +337,9 @@ class Payment(models.Model):
                     self.paid_at = timezone.now()
                 super().save(*args, **kwargs)
 
-            # Mark tickets as paid
-            for ticket in Ticket.objects.filter(payment=self):
-                if not ticket.is_paid:
-                    ticket.mark_as_paid(self.paid_at)
+            # Mark tickets as paid (một lần cập nhật cho cả nhóm vé)
+            from .reservations import mark_tickets_paid
+            mark_tickets_paid(Ticket.objects.filter(payment=self), self.paid_at)
 
 
 
@@ -359,6 +422,8 @@ class Notification(models.Model):
     notification_type = models.CharField(max_length=20, choices=NOTIFICATION_TYPES, default='reminder')
     title = models.CharField(max_length=255)
     message = models.TextField()
+    # Khóa chống trùng của thông báo nhắc lịch tự động: "<số ngày>d@<ngày diễn ra>", xem bem/reminders.py
+    reminder_key = models.CharField(max_length=32, null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
     def __str__(self):
@@ -366,6 +431,9 @@ class Notification(models.Model):
     
     class Meta:
         ordering = ['-created_at']
+        constraints = [
+            models.UniqueConstraint(fields=['event', 'reminder_key'], name='unique_event_reminder'),
+        ]
 
 # Chưa có cơ chế gửi thông báo real-time (cần tích hợp WebSocket hoặc Django Channels).
 # Để đánh dấu thông báo  đã được người dùng đọc hay chưa
@@ -378,6 +446,9 @@ class UserNotification(models.Model):
 
     class Meta:
         unique_together = ('user', 'notification')  # Mỗi user - notification chỉ 1 bản ghi
+        indexes = [
+            models.Index(fields=['user', 'created_at']),
+        ]
 
 
 
@@ -388,7 +459,8 @@ class ChatMessage(models.Model):
     sender = models.ForeignKey(User, on_delete=models.CASCADE, related_name='sent_messages')
     receiver = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='received_messages')
     message = models.TextField()
-    created_at = models.DateTimeField(auto_now_add=True)
+    # default thay cho auto_now_add: tin nhắn ghi theo lô (bem/chat_buffer.py) giữ thời điểm gửi, không phải lúc ghi
+    created_at = models.DateTimeField(default=timezone.now, editable=False)
     is_from_organizer = models.BooleanField(default=False)
 
     class Meta:
@@ -409,6 +481,8 @@ class EventTrendingLog(models.Model):
     trending_score = models.DecimalField(max_digits=10, decimal_places=4, default=0)
     interest_score = models.DecimalField(max_digits=10, decimal_places=4, default=0)
     last_updated = models.DateTimeField(auto_now=True)
+    # Có thay đổi (vé, lượt xem, review) chưa được tính vào điểm, xem bem/trending.py
+    needs_rescore = models.BooleanField(default=False, db_index=True)
 
     def calculate_score(self):
         today = date.today()
@@ -446,6 +520,7 @@ class EventTrendingLog(models.Model):
     class Meta:
         indexes = [
             models.Index(fields=['event', 'last_updated']),
+            models.Index(fields=['trending_score', 'event']),
         ]
         ordering = ['-trending_score']
 
@@ -459,3 +534,60 @@ class DeviceToken(models.Model):
             models.Index(fields=['user', 'token']),
         ]
         unique_together = ('user', 'token')
+
+
+# Job nền thất bại sau khi đã thử lại hết số lần (dead letter), xem bem/tasks.py
+class FailedTask(models.Model):
+    name = models.CharField(max_length=255, db_index=True)
+    args = models.JSONField(default=list)
+    kwargs = models.JSONField(default=dict)
+    error = models.TextField(blank=True)
+    attempts = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"{self.name} ({self.created_at})"
+
+
+# Hàng đợi email (outbox), được gửi theo lô qua một kết nối SMTP, xem bem/mailer.py
+class OutboxEmail(models.Model):
+    STATUS_CHOICES = (
+        ('pending', 'Pending'),
+        ('sending', 'Sending'),
+        ('sent', 'Sent'),
+        ('failed', 'Failed'),
+    )
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    from_email = models.CharField(max_length=255, blank=True)
+    to = models.JSONField(default=list)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveIntegerField(default=0)
+    error = models.TextField(blank=True)
+    claimed_at = models.DateTimeField(null=True, blank=True)
+    # Gửi lỗi: chưa nhận lại trước thời điểm này (backoff, xem bem/mailer.py)
+    next_attempt_at = models.DateTimeField(null=True, blank=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'created_at']),
+        ]
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"{self.subject} -> {', '.join(self.to)} ({self.status})"
+
+
+# Gợi ý sự kiện đã tính sẵn cho từng user (danh sách id theo thứ tự), xem bem/suggestions.py
+class SuggestionIndex(models.Model):
+    user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='suggestion_index', primary_key=True)
+    event_ids = models.JSONField(default=list)
+    built_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Suggestions for {self.user_id} ({len(self.event_ids)})"
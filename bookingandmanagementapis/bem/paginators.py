@@ -1,8 +1,100 @@
-from rest_framework.pagination import PageNumberPagination
+import json
+
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import Cursor, CursorPagination, PageNumberPagination, _reverse_ordering
 
 class ItemPaginator(PageNumberPagination):
     page_size = 8  # Mặc định 10 mục mỗi trang
     page_size_query_param = 'page_size'
     max_page_size = 100  # Kích thước trang tối đa có thể yêu cầu từ client
     page_query_param = 'page'  # Tên tham số truy vấn cho trang
-    last_page_strings = ['last']  # Tên chuỗi cho trang cuối cùng
\ No newline at end of file
+    last_page_strings = ['last']  # Tên chuỗi cho trang cuối cùng
+
+class CursorItemPaginator(CursorPagination):
+    """
+    Phân trang keyset (?cursor=...) theo tất cả các cột của `ordering`, mặc định (created_at, id).
+    Con trỏ mã hóa giá trị của dòng ở biên trang; trang sau là WHERE (created_at, id) < (...) trên index,
+    không COUNT(*) và không OFFSET, nên trang sâu tốn như trang đầu và không lặp/sót khi có dòng mới.
+    """
+    page_size = 8
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    ordering = ('-created_at', '-id')
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+        self.cursor = self.decode_cursor(request)
+        reverse = bool(self.cursor and self.cursor.reverse)
+        position = self._decode_position(self.cursor.position) if self.cursor else None
+
+        ordering = _reverse_ordering(self.ordering) if reverse else self.ordering
+        queryset = queryset.order_by(*ordering)
+        if position is not None:
+            queryset = queryset.filter(self._after(ordering, position))
+
+        # Lấy dư một dòng để biết còn trang tiếp theo (theo chiều đang đọc) hay không
+        results = list(queryset[:self.page_size + 1])
+        self.page = results[:self.page_size]
+        has_more = len(results) > self.page_size
+        if reverse:
+            self.page.reverse()
+            self.has_next, self.has_previous = True, has_more
+        else:
+            self.has_next, self.has_previous = has_more, position is not None
+
+        self.next_position = self._get_position_from_instance(self.page[-1], self.ordering) if self.page else None
+        self.previous_position = self._get_position_from_instance(self.page[0], self.ordering) if self.page else None
+        if (self.has_previous or self.has_next) and self.template is not None:
+            self.display_page_controls = True
+        return self.page
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        return self.encode_cursor(Cursor(offset=0, reverse=False, position=self.next_position))
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        return self.encode_cursor(Cursor(offset=0, reverse=True, position=self.previous_position))
+
+    def _get_position_from_instance(self, instance, ordering):
+        values = []
+        for field in ordering:
+            name = field.lstrip('-')
+            values.append(str(instance[name] if isinstance(instance, dict) else getattr(instance, name)))
+        return json.dumps(values)
+
+    def _decode_position(self, position):
+        if position is None:
+            return None
+        try:
+            values = json.loads(position)
+        except ValueError:
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(values, list) or len(values) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+        return values
+
+    @staticmethod
+    def _after(ordering, values):
+        # (a, b, c) đứng sau (x, y, z): a > x OR (a = x AND b > y) OR (a = x AND b = y AND c > z)
+        condition = Q()
+        for i, field in enumerate(ordering):
+            name = field.lstrip('-')
+            step = Q(**{f"{name}__{'lt' if field.startswith('-') else 'gt'}": values[i]})
+            for prev_field, prev_value in zip(ordering[:i], values[:i]):
+                step &= Q(**{prev_field.lstrip('-'): prev_value})
+            condition |= step
+        return condition
+
+
+class TrendingCursorPaginator(CursorItemPaginator):
+    ordering = ('-trending_score', '-event_id')
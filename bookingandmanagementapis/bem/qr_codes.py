@@ -0,0 +1,94 @@
+"""
+Mã QR của vé.
+
+QR chỉ mã hóa str(ticket.uuid) nên mặc định được render theo yêu cầu (ticket_qr_code view) và
+cache ở client (ETag + immutable) lẫn trong tiến trình (LRU). Khi bật TICKET_QR_UPLOAD, ảnh còn
+được upload lên Cloudinary ở nền: confirm_payment chỉ đánh dấu vé qr_pending rồi đẩy mỗi vé thành
+một job upload_ticket_qr (bem/tasks.py, thử lại khi lỗi); job idempotent theo UUID của vé.
+"""
+import io
+from functools import lru_cache
+
+import qrcode
+import qrcode.image.svg
+from cloudinary.uploader import upload
+from cloudinary.utils import cloudinary_url
+from django.conf import settings
+from django.db.models import Q
+from django.urls import reverse
+
+from .models import Ticket
+
+QR_FOLDER = 'ticket_qr_codes'
+QR_FORMATS = {'png': 'image/png', 'svg': 'image/svg+xml'}
+QR_RENDER_VERSION = 'v1'  # Tăng khi đổi cách render để client tải lại ảnh
+
+
+def _make_qr(data, image_factory=None):
+    qr = qrcode.QRCode(version=1, box_size=10, border=5, image_factory=image_factory)
+    qr.add_data(data)
+    qr.make(fit=True)
+    return qr
+
+
+def render_qr_png(data):
+    img = _make_qr(data).make_image(fill='black', back_color='white')
+    buffer = io.BytesIO()
+    img.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def render_qr_svg(data):
+    return _make_qr(data, image_factory=qrcode.image.svg.SvgPathImage).make_image().to_string()
+
+
+@lru_cache(maxsize=settings.QR_RENDER_CACHE_SIZE)
+def render_ticket_qr(ticket_uuid, fmt='png'):
+    """Ảnh QR (bytes) của vé, cache LRU theo (uuid, định dạng)."""
+    return render_qr_svg(ticket_uuid) if fmt == 'svg' else render_qr_png(ticket_uuid)
+
+
+def qr_etag(ticket_uuid, fmt):
+    return f'"{QR_RENDER_VERSION}-{ticket_uuid}-{fmt}"'
+
+
+def ticket_qr_url(ticket, request=None, fmt='png'):
+    """URL ảnh QR của vé: ảnh Cloudinary đã upload (nếu bật TICKET_QR_UPLOAD) hoặc endpoint render."""
+    if settings.TICKET_QR_UPLOAD and ticket.qr_code:
+        return cloudinary_url(str(ticket.qr_code))[0]
+    url = _qr_path_template(fmt).format(ticket.uuid)
+    return request.build_absolute_uri(url) if request else url
+
+
+@lru_cache(maxsize=None)
+def _qr_path_template(fmt):
+    # reverse() một lần cho mỗi định dạng thay vì mỗi dòng khi serialize danh sách vé
+    placeholder = '00000000-0000-0000-0000-000000000000'
+    return reverse('ticket-qr', kwargs={'ticket_uuid': placeholder, 'fmt': fmt}).replace(placeholder, '{}')
+
+
+def upload_ticket_qr(ticket_uuid):
+    """Render + upload QR cho một vé. Gọi lại nhiều lần với cùng UUID không tạo thêm ảnh."""
+    ticket_uuid = str(ticket_uuid)
+    if not Ticket.objects.filter(uuid=ticket_uuid, qr_pending=True).exists():
+        return None  # Đã có QR hoặc vé không còn tồn tại
+
+    # public_id cố định theo UUID: upload lặp lại ghi đè đúng ảnh cũ thay vì tạo ảnh mới
+    result = upload(render_qr_png(ticket_uuid), folder=QR_FOLDER, public_id=ticket_uuid, overwrite=True)
+    Ticket.objects.filter(uuid=ticket_uuid).update(qr_code=result['secure_url'], qr_pending=False)
+    return result['secure_url']
+
+
+def enqueue_qr_uploads(tickets):
+    """Đánh dấu qr_pending cho các vé chưa có QR và đẩy job upload sau khi transaction commit."""
+    from .tasks import upload_ticket_qr as upload_task
+    if not settings.TICKET_QR_UPLOAD:
+        return 0  # QR được render theo yêu cầu, không cần upload
+    missing = tickets.filter(Q(qr_code__isnull=True) | Q(qr_code=''))
+    uuids = [str(u) for u in missing.values_list('uuid', flat=True)]
+    if not uuids:
+        return 0
+    missing.update(qr_pending=True)
+    for ticket_uuid in uuids:
+        upload_task.delay(ticket_uuid)
+    return len(uuids)
@@ -0,0 +1,86 @@
+"""
+Nhắc lịch sự kiện sắp diễn ra (trước REMINDER_DAYS ngày).
+
+Mỗi lần chạy: một truy vấn lấy các sự kiện đến hạn, tạo Notification nhắc lịch bằng bulk_create
+(duy nhất theo event + reminder_key), rồi bulk_create UserNotification cho người có vé. Khóa chống
+trùng là (sự kiện, mốc nhắc, user): chạy lại nhiều lần hoặc nhiều tiến trình cùng chạy chỉ gửi
+mail/push cho những user chưa được nhắc. Việc gửi được đẩy sang job nền theo từng nhóm user.
+"""
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Event, Notification, Ticket, UserNotification
+
+REMINDER_TITLE = "Sự kiện sắp diễn ra"
+DELIVERY_CHUNK_SIZE = 500
+
+
+def reminder_key(days, start_date):
+    return f"{days}d@{start_date.isoformat()}"
+
+
+def send_due_reminders(now=None):
+    """Tạo và gửi nhắc lịch cho các sự kiện đến hạn. Trả về {'events': ..., 'recipients': ...}."""
+    from . import tasks
+    today = (now or timezone.now()).date()
+    windows = {today + timedelta(days=days): days for days in settings.REMINDER_DAYS}
+
+    due = list(
+        Event.objects.filter(is_active=True, start_time__date__in=list(windows))
+        .values_list('id', 'title', 'start_time')
+    )
+    if not due:
+        return {'events': 0, 'recipients': 0}
+
+    Notification.objects.bulk_create([
+        Notification(
+            event_id=event_id,
+            notification_type='reminder',
+            title=REMINDER_TITLE,
+            message=f"Sự kiện '{title}' sẽ diễn ra vào {start_time.date()}!",
+            reminder_key=reminder_key(windows[start_time.date()], start_time.date()),
+        )
+        for event_id, title, start_time in due
+    ], ignore_conflicts=True)
+
+    keys = {reminder_key(windows[start.date()], start.date()) for _, _, start in due}
+    event_ids = [event_id for event_id, _, _ in due]
+    recipients = 0
+    with transaction.atomic():
+        # Khóa các thông báo nhắc lịch: tiến trình chạy song song sẽ bỏ qua thay vì gửi trùng
+        notifications = {
+            n.event_id: n for n in Notification.objects.select_for_update(skip_locked=True)
+            .filter(event_id__in=event_ids, reminder_key__in=keys)
+        }
+        attendees = defaultdict(set)
+        for event_id, user_id in Ticket.objects.filter(
+            event_id__in=list(notifications), is_paid=True
+        ).values_list('event_id', 'user_id').distinct():
+            attendees[event_id].add(user_id)
+
+        already = set(UserNotification.objects.filter(
+            notification__in=list(notifications.values())
+        ).values_list('notification_id', 'user_id'))
+
+        pending = []  # (notification, [user_id, ...]) cần gửi
+        new_rows = []
+        for event_id, notification in notifications.items():
+            user_ids = sorted(u for u in attendees[event_id] if (notification.id, u) not in already)
+            if user_ids:
+                pending.append((notification, user_ids))
+                new_rows.extend(UserNotification(user_id=u, notification=notification) for u in user_ids)
+        UserNotification.objects.bulk_create(new_rows, batch_size=1000, ignore_conflicts=True)
+
+        for notification, user_ids in pending:
+            recipients += len(user_ids)
+            for i in range(0, len(user_ids), DELIVERY_CHUNK_SIZE):
+                chunk = user_ids[i:i + DELIVERY_CHUNK_SIZE]
+                data = {"event_id": notification.event_id, "notification_id": notification.id}
+                tasks.send_push.delay(chunk, notification.title, notification.message, data)
+                tasks.send_notification_emails.delay(notification.id, chunk)
+
+    return {'events': len(notifications), 'recipients': recipients}
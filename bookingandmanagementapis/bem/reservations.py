@@ -0,0 +1,154 @@
+"""
+Giữ chỗ vé cho sự kiện.
+
+Tồn kho của mỗi sự kiện nằm ngay trên dòng Event (sold_tickets + reserved_tickets <= total_tickets)
+và chỉ được thay đổi bằng các câu UPDATE có điều kiện, nên nhiều request đồng thời không thể bán
+quá số vé. Vé chưa thanh toán giữ chỗ trong TICKET_HOLD_MINUTES phút; hết hạn thì chỗ được trả lại.
+"""
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Event, Ticket
+from . import suggestions, trending
+from .rosters import invalidate_participants
+
+
+def hold_deadline(now=None):
+    return (now or timezone.now()) + timedelta(minutes=settings.TICKET_HOLD_MINUTES)
+
+
+def reserve_seats(event_id, quantity=1, paid=False):
+    """Giữ `quantity` chỗ bằng một câu UPDATE, raise ValidationError nếu không đủ vé."""
+    if Event.objects.reserve(event_id, quantity, paid=paid):
+        if paid:
+            invalidate_participants(event_id)
+        return
+    # Hết chỗ: thu hồi các giữ chỗ đã hết hạn của sự kiện rồi thử lại một lần
+    if release_expired_holds(event_id=event_id) and Event.objects.reserve(event_id, quantity, paid=paid):
+        if paid:
+            invalidate_participants(event_id)
+        return
+    raise ValidationError("Hết vé cho sự kiện này.")
+
+
+def hold_tickets(event, user, quantity):
+    """Đặt `quantity` vé cho một user: một lần trừ tồn kho, một câu bulk INSERT."""
+    with transaction.atomic():
+        reserve_seats(event.pk, quantity)
+        deadline = hold_deadline()
+        tickets = Ticket.objects.bulk_create([
+            Ticket(event=event, user=user, hold_expires_at=deadline)
+            for _ in range(quantity)
+        ])
+        # bulk_create không gửi post_save
+        suggestions.refresh_later(user.pk)
+    return tickets
+
+
+def mark_tickets_paid(tickets, paid_at):
+    """
+    Đánh dấu đã thanh toán cho nhóm vé, cập nhật tồn kho và trending một lần cho mỗi sự kiện.
+    Vé không giữ chỗ phải giành chỗ như vé mới; raise ValidationError (rollback cả nhóm) nếu hết vé.
+    """
+    with transaction.atomic():
+        rows = list(
+            tickets.filter(is_paid=False).select_for_update().values_list('pk', 'event_id', 'hold_expires_at')
+        )
+        if not rows:
+            return 0
+        Ticket.objects.filter(pk__in=[pk for pk, _, _ in rows]).update(
+            is_paid=True, purchase_date=paid_at, hold_expires_at=None
+        )
+        counts = defaultdict(lambda: [0, 0])  # event_id -> [vé đang giữ chỗ, vé không giữ chỗ]
+        for _, event_id, hold in rows:
+            counts[event_id][0 if hold is not None else 1] += 1
+        for event_id, (held, unheld) in counts.items():
+            if held:
+                Event.objects.confirm_reserved(event_id, held)
+            if unheld:
+                reserve_seats(event_id, unheld, paid=True)
+            trending.record(event_id, sales=held + unheld)
+        invalidate_participants(*counts)
+    return len(rows)
+
+
+def apply_paid_change(ticket):
+    """
+    Cập nhật bộ đếm của sự kiện khi trạng thái is_paid của vé thay đổi.
+    Trả về +1 (vừa thanh toán), -1 (hủy thanh toán) hoặc 0.
+    """
+    previous = Ticket.objects.select_for_update().filter(pk=ticket.pk).values('is_paid', 'hold_expires_at').first()
+    if previous is None or previous['is_paid'] == ticket.is_paid:
+        return 0
+    invalidate_participants(ticket.event_id)
+    if ticket.is_paid:
+        if previous['hold_expires_at'] is not None:
+            Event.objects.confirm_reserved(ticket.event_id)
+        else:
+            # Vé cũ không giữ chỗ (tạo trước khi có cơ chế giữ chỗ hoặc đã bị thu hồi): giành chỗ như vé mới,
+            # raise ValidationError nếu hết vé
+            reserve_seats(ticket.event_id, paid=True)
+        ticket.hold_expires_at = None
+        return 1
+    Event.objects.adjust_sold(ticket.event_id, -1)
+    return -1
+
+
+def release_ticket(ticket):
+    """Trả lại chỗ của một vé vừa bị xóa."""
+    if ticket.is_paid:
+        Event.objects.adjust_sold(ticket.event_id, -1)
+        invalidate_participants(ticket.event_id)
+    elif ticket.hold_expires_at is not None:
+        Event.objects.release_reserved(ticket.event_id)
+
+
+def release_expired_holds(event_id=None, now=None):
+    """Xóa các vé chưa thanh toán đã hết hạn giữ chỗ và trả chỗ về cho sự kiện. Trả về số chỗ được trả."""
+    now = now or timezone.now()
+    expired = Ticket.objects.filter(is_paid=False, hold_expires_at__lt=now)
+    if event_id is not None:
+        expired = expired.filter(event_id=event_id)
+    by_event = defaultdict(list)
+    for pk, ev_id in expired.values_list('pk', 'event_id'):
+        by_event[ev_id].append(pk)
+
+    released = 0
+    with transaction.atomic():
+        for ev_id, pks in by_event.items():
+            # Giành quyền thu hồi bằng UPDATE có điều kiện: vé vừa được thanh toán
+            # hoặc đã bị tiến trình khác thu hồi sẽ không khớp điều kiện nữa
+            claimed = Ticket.objects.filter(
+                pk__in=pks, is_paid=False, hold_expires_at__lt=now
+            ).update(hold_expires_at=None)
+            if claimed:
+                Event.objects.release_reserved(ev_id, claimed)
+                released += claimed
+            Ticket.objects.filter(pk__in=pks, is_paid=False, hold_expires_at__isnull=True).delete()
+    return released
+
+
+def extend_holds(tickets, now=None):
+    """Gia hạn giữ chỗ cho các vé (queryset) đang chờ thanh toán."""
+    return tickets.filter(is_paid=False, hold_expires_at__isnull=False).update(hold_expires_at=hold_deadline(now))
+
+
+def resync_inventory(event_ids=None):
+    """Tính lại sold_tickets/reserved_tickets từ bảng Ticket (dùng khi dữ liệu bị lệch)."""
+    from django.db.models import Count, Q
+    events = Event.objects.all()
+    if event_ids is not None:
+        events = events.filter(pk__in=event_ids)
+    counts = events.annotate(
+        paid=Count('tickets', filter=Q(tickets__is_paid=True)),
+        held=Count('tickets', filter=Q(tickets__is_paid=False, tickets__hold_expires_at__isnull=False)),
+    ).values_list('pk', 'paid', 'held')
+    updated = 0
+    for pk, paid, held in counts:
+        updated += Event.objects.filter(pk=pk).update(sold_tickets=paid, reserved_tickets=held)
+    return updated
@@ -0,0 +1,105 @@
+"""
+Cache response của các endpoint catalog công khai (danh sách sự kiện cho khách, hot, categories, tags).
+
+@cached_response(...) đặt trên action của ViewSet lưu response.data vào cache với khóa gồm namespace,
+version của các scope mà response phụ thuộc, vai trò người dùng, path và query params. Thay vì tìm và
+xóa từng khóa (locmem không liệt kê được, Redis thì tốn kém), bem/signals.py tăng version của đúng các
+scope bị ảnh hưởng: sự kiện category 'music' được lưu -> 'events:all', 'events:category:music', 'events:hot';
+các trang lọc theo category khác và danh sách tag vẫn còn trong cache. Scope 'events' bỏ mọi response sự kiện. Khóa cũ tự hết hạn theo timeout.
+
+Response có ETag (hash nội dung) và Last-Modified (lúc tạo cache); ConditionalGetMiddleware trả 304
+khi If-None-Match / If-Modified-Since của client còn khớp.
+"""
+import hashlib
+import json
+import time
+from functools import wraps
+
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.cache import patch_vary_headers
+from django.utils.http import http_date
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+
+
+def _version_key(scope):
+    return f'bem:resp-version:{scope}'
+
+
+def _versions(scopes):
+    keys = [_version_key(scope) for scope in scopes]
+    found = cache.get_many(keys)
+    missing = [key for key in keys if key not in found]
+    if missing:
+        # add() không ghi đè version do tiến trình khác vừa tạo
+        for key in missing:
+            cache.add(key, time.time_ns(), None)
+        found.update(cache.get_many(missing))
+    return [found.get(key) for key in keys]
+
+
+def invalidate(*scopes):
+    """Bỏ mọi response đã cache phụ thuộc vào các scope (sau khi transaction hiện tại commit)."""
+    if scopes:
+        transaction.on_commit(lambda: cache.set_many({_version_key(scope): time.time_ns() for scope in scopes}, None))
+
+
+def _role(request):
+    user = request.user
+    return user.role if user.is_authenticated else 'anonymous'
+
+
+def _response_key(namespace, request, scopes, vary_on_role):
+    raw = json.dumps([
+        request.path,
+        sorted(request.query_params.lists()),
+        _role(request) if vary_on_role else '',
+        _versions(scopes),
+    ])
+    return f'bem:resp:{namespace}:{hashlib.md5(raw.encode()).hexdigest()}'
+
+
+def cached_response(namespace, timeout, scopes=None, anonymous_only=False, vary_on_role=True):
+    """
+    Cache response 200 của một action GET trong `timeout` giây.
+    scopes: danh sách scope hoặc hàm(request) -> danh sách scope (mặc định [namespace]).
+    anonymous_only: chỉ cache cho khách, khi nội dung phụ thuộc vào chính user đăng nhập.
+    """
+    def decorator(view_method):
+        @wraps(view_method)
+        def wrapper(self, request, *args, **kwargs):
+            if request.method != 'GET' or (anonymous_only and request.user.is_authenticated):
+                return view_method(self, request, *args, **kwargs)
+            request_scopes = scopes(request) if callable(scopes) else (scopes or [namespace])
+            key = _response_key(namespace, request, request_scopes, vary_on_role)
+            entry = cache.get(key)
+            if entry is None:
+                response = view_method(self, request, *args, **kwargs)
+                if response.status_code != 200:
+                    return response
+                body = JSONRenderer().render(response.data)
+                entry = {
+                    'data': response.data,
+                    'etag': f'"{hashlib.md5(body).hexdigest()}"',
+                    'last_modified': time.time(),
+                }
+                cache.set(key, entry, timeout)
+            response = Response(entry['data'], headers={
+                'ETag': entry['etag'],
+                'Last-Modified': http_date(entry['last_modified']),
+            })
+            patch_vary_headers(response, ['Authorization'])
+            return response
+        return wrapper
+    return decorator
+
+
+def event_list_scopes(request):
+    category = request.query_params.get('category')
+    return ['events', f'events:category:{category}' if category else 'events:all']
+
+
+def invalidate_event(*categories):
+    """Một sự kiện (thuộc các category này, cũ và mới) được tạo/sửa/xóa."""
+    invalidate('events:all', 'events:hot', *{f'events:category:{c}' for c in categories if c})
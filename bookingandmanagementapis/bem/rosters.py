@@ -0,0 +1,84 @@
+"""
+Danh sách người tham gia (user có vé đã thanh toán) của một sự kiện, dùng cho chat.
+
+Roster được cache theo sự kiện trong CHAT_ROSTER_CACHE_SECONDS và bị xóa khi có vé được
+thanh toán / hủy thanh toán / xóa (xem bem/reservations.py).
+
+ChatConsumer giữ quyền truy cập của kết nối trong bộ nhớ; các thay đổi được đẩy qua channel layer
+(sau khi transaction commit) để consumer kiểm tra lại ở tin nhắn kế tiếp:
+- chat.access_changed tới phòng chat_<event_id> khi roster thay đổi,
+- chat.event_changed tới phòng khi sự kiện được sửa/xóa,
+- chat.auth_changed tới user_<user_id> khi access token của user bị thu hồi,
+- chat.history_changed tới phòng khi tin nhắn được tạo/sửa/xóa ngoài WebSocket (bem/chat_history.py),
+- chat.message_dropped tới phòng khi tin nhắn đã broadcast không ghi được xuống DB (bem/chat_buffer.py).
+"""
+import logging
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import User
+
+logger = logging.getLogger(__name__)
+
+
+def _key(event_id):
+    return f'bem:roster:{event_id}'
+
+
+def event_participants(event_id):
+    """[{'id', 'username'}, ...] của các user có vé đã thanh toán cho sự kiện."""
+    key = _key(event_id)
+    roster = cache.get(key)
+    if roster is None:
+        roster = list(
+            User.objects.filter(tickets__event_id=event_id, tickets__is_paid=True)
+            .distinct().order_by('id').values('id', 'username')
+        )
+        cache.set(key, roster, settings.CHAT_ROSTER_CACHE_SECONDS)
+    return roster
+
+
+def invalidate_participants(*event_ids):
+    """Xóa roster đã cache của các sự kiện (sau khi transaction hiện tại commit)."""
+    keys = [_key(event_id) for event_id in event_ids]
+    if keys:
+        transaction.on_commit(lambda: cache.delete_many(keys))
+        _notify_later([f'chat_{event_id}' for event_id in event_ids], 'chat.access_changed')
+
+
+def invalidate_event_context(*event_ids):
+    """Sự kiện đổi thời gian/organizer hoặc bị xóa: các kết nối chat của sự kiện tải lại thông tin sự kiện."""
+    _notify_later([f'chat_{event_id}' for event_id in event_ids], 'chat.event_changed')
+
+
+def invalidate_user_auth(user_id):
+    """Token của user bị thu hồi: các kết nối chat của user xác thực lại token."""
+    _notify_later([f'user_{user_id}'], 'chat.auth_changed')
+
+
+def invalidate_chat_history(event_id):
+    """Tin nhắn của sự kiện thay đổi ngoài WebSocket: các tiến trình đọc lại lịch sử chat của phòng."""
+    _notify_later([f'chat_{event_id}'], 'chat.history_changed')
+
+
+def retract_chat_messages(event_id, message_ids):
+    """Tin nhắn đã broadcast nhưng bị bỏ khi ghi theo lô: client gỡ tin nhắn, các tiến trình đọc lại lịch sử."""
+    _notify_later([f'chat_{event_id}'], 'chat.message_dropped', {'ids': list(message_ids)})
+
+
+def _notify_later(groups, message_type, payload=None):
+    def notify():
+        layer = get_channel_layer()
+        if layer is None:
+            return
+        for group in groups:
+            try:
+                async_to_sync(layer.group_send)(group, {'type': message_type, **(payload or {})})
+            except Exception as e:
+                logger.warning(f"Could not send {message_type} to {group}: {e}")
+    if groups:
+        transaction.on_commit(notify)
@@ -0,0 +1,79 @@
+"""
+Bộ lập lịch trong tiến trình cho các job @periodic của bem/tasks.py.
+
+Bật mặc định (SCHEDULER_ENABLED); được khởi động từ BemConfig.ready() trong tiến trình phục vụ request
+(gunicorn/uvicorn/daphne, runserver), không chạy trong các management command khác và với backend 'eager'. Với nhiều worker gunicorn trên cùng
+một máy, chỉ tiến trình giữ được khóa file SCHEDULER_LOCK_FILE chạy lịch; các job tự chống trùng
+nên việc chạy lặp (nhiều máy, chạy tay bằng management command) vẫn an toàn.
+"""
+import logging
+import os
+import sys
+import threading
+import time
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+TICK_SECONDS = 1
+
+_started = False
+_lock_file = None
+
+
+def _acquire_process_lock():
+    global _lock_file
+    try:
+        import fcntl
+    except ImportError:  # Windows: không có flock, mỗi tiến trình tự chạy lịch
+        return True
+    f = open(settings.SCHEDULER_LOCK_FILE, 'a')
+    try:
+        fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        f.close()
+        return False
+    _lock_file = f  # giữ file mở suốt đời tiến trình để giữ khóa
+    return True
+
+
+def _loop():
+    from .tasks import periodic_registry
+    next_run = {name: time.monotonic() for name in periodic_registry}
+    while True:
+        now = time.monotonic()
+        for name, (interval, task) in periodic_registry.items():
+            if now >= next_run[name]:
+                next_run[name] = now + interval
+                try:
+                    task.delay()
+                except Exception as e:
+                    logger.error(f"Scheduler could not enqueue {name}: {e}")
+        time.sleep(TICK_SECONDS)
+
+
+def should_start(argv=None):
+    """True nếu tiến trình hiện tại nên chạy lịch."""
+    if not settings.SCHEDULER_ENABLED or settings.TASK_BACKEND == 'eager':
+        return False
+    argv = sys.argv if argv is None else argv
+    if argv and os.path.basename(argv[0]) == 'manage.py':
+        if len(argv) < 2 or argv[1] != 'runserver':
+            return False
+        # Tiến trình cha của autoreloader chỉ theo dõi file; lịch chạy trong tiến trình con
+        return os.environ.get('RUN_MAIN') == 'true' or '--noreload' in argv
+    return True
+
+
+def start():
+    """Khởi động thread lập lịch (một lần mỗi tiến trình). Trả về True nếu tiến trình này chạy lịch."""
+    global _started
+    if _started:
+        return True
+    if not _acquire_process_lock():
+        return False
+    _started = True
+    threading.Thread(target=_loop, name='bem-scheduler', daemon=True).start()
+    logger.info("Periodic scheduler started")
+    return True
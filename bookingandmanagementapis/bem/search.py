@@ -0,0 +1,127 @@
+"""
+Tìm kiếm sự kiện (?q= ở events/, events/autocomplete/) bằng chỉ mục full-text thay vì icontains.
+
+Văn bản được chuẩn hóa trong Python (chữ thường, bỏ dấu tiếng Việt, đ -> d) cả khi ghi chỉ mục lẫn khi
+tìm, nên "hoi thao" khớp "Hội thảo" trên mọi backend mà không cần extension unaccent. Mỗi từ của truy vấn
+khớp theo tiền tố ("hoi th" vẫn ra "Hội thảo") và mọi từ đều phải khớp.
+- PostgreSQL: cột Event.search_vector (tsvector, config 'simple') có chỉ mục GIN; trọng số title A,
+  location/category B, description C; xếp hạng bằng ts_rank.
+- SQLite (dev/test): bảng ảo FTS5 bem_event_fts (rowid = id sự kiện), xếp hạng bằng bm25.
+Chỉ mục được cập nhật trong cùng transaction khi Event được lưu/xóa (bem/signals.py);
+lệnh rebuild_search_index dựng lại toàn bộ.
+"""
+import re
+import unicodedata
+
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db import connection
+from django.db.models import BooleanField, F, FloatField, Q
+from django.db.models.expressions import RawSQL
+
+from .models import Event
+
+FTS_TABLE = 'bem_event_fts'
+TEXT_FIELDS = ('title', 'location', 'category', 'description')
+# Trọng số bm25 theo thứ tự cột của FTS_TABLE (= TEXT_FIELDS)
+FTS_WEIGHTS = (10.0, 4.0, 4.0, 1.0)
+MAX_TERMS = 8
+BATCH_SIZE = 500
+
+CATEGORY_LABELS = dict(Event.CATEGORY_CHOICES)
+_TERM_RE = re.compile(r'\w+')
+
+
+def normalize(text):
+    """Chữ thường, bỏ dấu: 'Hội thảo Đà Nẵng' -> 'hoi thao da nang'."""
+    text = (text or '').lower().replace('đ', 'd')
+    return ''.join(c for c in unicodedata.normalize('NFD', text) if not unicodedata.combining(c))
+
+
+def terms(q):
+    return _TERM_RE.findall(normalize(q))[:MAX_TERMS]
+
+
+def _document(row):
+    category = row['category'] or ''
+    return (
+        normalize(row['title']),
+        normalize(row['location']),
+        normalize(f"{category} {CATEGORY_LABELS.get(category, '')}"),
+        normalize(row['description']),
+    )
+
+
+def index_rows(rows, conn=connection):
+    """Ghi chỉ mục cho các dict {'id', *TEXT_FIELDS}; dùng cả trong migration với connection của nó."""
+    docs = [(row['id'], *_document(row)) for row in rows]
+    if not docs:
+        return
+    with conn.cursor() as cursor:
+        if conn.vendor == 'postgresql':
+            cursor.executemany(
+                f"UPDATE {Event._meta.db_table} SET search_vector = "
+                "setweight(to_tsvector('simple', %s), 'A') || setweight(to_tsvector('simple', %s), 'B') || "
+                "setweight(to_tsvector('simple', %s), 'B') || setweight(to_tsvector('simple', %s), 'C') "
+                "WHERE id = %s",
+                [(*doc[1:], doc[0]) for doc in docs]
+            )
+        elif conn.vendor == 'sqlite':
+            cursor.executemany(f"DELETE FROM {FTS_TABLE} WHERE rowid = %s", [(doc[0],) for doc in docs])
+            cursor.executemany(
+                f"INSERT INTO {FTS_TABLE}(rowid, {', '.join(TEXT_FIELDS)}) VALUES (%s, %s, %s, %s, %s)", docs
+            )
+
+
+def index_event(event):
+    index_rows([{'id': event.pk, **{f: getattr(event, f) for f in TEXT_FIELDS}}])
+
+
+def remove_event(event_id):
+    # PostgreSQL: search_vector nằm trên chính dòng bem_event nên không cần xóa gì thêm
+    if connection.vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {FTS_TABLE} WHERE rowid = %s", [event_id])
+
+
+def rebuild(batch_size=BATCH_SIZE):
+    """Dựng lại chỉ mục của mọi sự kiện theo lô. Trả về số sự kiện."""
+    if connection.vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {FTS_TABLE}")
+    count, last_id = 0, 0
+    while True:
+        rows = list(Event.objects.filter(pk__gt=last_id).order_by('pk').values('id', *TEXT_FIELDS)[:batch_size])
+        if not rows:
+            return count
+        index_rows(rows)
+        count += len(rows)
+        last_id = rows[-1]['id']
+
+
+def search(queryset, q):
+    """Lọc queryset sự kiện theo q, thêm search_rank và xếp theo độ liên quan rồi start_time."""
+    words = terms(q)
+    if not words:
+        return queryset.none()
+    if connection.vendor == 'postgresql':
+        query = SearchQuery(' & '.join(f'{w}:*' for w in words), search_type='raw', config='simple')
+        queryset = queryset.filter(search_vector=query).annotate(search_rank=SearchRank(F('search_vector'), query))
+    elif connection.vendor == 'sqlite':
+        match = ' AND '.join(f'"{w}"*' for w in words)
+        table = Event._meta.db_table
+        weights = ', '.join(map(str, FTS_WEIGHTS))
+        queryset = queryset.filter(
+            RawSQL(f"{table}.id IN (SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s)", [match],
+                   output_field=BooleanField())
+        ).annotate(search_rank=RawSQL(
+            # bm25 càng âm càng liên quan
+            f"(SELECT -bm25({FTS_TABLE}, {weights}) FROM {FTS_TABLE} "
+            f"WHERE {FTS_TABLE} MATCH %s AND rowid = {table}.id)", [match], output_field=FloatField()
+        ))
+    else:
+        # Backend khác không có chỉ mục: quay về icontains theo từng từ
+        condition = Q()
+        for w in words:
+            condition &= Q(title__icontains=w) | Q(description__icontains=w) | Q(location__icontains=w) | Q(category__icontains=w)
+        return queryset.filter(condition).order_by('start_time', 'id')
+    return queryset.order_by('-search_rank', 'start_time', 'id')
@@ -9,7 +9,8 @@ from django.utils import timezone
 from django.db.models import F
 from django.db import models
 from decimal import Decimal
-from cloudinary.utils import cloudinary_url
+from .qr_codes import ticket_qr_url
+from .rosters import event_participants
 
 
 # Serializer cho Tag
@@ -69,15 +70,32 @@ class NotificationSerializer(serializers.ModelSerializer):
         read_only_fields = ['id', 'event_title', 'created_at']
 
     def get_is_read(self, obj):
+        # Danh sách lấy từ UserNotification đã gắn sẵn trạng thái đọc (xem notifications_with_read_state)
+        if hasattr(obj, 'user_is_read'):
+            return obj.user_is_read
         request = self.context.get('request')
         if not request or not request.user.is_authenticated:
             return False
-        # Sử dụng filter().first() để tránh truy vấn không cần thiết
-        user_notification = UserNotification.objects.filter(
-            user=request.user,
-            notification=obj
-        ).first()
-        return user_notification.is_read if user_notification else False
+        # Lấy trạng thái đọc của cả danh sách bằng một truy vấn, dùng chung qua context
+        read_state = self.context.get('read_state')
+        if read_state is None or obj.pk not in read_state:
+            notifications = self.parent.instance if isinstance(self.parent, serializers.ListSerializer) else [obj]
+            read_state = dict(UserNotification.objects.filter(
+                user=request.user, notification__in=[n.pk for n in notifications]
+            ).values_list('notification_id', 'is_read'))
+            for n in notifications:
+                read_state.setdefault(n.pk, False)
+            self.context['read_state'] = read_state
+        return read_state[obj.pk]
+
+
+def notifications_with_read_state(user_notifications):
+    """Chuyển các dòng UserNotification (đã select_related notification) thành Notification kèm is_read."""
+    notifications = []
+    for un in user_notifications:
+        un.notification.user_is_read = un.is_read
+        notifications.append(un.notification)
+    return notifications
 
 
 # Serializer cho ChatMessage
@@ -94,8 +112,11 @@ class ChatMessageSerializer(serializers.ModelSerializer):
         return {'username': obj.sender.username, 'id': obj.sender.id}
 
     def get_participants(self, obj):
-        tickets = Ticket.objects.filter(event=obj.event, is_paid=True)
-        return [{'id': t.user.id, 'username': t.user.username} for t in tickets]
+        # Roster chung cho mọi tin nhắn cùng sự kiện trong một lần serialize (context dùng chung với many=True)
+        rosters = self.context.setdefault('participants_by_event', {})
+        if obj.event_id not in rosters:
+            rosters[obj.event_id] = event_participants(obj.event_id)
+        return rosters[obj.event_id]
 
 
 # Serializer cho DiscountCode
@@ -168,23 +189,21 @@ class TicketSerializer(ModelSerializer):
 
     def to_representation(self, instance):
         data = super().to_representation(instance)
-        if instance.qr_code:
-            public_id = str(instance.qr_code)  # hoặc instance.qr_code.public_id nếu cần chính xác hơn
-            url, options = cloudinary_url(public_id)
-            data['qr_code'] = url
-        else:
-            data['qr_code'] = ''
+        # Vé đã thanh toán luôn có QR (render theo yêu cầu từ uuid), không cần ảnh lưu sẵn
+        data['qr_code'] = ticket_qr_url(instance, self.context.get('request')) if instance.is_paid else ''
         return data
 
     class Meta:
         model = Ticket
         fields = [
             'id', 'username', 'email', 'purchase_date', 'qr_code',
-            'event_title', 'event_start_time', 'event_location', 'event_id','is_paid','uuid','is_checked_in'
+            'event_title', 'event_start_time', 'event_location', 'event_id','is_paid','uuid','is_checked_in',
+            'qr_pending'
         ]
         read_only_fields = [
             'id', 'username', 'email', 'purchase_date', 'qr_code',
-            'event_title', 'event_start_time', 'event_location', 'event_id','is_paid','uuid','is_checked_in'
+            'event_title', 'event_start_time', 'event_location', 'event_id','is_paid','uuid','is_checked_in',
+            'qr_pending'
         ]
 
     def create(self, validated_data):
@@ -300,14 +319,61 @@ class UserDetailSerializer(ModelSerializer):
 
 # Serializer cho EventDetail
 class EventDetailSerializer(serializers.ModelSerializer):
+    """
+    Chi tiết sự kiện gọn: số lượng + vài mục đầu của reviews / thông báo / chat, đầy đủ thì gọi
+    events/{id}/reviews/, events/{id}/notifications/, events/{id}/chat-messages/ (phân trang con trỏ).
+    ?expand=reviews,event_notifications,chat_messages,discount_codes để lấy đầy đủ từng phần.
+    """
+    EXPANDABLE = ('reviews', 'event_notifications', 'chat_messages', 'discount_codes')
+    PREVIEW_SIZE = 3
+
     organizer = UserSerializer(read_only=True)
-    reviews = ReviewSerializer(many=True, read_only=True)
-    event_notifications = NotificationSerializer(many=True, read_only=True)
-    chat_messages = ChatMessageSerializer(many=True, read_only=True)
     tags = TagSerializer(many=True, read_only=True)
+    review_count = serializers.SerializerMethodField()
+    notification_count = serializers.SerializerMethodField()
+    chat_message_count = serializers.SerializerMethodField()
+    reviews = serializers.SerializerMethodField()
+    event_notifications = serializers.SerializerMethodField()
+    chat_messages = serializers.SerializerMethodField()
     discount_codes = serializers.SerializerMethodField()
 
+    def _expanded(self, section):
+        request = self.context.get('request')
+        if request is None:
+            return False
+        expand = request.query_params.get('expand', '')
+        return section in {part.strip() for part in expand.split(',')}
+
+    def _section(self, section, queryset, serializer_class):
+        if not self._expanded(section):
+            queryset = queryset[:self.PREVIEW_SIZE]
+        return serializer_class(queryset, many=True, context=self.context).data
+
+    def get_review_count(self, obj):
+        return obj.reviews.count()
+
+    def get_notification_count(self, obj):
+        return obj.event_notifications.count()
+
+    def get_chat_message_count(self, obj):
+        return obj.chat_messages.count()
+
+    def get_reviews(self, obj):
+        reviews = obj.reviews.select_related('user').order_by('-created_at', '-id')
+        return self._section('reviews', reviews, ReviewSerializer)
+
+    def get_event_notifications(self, obj):
+        notifications = obj.event_notifications.select_related('event').order_by('-created_at', '-id')
+        return self._section('event_notifications', notifications, NotificationSerializer)
+
+    def get_chat_messages(self, obj):
+        messages = obj.chat_messages.select_related('sender', 'receiver').order_by('-created_at', '-id')
+        return self._section('chat_messages', messages, ChatMessageSerializer)
+
     def get_discount_codes(self, obj):
+        # Danh sách mã giảm giá dùng chung cho mọi sự kiện: chỉ trả về khi ?expand=discount_codes
+        if not self._expanded('discount_codes'):
+            return []
         now = timezone.now()
         discount_codes = DiscountCode.objects.filter(
             is_active=True,
@@ -324,6 +390,8 @@ class EventDetailSerializer(serializers.ModelSerializer):
         data['poster'] = instance.poster.url if instance.poster else ''
         data['sold_tickets'] = instance.sold_tickets
         data['ticket_price'] = str(instance.ticket_price) if instance.ticket_price is not None else None
+        if not self._expanded('discount_codes'):
+            data.pop('discount_codes', None)
         return data
 
     def create(self, validated_data):
@@ -354,11 +422,12 @@ class EventDetailSerializer(serializers.ModelSerializer):
             'id', 'organizer', 'title', 'description', 'category', 'start_time',
             'end_time', 'is_active', 'location', 'latitude', 'longitude',
             'total_tickets', 'ticket_price', 'sold_tickets', 'tags', 'poster',
-            'created_at', 'updated_at', 'reviews', 'event_notifications',
-            'chat_messages', 'discount_codes'
+            'created_at', 'updated_at', 'review_count', 'notification_count', 'chat_message_count',
+            'reviews', 'event_notifications', 'chat_messages', 'discount_codes'
         ]
         read_only_fields = ['created_at', 'updated_at', 'sold_tickets', 'reviews',
-                            'event_notifications', 'chat_messages', 'organizer']
+                            'event_notifications', 'chat_messages', 'organizer',
+                            'review_count', 'notification_count', 'chat_message_count']
 
 
 # Serializer cho EventTrendingLog
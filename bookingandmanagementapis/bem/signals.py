@@ -1,12 +1,15 @@
 # events/signals.py
 
-from django.db.models.signals import post_migrate, pre_save, post_save, post_delete
+from django.db.models.signals import post_migrate, pre_save, post_save, post_delete, m2m_changed
 from django.dispatch import receiver
 from django.contrib.auth import get_user_model
-from .models import Tag, Event, Notification, Ticket, Review, ChatMessage, EventTrendingLog, Payment, DiscountCode, UserNotification
+from .models import Tag, Event, Notification, Ticket, Review, ChatMessage, EventTrendingLog, Payment, DiscountCode, UserNotification, User
 from django.db import transaction
 from django.db.models import F
 from django.utils import timezone
+from .reservations import release_ticket
+from oauth2_provider.models import AccessToken
+from . import authentication, middleware, response_cache, rosters, search, suggestions, trending
 
 
 # Tự động tạo thông báo khi sự kiện được cập nhật
@@ -101,6 +104,43 @@ def update_event_status(sender, instance, **kwargs):
         instance.is_active = False
 
 
+# Xóa response catalog đã cache (bem/response_cache.py) của đúng các trang chứa sự kiện
+@receiver(pre_save, sender=Event)
+def remember_event_category(sender, instance, update_fields=None, **kwargs):
+    if instance.pk and (update_fields is None or 'category' in update_fields):
+        instance._old_category = Event.objects.filter(pk=instance.pk).values_list('category', flat=True).first()
+
+
+@receiver([post_save, post_delete], sender=Event)
+def invalidate_event_responses(sender, instance, created=False, **kwargs):
+    response_cache.invalidate_event(instance.category, getattr(instance, '_old_category', None))
+    if not created:
+        # Kết nối chat đang mở tải lại thời gian kết thúc/organizer của sự kiện
+        rosters.invalidate_event_context(instance.pk)
+
+
+@receiver(m2m_changed, sender=Event.tags.through)
+def invalidate_event_responses_on_tags(sender, instance, action, reverse, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if reverse:
+        # tag.events.add(...): không biết category của từng sự kiện
+        response_cache.invalidate('events')
+    else:
+        response_cache.invalidate_event(instance.category)
+
+
+@receiver(post_save, sender=Tag)
+def invalidate_tag_responses(sender, instance, **kwargs):
+    response_cache.invalidate('tags')
+
+
+@receiver(post_delete, sender=Tag)
+def invalidate_responses_on_tag_delete(sender, instance, **kwargs):
+    # Xóa tag cũng bỏ tag khỏi mọi sự kiện (không có m2m_changed)
+    response_cache.invalidate('tags', 'events')
+
+
 # Signal để cập nhật is_active của DiscountCode trước khi lưu
 @receiver(pre_save, sender=DiscountCode)
 def update_discount_code_status(sender, instance, **kwargs):
@@ -108,60 +148,99 @@ def update_discount_code_status(sender, instance, **kwargs):
     instance.is_active = instance.is_valid()
 
 
-# Signal để cập nhật sold_tickets và EventTrendingLog khi Ticket được lưu
+# Signal để ghi nhận thay đổi trending khi Ticket được lưu (chỉ vào bộ đệm, xem bem/trending.py)
+# (sold_tickets/reserved_tickets đã được cập nhật nguyên tử trong Ticket.save, xem bem/reservations.py)
 @receiver(post_save, sender=Ticket)
 def update_sold_tickets_on_save(sender, instance, created, **kwargs):
-    with transaction.atomic():
-        event = instance.event
-        trending_log, _ = EventTrendingLog.objects.get_or_create(event=event)
-
-        if created and instance.is_paid:
-            # Nếu tạo mới và đã thanh toán
-            Event.objects.filter(pk=event.pk).update(
-                sold_tickets=F('sold_tickets') + 1
-            )
-            trending_log.total_revenue += event.ticket_price
-        elif not created:
-            # Nếu là cập nhật
-            old = Ticket.objects.get(pk=instance.pk)
-            if not old.is_paid and instance.is_paid:
-                # Từ chưa thanh toán sang thanh toán thành công
-                Event.objects.filter(pk=event.pk).update(
-                    sold_tickets=F('sold_tickets') + 1
-                )
-                trending_log.total_revenue += event.ticket_price
-            elif old.is_paid and not instance.is_paid:
-                # Từ thanh toán thành công sang chưa thanh toán
-                Event.objects.filter(pk=event.pk).update(
-                    sold_tickets=F('sold_tickets') - 1
-                )
-                trending_log.total_revenue -= event.ticket_price
-
-        # Lưu thay đổi cho trending_log và tính toán score
-        trending_log.save()
-        trending_log.calculate_score()
-
-
-# Signal để cập nhật sold_tickets và EventTrendingLog khi Ticket bị xóa
+    # +1: vé vừa được thanh toán, -1: vé bị hủy thanh toán
+    paid_delta = getattr(instance, '_paid_delta', 0)
+    if paid_delta:
+        trending.record(instance.event_id, sales=paid_delta)
+    # Category của vé mới có thể thay đổi gợi ý sự kiện cho user
+    if created:
+        suggestions.refresh_later(instance.user_id)
+
+
+# Signal để trả chỗ và cập nhật EventTrendingLog khi Ticket bị xóa
 @receiver(post_delete, sender=Ticket)
 def update_sold_tickets_on_delete(sender, instance, **kwargs):
     with transaction.atomic():
-        event = instance.event
-        # Đếm số vé đã thanh toán
-        sold_tickets = event.tickets.filter(is_paid=True).count()
-        event.sold_tickets = sold_tickets
-        event.save(update_fields=['sold_tickets'])
-
-        # Cập nhật EventTrendingLog
-        trending_log, _ = EventTrendingLog.objects.get_or_create(event=event)
+        release_ticket(instance)
+
+        # Cập nhật trending (bộ đệm)
         if instance.is_paid:
-            trending_log.total_revenue -= event.ticket_price
-            trending_log.save()
-            trending_log.calculate_score()
+            trending.record(instance.event_id, sales=-1)
+
+
+# Review mới / bị xóa thay đổi interest_score của sự kiện
+@receiver([post_save, post_delete], sender=Review)
+def mark_event_trending_on_review(sender, instance, **kwargs):
+    # post_delete không có tham số created
+    if kwargs.get('created', True):
+        trending.record(instance.event_id)
+
+
+# Cập nhật chỉ mục tìm kiếm trong cùng transaction với việc lưu/xóa sự kiện
+@receiver(post_save, sender=Event)
+def update_event_search_index(sender, instance, update_fields=None, **kwargs):
+    if update_fields and not set(search.TEXT_FIELDS).intersection(update_fields):
+        return
+    search.index_event(instance)
+
+
+@receiver(post_delete, sender=Event)
+def remove_event_search_index(sender, instance, **kwargs):
+    search.remove_event(instance.pk)
 
 
 # Signal để tự động tạo EventTrendingLog khi tạo Event mới
 @receiver(post_save, sender=Event)
 def create_event_trending_log(sender, instance, created, **kwargs):
     if created:
-        EventTrendingLog.objects.create(event=instance)
\ No newline at end of file
+        EventTrendingLog.objects.create(event=instance)
+
+# Dựng lại gợi ý sự kiện khi user đổi tag quan tâm
+@receiver(m2m_changed, sender=User.tags.through)
+def refresh_suggestions_on_tag_change(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        suggestions.refresh_later(instance.pk)
+    elif pk_set:
+        # tag.users.add(...): pk_set là id của các user
+        suggestions.refresh_later(*pk_set)
+
+
+# Tin nhắn tạo qua REST/job, sửa hoặc xóa trong admin: lịch sử chat đang giữ trong các tiến trình phải đọc lại.
+# Tin nhắn gửi qua ChatConsumer đã được broadcast tới phòng (_broadcast); xóa dây chuyền từ Event/User thì bỏ qua.
+@receiver(post_save, sender=ChatMessage)
+def invalidate_chat_history(sender, instance, **kwargs):
+    if not getattr(instance, '_broadcast', False):
+        rosters.invalidate_chat_history(instance.event_id)
+
+
+@receiver(post_delete, sender=ChatMessage)
+def invalidate_chat_history_on_delete(sender, instance, origin=None, **kwargs):
+    if isinstance(origin, ChatMessage) or getattr(origin, 'model', None) is ChatMessage:
+        rosters.invalidate_chat_history(instance.event_id)
+
+
+# Token bị thu hồi (revoke_token, refresh, đăng xuất xóa AccessToken) hoặc User thay đổi: xóa khỏi cache xác thực
+# của REST (bem/authentication.py) và WebSocket (bem/middleware.py)
+@receiver([post_save, post_delete], sender=AccessToken)
+def invalidate_cached_token(sender, instance, created=False, **kwargs):
+    authentication.invalidate_token(instance.token_checksum)
+    middleware.invalidate(instance.token_checksum)
+    if instance.user_id and not created:
+        rosters.invalidate_user_auth(instance.user_id)
+
+
+@receiver([post_save, post_delete], sender=User)
+def invalidate_cached_user(sender, instance, **kwargs):
+    authentication.invalidate_user(instance.pk)
+    if not instance.is_active:
+        # Tài khoản bị khóa: bỏ luôn các token đã cache (REST và WebSocket) và kết nối chat đang mở
+        for checksum in AccessToken.objects.filter(user_id=instance.pk).values_list('token_checksum', flat=True):
+            authentication.invalidate_token(checksum)
+            middleware.invalidate(checksum)
+        rosters.invalidate_user_auth(instance.pk)
@@ -0,0 +1,139 @@
+"""
+Gợi ý sự kiện cho user (events/suggest_events/), tính sẵn thay vì join tags/tickets mỗi request.
+
+Mỗi sự kiện sắp diễn ra và mỗi user là một vector thưa trên không gian [tag..., category...]:
+sự kiện có 1 ở các tag của nó và ở category của nó; user có 1 ở các tag đã chọn và
+SUGGESTION_CATEGORY_WEIGHT (< 1) ở các category đã từng mua vé. Điểm = U @ E.T (scipy.sparse),
+nên thứ tự giống truy vấn cũ: số tag trùng, rồi trùng category, rồi start_time sớm hơn.
+
+Top SUGGESTION_LIMIT sự kiện của mỗi user được lưu ở SuggestionIndex: dựng lại toàn bộ định kỳ
+(lệnh build_suggestions / job rebuild_suggestions), dựng lại riêng user khi user đặt vé hoặc đổi tag.
+"""
+import threading
+import time
+
+import numpy as np
+from scipy import sparse
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Event, SuggestionIndex, Tag, Ticket, User
+
+CATEGORIES = [code for code, _ in Event.CATEGORY_CHOICES]
+USER_CHUNK_SIZE = 1000
+
+_event_index = None
+_event_index_lock = threading.Lock()
+
+
+def _csr(entries, values, shape):
+    rows = np.fromiter((r for r, _ in entries), dtype=np.int64, count=len(entries))
+    cols = np.fromiter((c for _, c in entries), dtype=np.int64, count=len(entries))
+    return sparse.csr_matrix((np.asarray(values, dtype=np.float64), (rows, cols)), shape=shape)
+
+
+class EventIndex:
+    """Ma trận sự kiện ứng viên (sự kiện đang hoạt động, chưa diễn ra)."""
+
+    def __init__(self):
+        now = timezone.now()
+        rows = list(
+            Event.objects.filter(is_active=True, start_time__gte=now)
+            .order_by('start_time', 'id').values_list('id', 'category')
+        )
+        self.event_ids = np.array([r[0] for r in rows], dtype=np.int64)
+        self.tag_columns = {tag_id: i for i, tag_id in enumerate(Tag.objects.order_by('id').values_list('id', flat=True))}
+        self.category_columns = {c: len(self.tag_columns) + i for i, c in enumerate(CATEGORIES)}
+        self.width = len(self.tag_columns) + len(self.category_columns)
+
+        position = {event_id: i for i, event_id in enumerate(self.event_ids.tolist())}
+        entries = [(i, self.category_columns[category]) for i, (_, category) in enumerate(rows)
+                   if category in self.category_columns]
+        for event_id, tag_id in Event.tags.through.objects.filter(
+            event_id__in=list(position)
+        ).values_list('event_id', 'tag_id'):
+            if tag_id in self.tag_columns:
+                entries.append((position[event_id], self.tag_columns[tag_id]))
+        self.matrix = _csr(entries, [1.0] * len(entries), (len(rows), self.width))
+        self.built_at = time.monotonic()
+
+    def user_matrix(self, user_ids):
+        """Vector của các user (theo thứ tự user_ids) bằng hai truy vấn."""
+        row = {user_id: i for i, user_id in enumerate(user_ids)}
+        entries, values = [], []
+        for user_id, tag_id in User.tags.through.objects.filter(user_id__in=user_ids).values_list('user_id', 'tag_id'):
+            if tag_id in self.tag_columns:
+                entries.append((row[user_id], self.tag_columns[tag_id]))
+                values.append(1.0)
+        for user_id, category in Ticket.objects.filter(user_id__in=user_ids).values_list(
+            'user_id', 'event__category'
+        ).distinct():
+            if category in self.category_columns:
+                entries.append((row[user_id], self.category_columns[category]))
+                values.append(settings.SUGGESTION_CATEGORY_WEIGHT)
+        return _csr(entries, values, (len(user_ids), self.width))
+
+    def top_events(self, user_ids, limit):
+        """{user_id: [event_id, ...]} top `limit` sự kiện của mỗi user."""
+        scores = (self.user_matrix(user_ids) @ self.matrix.T).tocsr()
+        result = {}
+        for i, user_id in enumerate(user_ids):
+            start, end = scores.indptr[i], scores.indptr[i + 1]
+            columns, values = scores.indices[start:end], scores.data[start:end]
+            # Cột sự kiện đã xếp theo start_time nên chỉ số cột là khóa phụ khi bằng điểm
+            order = np.lexsort((columns, -values))[:limit]
+            result[user_id] = self.event_ids[columns[order]].tolist()
+        return result
+
+
+def get_event_index(rebuild=False):
+    """EventIndex dùng chung trong tiến trình, dựng lại sau SUGGESTION_EVENT_INDEX_SECONDS."""
+    global _event_index
+    with _event_index_lock:
+        if rebuild or _event_index is None or \
+                time.monotonic() - _event_index.built_at > settings.SUGGESTION_EVENT_INDEX_SECONDS:
+            _event_index = EventIndex()
+        return _event_index
+
+
+def _cache_key(user_id):
+    return f'bem:suggest:{user_id}'
+
+
+def build(user_ids=None, rebuild_events=False):
+    """Tính và lưu gợi ý cho các user (mặc định: mọi user). Trả về số user đã tính."""
+    index = get_event_index(rebuild=rebuild_events)
+    if user_ids is None:
+        user_ids = list(User.objects.filter(is_active=True).values_list('id', flat=True))
+    user_ids = list(user_ids)
+    for i in range(0, len(user_ids), USER_CHUNK_SIZE):
+        chunk = user_ids[i:i + USER_CHUNK_SIZE]
+        top = index.top_events(chunk, settings.SUGGESTION_LIMIT)
+        SuggestionIndex.objects.bulk_create(
+            [SuggestionIndex(user_id=user_id, event_ids=event_ids) for user_id, event_ids in top.items()],
+            update_conflicts=True, unique_fields=['user'], update_fields=['event_ids', 'built_at'],
+        )
+        cache.delete_many([_cache_key(user_id) for user_id in chunk])
+    return len(user_ids)
+
+
+def refresh_later(*user_ids):
+    """Dựng lại gợi ý của các user ở job nền sau khi transaction hiện tại commit."""
+    from . import tasks
+    if user_ids:
+        transaction.on_commit(lambda: tasks.refresh_suggestions.delay(sorted(set(user_ids))))
+
+
+def suggested_event_ids(user):
+    """Danh sách id sự kiện gợi ý cho user: cache -> SuggestionIndex -> tính ngay nếu chưa có."""
+    key = _cache_key(user.pk)
+    event_ids = cache.get(key)
+    if event_ids is None:
+        event_ids = SuggestionIndex.objects.filter(user=user).values_list('event_ids', flat=True).first()
+        if event_ids is None:
+            build([user.pk])
+            event_ids = SuggestionIndex.objects.filter(user=user).values_list('event_ids', flat=True).first() or []
+        cache.set(key, event_ids, settings.SUGGESTION_CACHE_SECONDS)
+    return event_ids
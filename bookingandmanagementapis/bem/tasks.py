@@ -1,74 +1,246 @@
-from datetime import timezone
-from django.http import JsonResponse
-from django.utils.timezone import now, timedelta
-
-
-def auto_create_notifications_for_upcoming_events(request):
-    """
-    Luôn tạo notification mới cho các sự kiện sắp diễn ra (7 ngày và 1 ngày tới).
-    Nếu event đổi ngày, đến mốc mới sẽ lại tạo notification mới.
-    """
-    # today = timezone.now().date()
-    # upcoming_events = Event.objects.filter(
-    #     start_time__date__in=[today + timedelta(days=7), today + timedelta(days=1)]
-    # )
-
-    # count = 0
-    # for event in upcoming_events:
-    #     message = f"Sự kiện '{event.title}' sẽ diễn ra vào {event.start_time.date()}!"
-    #     notification = Notification.objects.create(
-    #         event=event,
-    #         notification_type='reminder',
-    #         title="Sự kiện sắp diễn ra",
-    #         message=message,
-    #     )
-
-    #     # Lấy tất cả user có vé đã thanh toán cho event này
-    #     ticket_owners = Ticket.objects.filter(event=event, is_paid=True).values_list('user', flat=True).distinct()
-    #     for user_id in ticket_owners:
-    #         UserNotification.objects.create(user_id=user_id, notification=notification)
-    #         user = User.objects.get(id=user_id)
-    #         send_mail(
-    #             subject="Sự kiện sắp diễn ra",
-    #             message=f"Kính gửi {user.username},\n\n{message}\n\nTrân trọng!",
-    #             from_email=settings.EMAIL_HOST_USER,
-    #             recipient_list=[user.email],
-    #             fail_silently=False,
-    #         )
-    #     count += 1
-
-    today = timezone.now().date()
-    target_dates = [today + timedelta(days=7), today + timedelta(days=1)]
-    print("Today:", today)
-    print("Target dates:", target_dates)
-    events = Event.objects.all()
-    for e in events:
-        print("Event:", e.title, e.start_time, e.start_time.date())
-    upcoming_events = Event.objects.filter(
-        start_time__date__in=target_dates
+"""
+Hàng đợi job nền cho các side effect của request (email, push, tin nhắn chào, fan-out thông báo).
+
+View chỉ gọi `<task>.delay(...)`; job được đẩy sang backend sau khi transaction commit.
+TASK_BACKEND = 'thread' chạy job trong thread pool của tiến trình (TASK_WORKERS luồng),
+'eager' chạy ngay trong lời gọi (dùng cho test). Job lỗi được thử lại TASK_MAX_RETRIES lần với
+backoff lũy thừa (hẹn bằng threading.Timer, không chiếm luồng của pool trong lúc chờ) rồi được ghi vào
+FailedTask (dead letter) để xem lại / chạy lại bằng lệnh retry_failed_tasks. Job đang chờ trong hàng đợi
+hoặc chờ thử lại chỉ nằm trong bộ nhớ: tiến trình khởi động lại thì mất.
+Tham số của job phải là dữ liệu JSON (id, chuỗi...), không truyền model.
+Job đánh dấu @periodic(...) được bem/scheduler.py gọi định kỳ.
+"""
+import logging
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+
+logger = logging.getLogger(__name__)
+
+registry = {}
+# tên job -> (chu kỳ giây, Task) cho bộ lập lịch
+periodic_registry = {}
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=settings.TASK_WORKERS, thread_name_prefix='bem-task')
+        return _executor
+
+
+class Task:
+    def __init__(self, fn, max_retries=None):
+        self.fn = fn
+        self.name = fn.__name__
+        self.max_retries = settings.TASK_MAX_RETRIES if max_retries is None else max_retries
+
+    def __call__(self, *args, **kwargs):
+        return self.fn(*args, **kwargs)
+
+    def delay(self, *args, **kwargs):
+        """Đưa job vào hàng đợi (sau khi transaction hiện tại commit)."""
+        if settings.TASK_BACKEND == 'eager':
+            self.run(args, kwargs, backoff=False)
+        else:
+            transaction.on_commit(lambda: _get_executor().submit(self._run_in_thread, args, kwargs))
+
+    def _run_in_thread(self, args, kwargs, attempt=1):
+        close_old_connections()
+        try:
+            if self._attempt(args, kwargs, attempt) is None:
+                # Hẹn lần thử sau bằng timer thay vì sleep: luồng của pool được trả lại cho job khác
+                timer = threading.Timer(_backoff(attempt), _submit, (self, args, kwargs, attempt + 1))
+                timer.daemon = True
+                timer.start()
+        finally:
+            close_old_connections()
+
+    def run(self, args, kwargs, backoff=True):
+        """Chạy job đồng bộ, thử lại khi lỗi; hết lượt thử thì ghi dead letter. Trả về True nếu thành công."""
+        for attempt in range(1, self.max_retries + 2):
+            done = self._attempt(args, kwargs, attempt)
+            if done is not None:
+                return done
+            if backoff:
+                time.sleep(_backoff(attempt))
+
+    def _attempt(self, args, kwargs, attempt):
+        """Lần chạy thứ `attempt`: True nếu thành công, False nếu đã ghi dead letter, None nếu còn lượt thử lại."""
+        try:
+            self.fn(*args, **kwargs)
+            return True
+        except Exception as e:
+            if attempt > self.max_retries:
+                logger.error(f"Task {self.name} failed after {attempt} attempts: {e}")
+                _dead_letter(self, args, kwargs, attempt)
+                return False
+            logger.warning(f"Task {self.name} attempt {attempt} failed: {e}")
+            return None
+
+
+def _backoff(attempt):
+    return 2 ** (attempt - 1)
+
+
+def _submit(task, args, kwargs, attempt):
+    _get_executor().submit(task._run_in_thread, args, kwargs, attempt)
+
+
+def _dead_letter(task, args, kwargs, attempts):
+    from .models import FailedTask
+    try:
+        FailedTask.objects.create(
+            name=task.name, args=list(args), kwargs=kwargs, attempts=attempts, error=traceback.format_exc()
+        )
+    except Exception as e:
+        logger.error(f"Could not record failed task {task.name}: {e}")
+
+
+def task(fn=None, *, max_retries=None):
+    """Decorator đăng ký một hàm làm job nền: gọi trực tiếp hoặc qua .delay(...)."""
+    def wrap(f):
+        t = Task(f, max_retries=max_retries)
+        registry[t.name] = t
+        return t
+    return wrap(fn) if fn is not None else wrap
+
+
+def periodic(seconds):
+    """Đăng ký một Task (đặt trên @task) để bộ lập lịch chạy mỗi `seconds` giây."""
+    def wrap(t):
+        periodic_registry[t.name] = (seconds, t)
+        return t
+    return wrap
+
+
+@task
+def send_email(subject, message, recipient_list):
+    # Job cũ (có thể còn trong FailedTask): nay chỉ ghi vào outbox
+    from .mailer import queue_email
+    queue_email(subject, message, recipient_list)
+
+
+@task
+def send_notification_emails(notification_id, user_ids):
+    """Ghi email của một Notification cho nhiều user vào outbox (gửi theo lô bởi flush_email_outbox)."""
+    from .mailer import queue_emails
+    from .models import Notification, User
+    notification = Notification.objects.get(pk=notification_id)
+    queue_emails(
+        (notification.title, f"Kính gửi {username},\n\n{notification.message}\n\nTrân trọng!", [email])
+        for username, email in User.objects.filter(pk__in=user_ids).exclude(email='').values_list('username', 'email')
     )
-    print("Upcoming events:", list(upcoming_events))
 
-    # return JsonResponse({"message": f"Đã tạo notification cho {count} sự kiện."})
-    return JsonResponse({"message": "Đã kiểm tra sự kiện sắp diễn ra."})
 
-if __name__ == "__main__":
-    import os
-    import django
-    import sys
+@task
+def send_push(user_ids, title, body, data=None):
+    from .utils import send_fcm_to_users
+    summary = send_fcm_to_users(user_ids, title, body, data)
+    _retry_push(summary, title, body, data)
+
+
+@task
+def send_push_tokens(tokens, title, body, data=None):
+    """Gửi lại thông báo cho các token lỗi tạm thời; lỗi thì job được thử lại rồi ghi dead letter."""
+    from .utils import PushDeliveryError, send_fcm_to_tokens
+    summary = send_fcm_to_tokens(tokens, title, body, data)
+    if summary['retry']:
+        # Task.run truyền lại cùng danh sách ở lần thử sau: chỉ giữ các token còn lỗi
+        tokens[:] = summary['retry']
+        raise PushDeliveryError(summary['retry'])
+
+
+def _retry_push(summary, title, body, data):
+    # Chỉ gửi lại các token lỗi, không gửi trùng cho thiết bị đã nhận
+    if summary['retry']:
+        send_push_tokens.delay(summary['retry'], title, body, data)
+
+
+@task
+def send_chat_welcome(event_id, user_id, message="Tôi có thể giúp gì cho bạn ?"):
+    """Tin nhắn từ organizer đến attendee vừa mua vé."""
+    from .models import ChatMessage, Event
+    organizer_id = Event.objects.values_list('organizer_id', flat=True).get(pk=event_id)
+    ChatMessage.objects.create(
+        event_id=event_id,
+        sender_id=organizer_id,
+        receiver_id=user_id,
+        message=message,
+        is_from_organizer=True
+    )
+
+
+@task
+def notify_users(notification_id, user_ids, push=True):
+    """Fan-out một Notification: tạo UserNotification cho các user và gửi push tới thiết bị của họ."""
+    from .models import Notification, UserNotification
+    from .utils import send_fcm_to_users
+    notification = Notification.objects.get(pk=notification_id)
+    UserNotification.objects.bulk_create(
+        [UserNotification(user_id=user_id, notification_id=notification_id) for user_id in user_ids],
+        ignore_conflicts=True
+    )
+    if push:
+        data = {"notification_id": notification.id}
+        if notification.event_id:
+            data["event_id"] = notification.event_id
+        summary = send_fcm_to_users(user_ids, notification.title, notification.message, data)
+        _retry_push(summary, notification.title, notification.message, data)
+
+
+@task
+def upload_ticket_qr(ticket_uuid):
+    from .qr_codes import upload_ticket_qr as upload
+    upload(ticket_uuid)
+
+
+@periodic(seconds=settings.REMINDER_INTERVAL_SECONDS)
+@task
+def send_due_reminders():
+    from .reminders import send_due_reminders as send
+    result = send()
+    logger.info(f"Reminders: {result}")
+
+
+@periodic(seconds=60)
+@task
+def release_expired_holds():
+    from .reservations import release_expired_holds as release
+    release()
+
+
+@periodic(seconds=settings.TRENDING_RESCORE_SECONDS)
+@task
+def rescore_trending():
+    from . import trending
+    trending.flush()
+    trending.rescore_dirty()
+
 
-    # Thêm BASE_DIR vào sys.path để Python tìm thấy project
-    sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+@task
+def refresh_suggestions(user_ids):
+    from . import suggestions
+    suggestions.build(user_ids)
 
-    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "bookingandmanagementapis.settings")
-    django.setup()
 
-    # Import models SAU khi đã setup Django
-    from models import Event, Notification, Ticket, User, UserNotification
-    from django.conf import settings
-    from django.core.mail import send_mail
+@periodic(seconds=settings.SUGGESTION_REBUILD_SECONDS)
+@task
+def rebuild_suggestions():
+    from . import suggestions
+    suggestions.build(rebuild_events=True)
 
-    # Đặt lại code của hàm ở đây hoặc truyền các model vào hàm nếu cần
-    # Hoặc copy code xử lý vào đây để test
 
-    auto_create_notifications_for_upcoming_events(None)
\ No newline at end of file
+@periodic(seconds=60)
+@task
+def flush_email_outbox():
+    from .mailer import flush_outbox
+    flush_outbox()
@@ -1,3 +1,413 @@
-from django.test import TestCase
+import threading
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.db import DataError, DatabaseError, OperationalError, close_old_connections, connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from oauth2_provider.models import AccessToken, Application
+from rest_framework.test import APIClient
+
+from . import chat_buffer, tasks
+from .mailer import flush_outbox, queue_email
+from .models import ChatMessage, Event, FailedTask, Notification, OutboxEmail, Payment, Ticket, User, UserNotification
+from .reservations import apply_paid_change, mark_tickets_paid
+from .rosters import event_participants
+
+
+def create_event(organizer, **kwargs):
+    now = timezone.now()
+    fields = dict(
+        organizer=organizer, title='Sự kiện test', description='-', category='music',
+        start_time=now + timedelta(days=1), end_time=now + timedelta(days=2),
+        location='Hà Nội', latitude=21, longitude=105, total_tickets=10, ticket_price=100,
+    )
+    fields.update(kwargs)
+    return Event.objects.create(**fields)
+
+
+class ReservationTests(TestCase):
+    def setUp(self):
+        self.organizer = User.objects.create_user('organizer', 'organizer@example.com', role='organizer')
+        self.buyer = User.objects.create_user('buyer', 'buyer@example.com')
+        self.event = create_event(self.organizer, total_tickets=1)
+
+    def _legacy_ticket(self):
+        # Vé tạo trước khi có giữ chỗ: chưa thanh toán, không giữ chỗ, không tính vào tồn kho
+        ticket = Ticket.objects.create(event=self.event, user=self.buyer)
+        Ticket.objects.filter(pk=ticket.pk).update(hold_expires_at=None)
+        Event.objects.filter(pk=self.event.pk).update(reserved_tickets=0)
+        return ticket
+
+    def test_paying_unheld_ticket_rejected_when_sold_out(self):
+        ticket = self._legacy_ticket()
+        Ticket.objects.create(event=self.event, user=self.organizer, is_paid=True)
+
+        with self.assertRaises(ValidationError):
+            mark_tickets_paid(Ticket.objects.filter(pk=ticket.pk), timezone.now())
+        self.event.refresh_from_db()
+        self.assertEqual(self.event.sold_tickets, 1)
+        self.assertFalse(Ticket.objects.get(pk=ticket.pk).is_paid)
+
+        ticket.refresh_from_db()
+        ticket.is_paid = True
+        with self.assertRaises(ValidationError):
+            ticket.save()
+        self.event.refresh_from_db()
+        self.assertEqual(self.event.sold_tickets, 1)
+
+    def test_paying_unheld_ticket_takes_a_free_seat(self):
+        ticket = self._legacy_ticket()
+        self.assertEqual(mark_tickets_paid(Ticket.objects.filter(pk=ticket.pk), timezone.now()), 1)
+        self.event.refresh_from_db()
+        self.assertEqual((self.event.sold_tickets, self.event.reserved_tickets), (1, 0))
+
+    def test_payment_rolled_back_when_sold_out(self):
+        ticket = self._legacy_ticket()
+        Ticket.objects.create(event=self.event, user=self.organizer, is_paid=True)
+        payment = Payment.objects.create(user=self.buyer, amount=100, payment_method='momo', transaction_id='t-1')
+        Ticket.objects.filter(pk=ticket.pk).update(payment=payment)
+
+        payment.status = True
+        with self.assertRaises(ValidationError):
+            payment.save()
+        self.assertFalse(Payment.objects.get(pk=payment.pk).status)
+
+    def test_apply_paid_change_on_held_ticket(self):
+        ticket = Ticket.objects.create(event=self.event, user=self.buyer)
+        ticket.is_paid = True
+        self.assertEqual(apply_paid_change(ticket), 1)
+        self.event.refresh_from_db()
+        self.assertEqual((self.event.sold_tickets, self.event.reserved_tickets), (1, 0))
+
+
+class ReservationConcurrencyTests(TransactionTestCase):
+    """Nhiều thread cùng đặt vé cho một sự kiện: không được bán quá total_tickets."""
+
+    seats = 20
+    threads = 8
+    attempts = 10
+
+    def test_no_oversell_under_concurrent_bookings(self):
+        organizer = User.objects.create_user('organizer', 'organizer@example.com', role='organizer')
+        buyers = [User.objects.create_user(f'buyer{i}', f'buyer{i}@example.com') for i in range(self.threads)]
+        event = create_event(organizer, total_tickets=self.seats)
+        booked, errors = [0] * self.threads, []
+        barrier = threading.Barrier(self.threads)
+
+        def worker(index):
+            close_old_connections()
+            barrier.wait()
+            try:
+                for n in range(self.attempts):
+                    try:
+                        Ticket(event_id=event.pk, user=buyers[index], is_paid=n % 2 == 0).save()
+                        booked[index] += 1
+                    except ValidationError:
+                        pass
+                    except DatabaseError as e:  # SQLite khóa cả file khi ghi đồng thời
+                        errors.append(e)
+            finally:
+                connection.close()
+
+        pool = [threading.Thread(target=worker, args=(i,)) for i in range(self.threads)]
+        # Chỉ đo tồn kho: job gợi ý sự kiện (eager trong test) không cạnh tranh ghi DB với các thread đặt vé
+        with mock.patch.object(tasks.refresh_suggestions, 'delay'):
+            for t in pool:
+                t.start()
+            for t in pool:
+                t.join()
+
+        event.refresh_from_db()
+        rows = Ticket.objects.filter(event=event).count()
+        self.assertLessEqual(rows, self.seats)
+        self.assertEqual(sum(booked), rows)
+        self.assertEqual(event.sold_tickets, Ticket.objects.filter(event=event, is_paid=True).count())
+        self.assertEqual(event.reserved_tickets, Ticket.objects.filter(event=event, is_paid=False).count())
+        if connection.vendor != 'sqlite':
+            self.assertEqual(errors, [])
+            self.assertEqual(rows, self.seats)
+
+
+class ListQueryCountTests(TestCase):
+    """Số truy vấn của các danh sách không được tăng theo số dòng (N+1)."""
+
+    def setUp(self):
+        self.organizer = User.objects.create_user('organizer', 'organizer@example.com', role='organizer')
+        self.user = User.objects.create_user('buyer', 'buyer@example.com')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def _events(self, n):
+        return [create_event(self.organizer, title=f'Sự kiện {i}') for i in range(n)]
+
+    def test_my_notifications(self):
+        notifications = Notification.objects.bulk_create(
+            Notification(event=event, title=f'Thông báo {i}', message='-') for i, event in enumerate(self._events(20))
+        )
+        UserNotification.objects.bulk_create(
+            UserNotification(user=self.user, notification=n, is_read=i % 2 == 0) for i, n in enumerate(notifications)
+        )
+        for url in ['/notifications/my-notifications/', '/users/my-notifications/']:
+            with self.assertNumQueries(1):
+                response = self.client.get(url, {'page_size': 20})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(response.data['results']), 20)
+
+    def test_ticket_lists(self):
+        for event in self._events(20):
+            Ticket.objects.create(event=event, user=self.user, is_paid=True)
+        # /tickets/ phân trang theo số trang: thêm một truy vấn COUNT
+        for url, queries in [('/tickets/', 2), ('/users/tickets/', 1)]:
+            with self.assertNumQueries(queries):
+                response = self.client.get(url, {'page_size': 20})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(response.data['results']), 20)
+
+
+class ChatRosterTests(TestCase):
+    """Roster người tham gia của tin nhắn chat: một truy vấn cho cả trang, cache bị xóa khi vé đổi trạng thái."""
+
+    attendees = 30
+
+    def setUp(self):
+        cache.clear()
+        self.organizer = User.objects.create_user('organizer', 'organizer@example.com', role='organizer')
+        self.event = create_event(self.organizer, total_tickets=100)
+        self.users = User.objects.bulk_create(
+            User(username=f'attendee{i}', email=f'attendee{i}@example.com') for i in range(self.attendees)
+        )
+        Ticket.objects.bulk_create(Ticket(event=self.event, user=user, is_paid=True) for user in self.users)
+        Event.objects.filter(pk=self.event.pk).update(sold_tickets=self.attendees)
+        ChatMessage.objects.bulk_create(
+            ChatMessage(event=self.event, sender=self.users[i % self.attendees], message=f'Tin nhắn {i}')
+            for i in range(20)
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.users[0])
+
+    def _assert_list(self, url, queries, **params):
+        with self.assertNumQueries(queries):
+            response = self.client.get(url, {'page_size': 20, **params})
+        self.assertEqual(response.status_code, 200)
+        results = response.data['results']
+        self.assertEqual(len(results), 20)
+        self.assertTrue(all(len(message['participants']) == self.attendees for message in results))
+
+    def test_chat_message_list_queries(self):
+        # Tin nhắn + roster (một truy vấn cho mọi tin nhắn); lần sau roster lấy từ cache
+        self._assert_list('/chat-messages/', 2, event_id=self.event.pk)
+        self._assert_list('/chat-messages/', 1, event_id=self.event.pk)
+
+    def test_event_chat_messages_queries(self):
+        # Sự kiện + tin nhắn + roster
+        self._assert_list(f'/events/{self.event.pk}/chat-messages/', 3)
+        self._assert_list(f'/events/{self.event.pk}/chat-messages/', 2)
+
+    def test_roster_invalidated_on_payment_and_refund(self):
+        buyer = User.objects.create_user('buyer', 'buyer@example.com')
+        self.assertEqual(len(event_participants(self.event.pk)), self.attendees)
+        with self.captureOnCommitCallbacks(execute=True):
+            ticket = Ticket.objects.create(event=self.event, user=buyer)
+            ticket.is_paid = True
+            ticket.save()
+        self.assertIn(buyer.pk, [p['id'] for p in event_participants(self.event.pk)])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            ticket.is_paid = False
+            ticket.save()
+        self.assertNotIn(buyer.pk, [p['id'] for p in event_participants(self.event.pk)])
+
+
+@override_settings(EMAIL_MAX_PER_SECOND=0, EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend')
+class OutboxRetryTests(TestCase):
+    def setUp(self):
+        with mock.patch('bem.mailer._schedule_flush'):
+            queue_email('Tiêu đề', 'Nội dung', ['buyer@example.com'])
+
+    def _flush_failing(self):
+        with mock.patch('django.core.mail.backends.locmem.EmailBackend.send_messages', side_effect=OSError('smtp down')):
+            flush_outbox()
+
+    def test_failed_mail_waits_for_backoff(self):
+        self._flush_failing()
+        email = OutboxEmail.objects.get()
+        self.assertEqual((email.status, email.attempts, email.error), ('pending', 1, 'smtp down'))
+        self.assertGreater(email.next_attempt_at, timezone.now())
+        # Chưa tới hạn thử lại: lần flush kế tiếp không nhận lại
+        self._flush_failing()
+        self.assertEqual(OutboxEmail.objects.get().attempts, 1)
+
+    def test_failed_after_max_attempts(self):
+        for _ in range(3):
+            OutboxEmail.objects.update(next_attempt_at=None)
+            self._flush_failing()
+        email = OutboxEmail.objects.get()
+        self.assertEqual((email.status, email.attempts), ('failed', 3))
+
+    def test_retry_sends_after_backoff(self):
+        self._flush_failing()
+        OutboxEmail.objects.update(next_attempt_at=timezone.now() - timedelta(seconds=1))
+        flush_outbox()
+        email = OutboxEmail.objects.get()
+        self.assertEqual((email.status, email.attempts), ('sent', 2))
+
+
+class TicketQrTests(TestCase):
+    def setUp(self):
+        organizer = User.objects.create_user('organizer', 'organizer@example.com', role='organizer')
+        self.buyer = User.objects.create_user('buyer', 'buyer@example.com')
+        self.ticket = Ticket.objects.create(event=create_event(organizer), user=self.buyer, is_paid=True)
+        self.url = f'/tickets/{self.ticket.uuid}/qr.svg'
+
+    def test_matching_etag_returns_not_modified(self):
+        etag = self.client.get(self.url)['ETag']
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+    def test_refunded_ticket_not_revalidated(self):
+        etag = self.client.get(self.url)['ETag']
+        Ticket.objects.filter(pk=self.ticket.pk).update(is_paid=False)
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 404)
+
+    def test_unknown_ticket_with_guessed_etag(self):
+        etag = self.client.get(self.url)['ETag']
+        self.ticket.delete()
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 404)
+
+
+@override_settings(CHAT_WRITE_BEHIND=True, CHAT_FLUSH_BATCH_SIZE=10, CHAT_FLUSH_MAX_ATTEMPTS=2)
+class ChatBufferRetryTests(TestCase):
+    def setUp(self):
+        organizer = User.objects.create_user('organizer', 'organizer@example.com', role='organizer')
+        event = create_event(organizer)
+        self.messages = [
+            ChatMessage(id=pk, event=event, sender=organizer, message=text)
+            for pk, text in zip(chat_buffer._reserve_ids(3), ['a', 'hỏng', 'b'])
+        ]
+        for message in self.messages:
+            chat_buffer._add(message)
+
+    def tearDown(self):
+        with chat_buffer._lock:
+            chat_buffer._pending.clear()
+
+    def _flush_failing(self, bulk_create, error):
+        with mock.patch.object(ChatMessage.objects, 'bulk_create', side_effect=bulk_create):
+            with self.assertRaises(error):
+                chat_buffer.flush()
+
+    def test_poison_row_dropped_after_max_attempts(self):
+        bulk_create = ChatMessage.objects.bulk_create
+
+        def reject_bad_row(batch):
+            if any(m.message == 'hỏng' for m in batch):
+                raise DataError('value too long')
+            return bulk_create(batch)
+
+        for _ in range(2):
+            self._flush_failing(reject_bad_row, DataError)
+            self.assertEqual(chat_buffer.pending_count(), 3)
+        with mock.patch.object(ChatMessage.objects, 'bulk_create', side_effect=reject_bad_row), \
+                mock.patch('bem.rosters.retract_chat_messages') as retract:
+            self.assertEqual(chat_buffer.flush(), 2)
+        self.assertEqual(chat_buffer.pending_count(), 0)
+        bad = self.messages[1]
+        retract.assert_called_once_with(bad.event_id, [bad.id])
+        self.assertEqual(set(ChatMessage.objects.values_list('message', flat=True)), {'a', 'b'})
+        failed = FailedTask.objects.get()
+        self.assertEqual((failed.name, failed.kwargs['id'], failed.attempts), ('chat_buffer.write', bad.id, 3))
+
+    def test_db_outage_keeps_messages(self):
+        for _ in range(3):
+            self._flush_failing(OperationalError('down'), OperationalError)
+        self.assertEqual(chat_buffer.pending_count(), 3)
+        self.assertFalse(FailedTask.objects.exists())
+        self.assertEqual(chat_buffer.flush(), 3)
+        self.assertEqual(ChatMessage.objects.count(), 3)
+
+
+class TaskTests(TestCase):
+    def _task(self, side_effect):
+        fn = mock.Mock(side_effect=side_effect, __name__='flaky_job')
+        return fn, tasks.Task(fn, max_retries=2)
+
+    def test_eager_retries_then_dead_letters(self):
+        fn, task = self._task(RuntimeError('boom'))
+        task.delay(1, 'a', key='value')
+        self.assertEqual(fn.call_count, 3)
+        failed = FailedTask.objects.get()
+        self.assertEqual((failed.name, failed.args, failed.kwargs, failed.attempts),
+                         ('flaky_job', [1, 'a'], {'key': 'value'}, 3))
+        self.assertIn('RuntimeError: boom', failed.error)
+
+    def test_eager_success_after_retry(self):
+        fn, task = self._task([RuntimeError('boom'), None])
+        task.delay(1)
+        self.assertEqual(fn.call_count, 2)
+        self.assertFalse(FailedTask.objects.exists())
+
+    @override_settings(TASK_BACKEND='thread')
+    def test_thread_backend_submits_on_commit(self):
+        fn, task = self._task(None)
+        executor = mock.Mock()
+        with mock.patch('bem.tasks._get_executor', return_value=executor):
+            with self.captureOnCommitCallbacks(execute=True):
+                task.delay(7)
+                executor.submit.assert_not_called()
+        executor.submit.assert_called_once_with(task._run_in_thread, (7,), {})
+
+    def test_failed_attempt_schedules_retry_with_timer(self):
+        fn, task = self._task(RuntimeError('boom'))
+        with mock.patch('bem.tasks.threading.Timer') as timer:
+            task._run_in_thread((7,), {}, attempt=2)
+        timer.assert_called_once_with(tasks._backoff(2), tasks._submit, (task, (7,), {}, 3))
+        timer.return_value.start.assert_called_once_with()
+        self.assertFalse(FailedTask.objects.exists())
+
+    def test_last_attempt_dead_letters_without_timer(self):
+        fn, task = self._task(RuntimeError('boom'))
+        with mock.patch('bem.tasks.threading.Timer') as timer:
+            task._run_in_thread((7,), {}, attempt=3)
+        timer.assert_not_called()
+        self.assertEqual(FailedTask.objects.get().attempts, 3)
+
+
+class CachedTokenAuthenticationTests(TestCase):
+    """Request xác thực bằng access token: cache hit không tốn truy vấn xác thực nào."""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('buyer', 'buyer@example.com', 'secret')
+        app = Application.objects.create(
+            name='mobile', client_type='confidential', authorization_grant_type='password', user=self.user
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            AccessToken.objects.create(
+                user=self.user, application=app, token='token-123', scope='read write',
+                expires=timezone.now() + timedelta(hours=1)
+            )
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer token-123')
+
+    def test_query_count(self):
+        # Lần đầu: AccessToken + các trường phân quyền của User + danh sách vé; sau đó chỉ còn danh sách vé
+        with self.assertNumQueries(3):
+            self.assertEqual(self.client.get('/users/tickets/').status_code, 200)
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get('/users/tickets/').status_code, 200)
+
+    def test_uncached_fields_are_read_fresh(self):
+        self.client.get('/users/tickets/')
+        User.objects.filter(pk=self.user.pk).update(total_spent=1000)
+        response = self.client.get('/users/current-user/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(float(response.data['total_spent']), 1000)
+
+    def test_deactivated_user_rejected(self):
+        self.assertEqual(self.client.get('/users/tickets/').status_code, 200)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.is_active = False
+            self.user.save()
+        self.assertEqual(self.client.get('/users/tickets/').status_code, 401)
@@ -0,0 +1,255 @@
+"""
+Điểm trending của sự kiện, cập nhật theo lô thay vì trong mỗi lần lưu vé.
+
+Các thay đổi (vé thanh toán/hủy, lượt xem, review) được cộng dồn trong bộ đệm của tiến trình
+sau khi transaction commit; lượt xem được lọc trùng theo user trong VIEW_DEDUPE_SECONDS. Mỗi TRENDING_FLUSH_SECONDS giây một thread nền ghi bộ đệm xuống
+EventTrendingLog bằng một câu UPDATE cho cả lô (view_count, total_revenue += delta, needs_rescore).
+Job định kỳ rescore_trending tính lại điểm của các sự kiện needs_rescore theo lô;
+rescore_events() (lệnh rescore_trending) tính lại toàn bộ, ví dụ sau khi đổi TRENDING_WEIGHTS.
+"""
+import atexit
+import logging
+import threading
+import time
+from collections import defaultdict
+from datetime import date
+from decimal import Decimal
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+from django.db import close_old_connections, connection, transaction
+from django.db.models import Case, Count, DecimalField, F, IntegerField, Value, When
+from django.utils import timezone
+
+from . import response_cache
+from .models import Event, EventTrendingLog, Review
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 500
+
+_lock = threading.Lock()
+_pending = defaultdict(lambda: [0, 0])  # event_id -> [số vé thanh toán thêm (có thể âm), lượt xem thêm]
+_flusher = None
+
+
+def record(event_id, sales=0, views=0):
+    """Ghi nhận thay đổi của sự kiện (chỉ vào bộ đệm, sau khi transaction hiện tại commit)."""
+    transaction.on_commit(lambda: _add(event_id, sales, views))
+
+
+def record_view(request, event_id):
+    """
+    Đếm một lượt xem sự kiện, mỗi user (hoặc IP nếu chưa đăng nhập) tính một lần trong VIEW_DEDUPE_SECONDS.
+    Chỉ cộng vào bộ đệm; lượt xem được ghi xuống DB cùng lần flush tiếp theo.
+    """
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_authenticated:
+        viewer = f'u{user.pk}'
+    else:
+        forwarded = request.META.get('HTTP_X_FORWARDED_FOR', '')
+        viewer = 'ip' + (forwarded.split(',')[0].strip() or request.META.get('REMOTE_ADDR', ''))
+    # cache.add chỉ thành công với lượt xem đầu tiên trong cửa sổ
+    if cache.add(f'bem:view:{event_id}:{viewer}', 1, settings.VIEW_DEDUPE_SECONDS):
+        _add(int(event_id), 0, 1)
+        return True
+    return False
+
+
+def _add(event_id, sales, views):
+    with _lock:
+        entry = _pending[event_id]
+        entry[0] += sales
+        entry[1] += views
+    _ensure_flusher()
+
+
+def _ensure_flusher():
+    global _flusher
+    if _flusher is None and settings.BUFFER_FLUSH_THREADS:
+        with _lock:
+            if _flusher is None:
+                _flusher = threading.Thread(target=_flush_loop, name='bem-trending-flush', daemon=True)
+                _flusher.start()
+
+
+def _flush_loop():
+    while True:
+        time.sleep(settings.TRENDING_FLUSH_SECONDS)
+        close_old_connections()
+        try:
+            flush()
+        except Exception as e:
+            logger.error(f"Trending flush failed: {e}")
+        finally:
+            close_old_connections()
+
+
+def _case(deltas, output_field):
+    return Case(
+        *[When(pk=event_id, then=Value(delta)) for event_id, delta in deltas.items()],
+        default=Value(0), output_field=output_field
+    )
+
+
+def invalidate_hot_events():
+    response_cache.invalidate('events:hot')
+
+
+def flush():
+    """Ghi bộ đệm xuống EventTrendingLog, đánh dấu các sự kiện cần tính lại điểm. Trả về số sự kiện."""
+    global _pending
+    with _lock:
+        pending, _pending = _pending, defaultdict(lambda: [0, 0])
+    if not pending:
+        return 0
+    try:
+        prices = dict(Event.objects.filter(pk__in=list(pending)).values_list('id', 'ticket_price'))
+        event_ids = list(prices)
+        EventTrendingLog.objects.bulk_create(
+            [EventTrendingLog(event_id=event_id) for event_id in event_ids], ignore_conflicts=True
+        )
+        for i in range(0, len(event_ids), BATCH_SIZE):
+            chunk = event_ids[i:i + BATCH_SIZE]
+            updates = {'needs_rescore': True}
+            views = {e: pending[e][1] for e in chunk if pending[e][1]}
+            revenue = {e: pending[e][0] * prices[e] for e in chunk if pending[e][0]}
+            if views:
+                updates['view_count'] = F('view_count') + _case(views, IntegerField())
+            if revenue:
+                updates['total_revenue'] = F('total_revenue') + _case(
+                    revenue, DecimalField(max_digits=15, decimal_places=2)
+                )
+            EventTrendingLog.objects.filter(pk__in=chunk).update(**updates)
+        # Có vé bán/hủy: xếp hạng hot có thể đã đổi (bị xóa tối đa mỗi TRENDING_FLUSH_SECONDS)
+        if any(sales for sales, _ in pending.values()):
+            invalidate_hot_events()
+    except Exception:
+        # Trả lại bộ đệm để lần flush sau ghi tiếp
+        with _lock:
+            for event_id, (sales, views) in pending.items():
+                _pending[event_id][0] += sales
+                _pending[event_id][1] += views
+        raise
+    return len(event_ids)
+
+
+def get_weights(overrides=None):
+    weights = dict(settings.TRENDING_WEIGHTS)
+    weights.update(overrides or {})
+    return weights
+
+
+def compute_scores(sold_tickets, total_tickets, days_on_sale, views, review_count, weights=None):
+    """
+    Công thức điểm (như EventTrendingLog.calculate_score) trên mảng NumPy, trọng số lấy từ TRENDING_WEIGHTS.
+    Trả về (trending_score, interest_score), làm tròn 4 chữ số.
+    """
+    w = get_weights(weights)
+    sold = np.asarray(sold_tickets, dtype=np.float64)
+    total = np.asarray(total_tickets, dtype=np.float64)
+    sold_ratio = np.divide(sold, total, out=np.zeros_like(sold), where=total > 0)
+    velocity = sold / np.maximum(np.asarray(days_on_sale, dtype=np.float64), 1)
+    trending = np.round(
+        w['sold_ratio'] * sold_ratio + w['velocity'] * velocity
+        + w['views'] * np.log1p(np.asarray(views, dtype=np.float64)),
+        4
+    )
+    interest = np.round(
+        w['interest_trending'] * trending + w['interest_sold'] * sold
+        + w['interest_reviews'] * np.asarray(review_count, dtype=np.float64),
+        4
+    )
+    return trending, interest
+
+
+def rescore_events(event_ids=None, weights=None, batch_size=2000):
+    """
+    Tính lại điểm cho các sự kiện (mặc định: mọi sự kiện đang hoạt động): hai truy vấn tổng hợp,
+    tính bằng NumPy rồi ghi theo lô batch_size dòng. Trả về số sự kiện đã tính.
+    """
+    events = Event.objects.all() if event_ids is not None else Event.objects.filter(is_active=True)
+    if event_ids is not None:
+        events = events.filter(pk__in=list(event_ids))
+    rows = list(events.filter(trending_log__isnull=False).values_list(
+        'id', 'sold_tickets', 'total_tickets', 'created_at', 'trending_log__view_count'
+    ))
+    if not rows:
+        return 0
+    ids = np.fromiter((r[0] for r in rows), dtype=np.int64, count=len(rows))
+    reviews = Review.objects.values('event_id').annotate(n=Count('id'))
+    if event_ids is not None:
+        reviews = reviews.filter(event_id__in=ids.tolist())
+    review_counts = {row['event_id']: row['n'] for row in reviews}
+
+    today = date.today()
+    trending, interest = compute_scores(
+        [r[1] for r in rows],
+        [r[2] for r in rows],
+        [(today - r[3].date()).days if r[3] else 0 for r in rows],
+        [r[4] for r in rows],
+        [review_counts.get(r[0], 0) for r in rows],
+        weights,
+    )
+    now = timezone.now()
+    for i in range(0, len(rows), batch_size):
+        _write_scores(ids[i:i + batch_size], trending[i:i + batch_size], interest[i:i + batch_size], now)
+    return len(rows)
+
+
+def _write_scores(ids, trending, interest, now):
+    """
+    Ghi điểm cho một lô sự kiện. bulk_update() dựng biểu thức CASE cho từng dòng (~0.7 ms/dòng),
+    nên ghi bằng SQL trực tiếp: PostgreSQL một câu UPDATE ... FROM unnest(mảng), DB khác executemany.
+    """
+    qn = connection.ops.quote_name
+    table = qn(EventTrendingLog._meta.db_table)
+    pk = qn(EventTrendingLog._meta.pk.column)
+    trending = [Decimal(f'{t:.4f}') for t in trending]
+    interest = [Decimal(f'{t:.4f}') for t in interest]
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute(
+                f"UPDATE {table} AS t SET trending_score = v.trending_score, interest_score = v.interest_score, "
+                f"last_updated = %s FROM (SELECT unnest(%s::bigint[]) AS id, unnest(%s::numeric[]) AS trending_score, "
+                f"unnest(%s::numeric[]) AS interest_score) AS v WHERE t.{pk} = v.id",
+                [now, ids.tolist(), trending, interest]
+            )
+        else:
+            cursor.executemany(
+                f"UPDATE {table} SET trending_score = %s, interest_score = %s, last_updated = %s WHERE {pk} = %s",
+                [(t, s, now, int(event_id)) for event_id, t, s in zip(ids, trending, interest)]
+            )
+
+
+def rescore_dirty(limit=None):
+    """Tính lại điểm của các sự kiện needs_rescore theo lô. Trả về số sự kiện đã tính."""
+    done = 0
+    while limit is None or done < limit:
+        size = BATCH_SIZE if limit is None else min(BATCH_SIZE, limit - done)
+        with transaction.atomic():
+            # Khóa các dòng cần tính; cờ chỉ được bỏ cùng transaction với việc ghi điểm nên lỗi giữa chừng
+            # giữ nguyên cờ. Lần đánh dấu đồng thời phải chờ khóa và đặt lại cờ sau khi transaction này commit.
+            ids = list(
+                EventTrendingLog.objects.select_for_update(skip_locked=True)
+                .filter(needs_rescore=True).order_by('pk').values_list('pk', flat=True)[:size]
+            )
+            if not ids:
+                break
+            rescore_events(ids)
+            EventTrendingLog.objects.filter(pk__in=ids).update(needs_rescore=False)
+        done += len(ids)
+    return done
+
+
+def _flush_at_exit():
+    if not settings.BUFFER_FLUSH_THREADS:
+        return
+    try:
+        flush()
+    except Exception as e:
+        logger.error(f"Trending flush at exit failed: {e}")
+
+
+atexit.register(_flush_at_exit)
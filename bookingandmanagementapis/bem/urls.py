@@ -18,6 +18,7 @@ router.register('reviews', views.ReviewViewSet, basename='review')
 
 # Định nghĩa các URL patterns
 urlpatterns = [
+    path('tickets/<uuid:ticket_uuid>/qr.<str:fmt>', views.ticket_qr_code, name='ticket-qr'),
     path('', include(router.urls)),
     path('payments/webhook/', PaymentViewSet.as_view({'post': 'payment_webhook'}), name='payment-webhook'),
     path('vnpay/create_payment_url/', views.create_payment_url),
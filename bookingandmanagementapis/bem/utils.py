@@ -1,47 +1,144 @@
 import json
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
 import requests
+from requests.adapters import HTTPAdapter
 from google.oauth2 import service_account
 from google.auth.transport.requests import Request
 from django.conf import settings
 import os
 
+logger = logging.getLogger(__name__)
+
 FIREBASE_SERVICE_ACCOUNT_FILE = os.path.join(
     settings.BASE_DIR, 'bem', 'bemmobile-np-firebase-adminsdk-fbsvc-049b00bb3d.json'
 )
 
 FIREBASE_PROJECT_ID = 'bemmobile-np'  # Thay bằng project_id của bạn
+FCM_SEND_URL = f"https://fcm.googleapis.com/v1/projects/{FIREBASE_PROJECT_ID}/messages:send"
+
+# Làm mới access token trước khi hết hạn một khoảng này
+TOKEN_REFRESH_MARGIN = timedelta(minutes=5)
+
+_credentials = None
+_credentials_lock = threading.Lock()
+
+# Session dùng chung để tái sử dụng kết nối HTTPS tới FCM
+_session = requests.Session()
+_session.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=settings.FCM_MAX_CONCURRENCY))
+
+_executor = ThreadPoolExecutor(max_workers=settings.FCM_MAX_CONCURRENCY, thread_name_prefix='fcm-send')
+
 
 def get_access_token():
-    credentials = service_account.Credentials.from_service_account_file(
-        FIREBASE_SERVICE_ACCOUNT_FILE,
-        scopes=["https://www.googleapis.com/auth/firebase.messaging"]
-    )
-    credentials.refresh(Request())
-    return credentials.token
+    """Access token OAuth2 cho FCM, chỉ đọc file service account và refresh khi token sắp hết hạn."""
+    global _credentials
+    with _credentials_lock:
+        if _credentials is None:
+            _credentials = service_account.Credentials.from_service_account_file(
+                FIREBASE_SERVICE_ACCOUNT_FILE,
+                scopes=["https://www.googleapis.com/auth/firebase.messaging"]
+            )
+        # google-auth lưu expiry dạng UTC naive
+        if not _credentials.token or _credentials.expiry is None or \
+                _credentials.expiry - datetime.utcnow() < TOKEN_REFRESH_MARGIN:
+            _credentials.refresh(Request())
+        return _credentials.token
 
-def send_fcm_v1(user, title, body, data=None):
+
+class PushDeliveryError(Exception):
+    """Một số lần gửi FCM lỗi tạm thời (mạng, 429, 5xx); job gửi lại sẽ thử lại các token này."""
+
+    def __init__(self, tokens):
+        super().__init__(f"{len(tokens)} FCM send(s) failed with a retryable error")
+        self.tokens = tokens
+
+
+def _error_codes(response):
+    try:
+        error = response.json().get('error', {})
+    except ValueError:
+        return set()
+    return {d.get('errorCode') for d in error.get('details', [])} | {error.get('status')}
+
+
+def _classify(response):
+    """
+    'sent', 'unregistered' (chỉ UNREGISTERED / 404: token bị xóa), 'retry' (429, 5xx) hoặc 'failed'.
+    INVALID_ARGUMENT không xóa token: FCM cũng trả về lỗi này khi nội dung thông báo không hợp lệ.
+    """
+    if response.ok:
+        return 'sent'
+    if response.status_code == 404 or 'UNREGISTERED' in _error_codes(response):
+        return 'unregistered'
+    if response.status_code == 429 or response.status_code >= 500:
+        return 'retry'
+    return 'failed'
+
+
+def _send_one(token, headers, notification, data):
+    message = {
+        "message": {
+            "token": token,
+            "notification": notification,
+            "data": data
+        }
+    }
+    try:
+        response = _session.post(FCM_SEND_URL, headers=headers, data=json.dumps(message), timeout=10)
+    except requests.RequestException as e:
+        logger.warning(f"FCM request failed: {e}")
+        return token, 'retry', None
+    result = _classify(response)
+    return token, result, None if result == 'sent' else response.status_code
+
+
+def send_fcm_to_tokens(tokens, title, body, data=None):
+    """
+    Gửi cùng một thông báo tới nhiều device token song song (tối đa FCM_MAX_CONCURRENCY request).
+    Token bị FCM báo không còn đăng ký sẽ bị xóa khỏi DeviceToken. Trả về thống kê kèm 'retry':
+    danh sách token lỗi tạm thời để gửi lại (bem/tasks.send_push_tokens).
+    """
     from .models import DeviceToken
-    tokens = list(DeviceToken.objects.filter(user=user).values_list('token', flat=True))
+    tokens = list(dict.fromkeys(tokens))
     if not tokens:
-        return
-    access_token = get_access_token()
-    url = f"https://fcm.googleapis.com/v1/projects/{FIREBASE_PROJECT_ID}/messages:send"
+        return {'sent': 0, 'failed': 0, 'pruned': 0, 'retry': []}
     headers = {
-        "Authorization": f"Bearer {access_token}",
+        "Authorization": f"Bearer {get_access_token()}",
         "Content-Type": "application/json; UTF-8",
     }
-     # Convert all data values to string
+    notification = {"title": title, "body": body}
+    # Convert all data values to string
     data_str = {str(k): str(v) for k, v in (data or {}).items()}
-    for token in tokens:
-        message = {
-            "message": {
-                "token": token,
-                "notification": {
-                    "title": title,
-                    "body": body,
-                },
-                "data": data_str
-            }
-        }
-        response = requests.post(url, headers=headers, data=json.dumps(message))
-        print(f"FCM v1 response for {user.username}: {response.status_code} {response.text}")
\ No newline at end of file
+
+    results = list(_executor.map(lambda t: _send_one(t, headers, notification, data_str), tokens))
+    by_result = {'sent': [], 'unregistered': [], 'retry': [], 'failed': []}
+    for token, result, status_code in results:
+        by_result[result].append(token)
+    dead = by_result['unregistered']
+    if dead:
+        DeviceToken.objects.filter(token__in=dead).delete()
+    failed = [status_code for _, result, status_code in results if result == 'failed']
+    if failed:
+        # Lỗi không thử lại được (thường là nội dung thông báo không hợp lệ)
+        logger.error(f"FCM v1 send '{title}': {len(failed)} permanent failure(s), HTTP {sorted(set(failed))}")
+    summary = {
+        'sent': len(by_result['sent']), 'failed': len(failed) + len(by_result['retry']),
+        'pruned': len(dead), 'retry': by_result['retry'],
+    }
+    logger.info(f"FCM v1 send '{title}': sent={summary['sent']} failed={summary['failed']} pruned={summary['pruned']}")
+    return summary
+
+
+def send_fcm_to_users(user_ids, title, body, data=None):
+    """Gửi thông báo tới mọi thiết bị của nhiều user bằng một truy vấn DeviceToken."""
+    from .models import DeviceToken
+    tokens = DeviceToken.objects.filter(user_id__in=list(user_ids)).values_list('token', flat=True)
+    return send_fcm_to_tokens(tokens, title, body, data)
+
+
+def send_fcm_v1(user, title, body, data=None):
+    return send_fcm_to_users([user.pk], title, body, data)
@@ -10,8 +10,8 @@ from rest_framework.parsers import MultiPartParser, FormParser, JSONParser
 from django_filters.rest_framework import DjangoFilterBackend
 from django.db.models import Count, Avg, Q, F, Case, When, IntegerField
 from django.shortcuts import get_object_or_404
-from django.core.mail import send_mail
 from django.conf import settings
+from django.core.cache import cache
 from django.utils import timezone
 from datetime import timedelta
 import uuid
@@ -25,27 +25,29 @@ from .models import (
 from .serializers import (
     UserSerializer, UserDetailSerializer, EventSerializer, EventDetailSerializer,
     TicketSerializer, ReviewSerializer, ChatMessageSerializer, TagSerializer,
-    NotificationSerializer,
+    NotificationSerializer, notifications_with_read_state,
     DiscountCodeSerializer, PaymentSerializer, EventTrendingLogSerializer
 )
 from .perms import (
     IsAdminUser, IsAdminOrOrganizer, IsEventOrganizer, IsOrganizer, IsOrganizerOwner,
     IsTicketOwner, IsChatMessageSender, IsEventOwnerOrAdmin,ReviewOwner, IsOrganizerUser
 )
-from .paginators import ItemPaginator
+from .paginators import ItemPaginator, CursorItemPaginator, TrendingCursorPaginator
+from .reservations import extend_holds, hold_tickets
+from .mailer import queue_email
+from .qr_codes import enqueue_qr_uploads, render_ticket_qr, qr_etag, QR_FORMATS
+from .response_cache import cached_response, event_list_scopes
 
 import hashlib
 import hmac
 import urllib.parse
 from datetime import datetime
-from django.http import JsonResponse, HttpResponse
+from django.http import JsonResponse, HttpResponse, HttpResponseNotModified
 from django.shortcuts import redirect
 from django.views.decorators.csrf import csrf_exempt
 import json
 
-from cloudinary.uploader import upload
-
-from .utils import send_fcm_v1
+from . import geo, search, suggestions, tasks, trending
 
 from django.conf import settings
 import os
@@ -64,8 +66,8 @@ def save_fcm_token(request):
         defaults={'updated_at': timezone.now()}
     )
 
-    send_fcm_v1(
-        user,
+    tasks.send_push.delay(
+        [user.id],
         title="Chào mừng bạn đến với ứng dụng!",
         body="Bạn đã đăng nhập thành công. Chúng tôi sẽ gửi thông báo đến bạn qua FCM.",
         data={"type": "welcome"}
@@ -73,6 +75,26 @@ def save_fcm_token(request):
     return Response({'message': 'Token saved'})
 
 
+def ticket_qr_code(request, ticket_uuid, fmt):
+    """Render QR của vé (PNG/SVG) theo uuid. Ảnh chỉ phụ thuộc uuid nên client được cache vĩnh viễn.
+
+    Vé phải tồn tại và đã thanh toán trước khi xét If-None-Match: vé đã hoàn tiền/xoá trả 404 chứ không 304.
+    """
+    if request.method not in ('GET', 'HEAD') or fmt not in QR_FORMATS:
+        return HttpResponse(status=404)
+    if not Ticket.objects.filter(uuid=ticket_uuid, is_paid=True).exists():
+        return HttpResponse("Không tìm thấy vé.", status=404)
+    etag = qr_etag(ticket_uuid, fmt)
+    if etag in request.headers.get('If-None-Match', ''):
+        response = HttpResponseNotModified()
+    else:
+        response = HttpResponse(render_ticket_qr(str(ticket_uuid), fmt), content_type=QR_FORMATS[fmt])
+    response['ETag'] = etag
+    # private: proxy dùng chung không được giữ ảnh sau khi vé bị hoàn tiền
+    response['Cache-Control'] = 'private, max-age=31536000, immutable'
+    return response
+
+
 @csrf_exempt
 def ping_view(request):
     """Use cron-job.org to ping this endpoint every 10 minutes to keep the server render.com alive."""
@@ -89,50 +111,10 @@ def ping_view(request):
 
 @csrf_exempt
 def auto_create_notifications_for_upcoming_events(request):
-    today = timezone.now().date()
-    upcoming_events = Event.objects.filter(
-        start_time__date__in=[today + timedelta(days=7), today + timedelta(days=1)]
-    )
-
-    count = 0
-    for event in upcoming_events:
-        try:
-            message = f"Sự kiện '{event.title}' sẽ diễn ra vào {event.start_time.date()}!"
-            notification = Notification.objects.create(
-                event=event,
-                notification_type='reminder',
-                title="Sự kiện sắp diễn ra",
-                message=message,
-            )
-            print(f"Created notification for event: {event.title}")
-
-            ticket_owners = Ticket.objects.filter(event=event, is_paid=True).values_list('user', flat=True).distinct()
-            for user_id in ticket_owners:
-                UserNotification.objects.create(user_id=user_id, notification=notification)
-                user = User.objects.get(id=user_id)
-                print(f"Created UserNotification for user: {user.username}")
-                
-                send_mail(
-                    subject="Sự kiện sắp diễn ra",
-                    message=f"Kính gửi {user.username},\n\n{message}\n\nTrân trọng!",
-                    from_email=settings.EMAIL_HOST_USER,
-                    recipient_list=[user.email],
-                    fail_silently=False,
-                )
-                print(f"Sent mail to: {user.email}")
-                # Gửi thông báo FCM
-                send_fcm_v1(
-                    user,
-                    title="Sự kiện sắp diễn ra",
-                    body=message,
-                    data={"event_id": event.id, "notification_id": notification.id}
-                )
-                print(f"Sent FCM notification to user: {user.username}")
-            count += 1
-        except Exception as e:
-            print(f"Error for event {event.title}: {e}")
-
-    return JsonResponse({"message": f"Đã tạo notification cho {count} sự kiện."})
+    # Giữ cho cron bên ngoài cũ: chỉ đưa job nhắc lịch vào hàng đợi (đã chống trùng, gọi lại nhiều lần vẫn an toàn).
+    # Nhắc lịch chạy định kỳ bằng bộ lập lịch (SCHEDULER_ENABLED) hoặc lệnh send_reminders.
+    tasks.send_due_reminders.delay()
+    return JsonResponse({"message": "Đã đưa việc nhắc lịch sự kiện vào hàng đợi."})
 
 class UserViewSet(viewsets.ViewSet, generics.CreateAPIView, generics.ListAPIView):
     queryset = User.objects.all()
@@ -153,14 +135,15 @@ class UserViewSet(viewsets.ViewSet, generics.CreateAPIView, generics.ListAPIView
 
     @action(methods=['get', 'patch'], detail=False, url_path='current-user')
     def get_current_user(self, request):
-        user = request.user
+        # request.user chỉ nạp sẵn các trường phân quyền (bem/authentication.py): đọc đủ hồ sơ bằng một truy vấn
+        user = User.objects.get(pk=request.user.pk)
         if request.method == 'PATCH':
             serializer = self.get_serializer(user, data=request.data, partial=True)
             serializer.is_valid(raise_exception=True)
             serializer.save()
             return Response(self.get_serializer(user).data)
         else:
-            serializer = UserDetailSerializer(user)
+            serializer = UserDetailSerializer(user, context={'request': request})
             return Response(serializer.data)
 
     @action(methods=['post'], detail=False, url_path='deactivate')
@@ -209,16 +192,18 @@ class UserViewSet(viewsets.ViewSet, generics.CreateAPIView, generics.ListAPIView
     def get_tickets(self, request):
         user = request.user
         tickets = user.tickets.all().select_related('event')
-        page = self.paginate_queryset(tickets)
-        serializer = TicketSerializer(page or tickets, many=True)
-        return self.get_paginated_response(serializer.data) if page else Response(serializer.data)
+        # Phân trang con trỏ theo (created_at, id), mới nhất trước
+        paginator = CursorItemPaginator()
+        page = paginator.paginate_queryset(tickets, request)
+        serializer = TicketSerializer(page, many=True, context={'request': request})
+        return paginator.get_paginated_response(serializer.data)
 
     @action(methods=['get'], detail=False, url_path='payments')
     def get_payments(self, request):
         user = request.user
         payments = user.payments.all().select_related('discount_code')
         page = self.paginate_queryset(payments)
-        serializer = PaymentSerializer(page or payments, many=True)
+        serializer = PaymentSerializer(page or payments, many=True, context={'request': request})
         return self.get_paginated_response(serializer.data) if page else Response(serializer.data)
 
     # lazy loading / infinite scroll
@@ -232,16 +217,17 @@ class UserViewSet(viewsets.ViewSet, generics.CreateAPIView, generics.ListAPIView
     @action(detail=False, methods=['get'], url_path='my-notifications')
     def my_notifications(self, request):
         user = request.user
+        # Phân trang con trỏ trên UserNotification theo (created_at, id), trạng thái đọc lấy luôn từ các dòng này
         user_notifications = UserNotification.objects.filter(user=user).select_related('notification__event')
-        notifications = [un.notification for un in user_notifications]
-        page = self.paginate_queryset(notifications)
-        serializer = NotificationSerializer(page or notifications, many=True)
-        return self.get_paginated_response(serializer.data) if page else Response(serializer.data)
+        paginator = CursorItemPaginator()
+        page = paginator.paginate_queryset(user_notifications, request)
+        serializer = NotificationSerializer(notifications_with_read_state(page), many=True)
+        return paginator.get_paginated_response(serializer.data)
 
     @action(methods=['get'], detail=False, url_path='sent-messages')
     def get_sent_messages(self, request):
         user = request.user
-        messages = user.sent_messages.all().select_related('event', 'receiver')
+        messages = user.sent_messages.all().select_related('sender', 'receiver')
         page = self.paginate_queryset(messages)
         serializer = ChatMessageSerializer(page or messages, many=True)
         return self.get_paginated_response(serializer.data) if page else Response(serializer.data)
@@ -265,9 +251,9 @@ class UserViewSet(viewsets.ViewSet, generics.CreateAPIView, generics.ListAPIView
 class EventViewSet(viewsets.ViewSet, generics.ListAPIView, generics.RetrieveAPIView, generics.CreateAPIView, generics.UpdateAPIView):
     queryset = Event.objects.all()
     pagination_class = ItemPaginator
-    filter_backends = [DjangoFilterBackend, SearchFilter, OrderingFilter]
+    # Tìm kiếm (?q= hoặc ?search=) dùng chỉ mục full-text của bem/search.py thay cho SearchFilter
+    filter_backends = [DjangoFilterBackend, OrderingFilter]
     filterset_fields = ['category', 'is_active']
-    search_fields = ['title', 'description', 'location', 'category']
     ordering_fields = ['start_time', 'ticket_price']
     parser_classes = [MultiPartParser, FormParser, JSONParser]
 
@@ -277,10 +263,11 @@ class EventViewSet(viewsets.ViewSet, generics.ListAPIView, generics.RetrieveAPIV
         return EventSerializer
 
     def get_permissions(self):
-        if self.action in ['list', 'hot_events', 'categories']:
+        if self.action in ['list', 'hot_events', 'categories', 'autocomplete', 'nearby']:
             # Không yêu cầu xác thực cho list, hot_events
             return [permissions.AllowAny()]
-        elif self.action in ['retrieve', 'get_chat_messages','suggest_events', 'get_statistics']:
+        elif self.action in ['retrieve', 'get_chat_messages', 'get_reviews', 'get_notifications',
+                             'suggest_events', 'get_statistics']:
             # Yêu cầu đăng nhập để xem chi tiết sự kiện hoặc tin nhắn chat
             return [permissions.IsAuthenticated()]
         elif self.action in ['create']:
@@ -289,6 +276,17 @@ class EventViewSet(viewsets.ViewSet, generics.ListAPIView, generics.RetrieveAPIV
             return [IsOrganizerOwner()]
         return [IsAdminOrOrganizer(), IsEventOrganizer()]
 
+    # Danh sách công khai cho khách được cache theo query params, bị xóa khi sự kiện thay đổi (bem/response_cache.py)
+    @cached_response('events', settings.CATALOG_CACHE_SECONDS, scopes=event_list_scopes, anonymous_only=True)
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        response = super().retrieve(request, *args, **kwargs)
+        # Lượt xem chỉ được đếm trong bộ đệm, ghi xuống EventTrendingLog theo lô (bem/trending.py)
+        trending.record_view(request, response.data['id'])
+        return response
+
     def create(self, request, *args, **kwargs):
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
@@ -325,9 +323,9 @@ class EventViewSet(viewsets.ViewSet, generics.ListAPIView, generics.RetrieveAPIV
             # Nếu chưa đăng nhập, chỉ hiển thị các sự kiện công khai (is_active=True)
             queryset = self.queryset.filter(is_active=True)
 
-        q = self.request.query_params.get('q')
+        q = self.request.query_params.get('q') or self.request.query_params.get('search')
         if q:
-            queryset = queryset.filter(Q(title__icontains=q) | Q(description__icontains=q) | Q(location__icontains=q) | Q(category__icontains=q))
+            queryset = search.search(queryset, q)
         return queryset
 
     @action(methods=['get'], detail=True, url_path='tickets')
@@ -335,25 +333,44 @@ class EventViewSet(viewsets.ViewSet, generics.ListAPIView, generics.RetrieveAPIV
         event = self.get_object()
         tickets = event.tickets.filter(is_paid=True).select_related('user')
         page = self.paginate_queryset(tickets)
-        serializer = TicketSerializer(page or tickets, many=True)
+        serializer = TicketSerializer(page or tickets, many=True, context={'request': request})
         return self.get_paginated_response(serializer.data) if page else Response(serializer.data)
 
+    # Các phần con của chi tiết sự kiện, phân trang con trỏ (?cursor=...), mới nhất trước
+    def _cursor_page(self, request, queryset, serializer_class):
+        paginator = CursorItemPaginator()
+        page = paginator.paginate_queryset(queryset, request)
+        serializer = serializer_class(page, many=True, context={'request': request})
+        return paginator.get_paginated_response(serializer.data)
+
     @action(methods=['get'], detail=True, url_path='chat-messages')
     def get_chat_messages(self, request, pk):
         event = self.get_object()
         messages = event.chat_messages.all().select_related('sender', 'receiver')
-        page = self.paginate_queryset(messages)
-        serializer = ChatMessageSerializer(page or messages, many=True)
-        return self.get_paginated_response(serializer.data) if page else Response(serializer.data)
+        return self._cursor_page(request, messages, ChatMessageSerializer)
+
+    @action(methods=['get'], detail=True, url_path='reviews')
+    def get_reviews(self, request, pk):
+        event = self.get_object()
+        reviews = event.reviews.all().select_related('user')
+        return self._cursor_page(request, reviews, ReviewSerializer)
+
+    @action(methods=['get'], detail=True, url_path='notifications')
+    def get_notifications(self, request, pk):
+        event = self.get_object()
+        notifications = event.event_notifications.all().select_related('event')
+        return self._cursor_page(request, notifications, NotificationSerializer)
 
     @action(detail=False, methods=['get'], url_path='hot')
+    @cached_response('hot', settings.HOT_EVENTS_CACHE_SECONDS, scopes=['events', 'events:hot'], vary_on_role=False)
     def hot_events(self, request):
+        # Xếp theo cột đếm sold_tickets (có index), kết quả được cache HOT_EVENTS_CACHE_SECONDS
+        # và bị xóa khi có vé bán/hủy (bem/trending.py) hoặc sự kiện thay đổi
         hot_events = Event.objects.filter(
             is_active=True,
             start_time__gte=timezone.now()
-        ).annotate(tickets_sold=Count('tickets', filter=Q(tickets__is_paid=True))).order_by('-tickets_sold')[:5]
-        serializer = self.get_serializer(hot_events, many=True)
-        return Response(serializer.data)
+        ).prefetch_related('tags').order_by('-sold_tickets', 'start_time')[:settings.HOT_EVENTS_LIMIT]
+        return Response(self.get_serializer(hot_events, many=True).data)
 
     @action(detail=True, methods=['get'], url_path='statistics')
     def get_statistics(self, request, pk):
@@ -378,7 +395,64 @@ class EventViewSet(viewsets.ViewSet, generics.ListAPIView, generics.RetrieveAPIV
         serializer = EventSerializer(events, many=True)
         return Response(serializer.data)
 
+    @action(detail=False, methods=['get'], url_path='autocomplete')
+    def autocomplete(self, request):
+        # Gợi ý khi đang gõ: khớp tiền tố, không dấu, trên các sự kiện đang mở
+        q = request.query_params.get('q', '')
+        if not q.strip():
+            return Response([])
+        events = search.search(Event.objects.active(), q).values('id', 'title')[:settings.SEARCH_AUTOCOMPLETE_LIMIT]
+        return Response(list(events))
+
+    @action(detail=False, methods=['get'], url_path='nearby')
+    def nearby(self, request):
+        # ?lat=&lng=&radius= (km) hoặc ?bbox=min_lng,min_lat,max_lng,max_lat (màn hình bản đồ), &limit=
+        # ?compact=1 chỉ trả về các trường cần để vẽ marker trên bản đồ
+        params = request.query_params
+        try:
+            bbox = None
+            if params.get('bbox'):
+                west, south, east, north = (float(v) for v in params['bbox'].split(','))
+                if not (-90 <= south <= north <= 90 and -180 <= west <= 180 and -180 <= east <= 180):
+                    raise ValueError
+                bbox = (south, west, north, east)
+            if params.get('lat') is not None and params.get('lng') is not None:
+                lat, lng = float(params['lat']), float(params['lng'])
+                if not (-90 <= lat <= 90 and -180 <= lng <= 180):
+                    raise ValueError
+            elif bbox:
+                # Không có vị trí người dùng: khoảng cách tính từ tâm bbox
+                lat = (south + north) / 2
+                lng = (west + east) / 2 if west <= east else ((west + east + 360) / 2 + 180) % 360 - 180
+            else:
+                raise ValueError
+            radius = params.get('radius')
+            radius = min(float(radius), settings.NEARBY_MAX_RADIUS_KM) if radius else (
+                None if bbox else settings.NEARBY_DEFAULT_RADIUS_KM)
+            if radius is not None and radius <= 0:
+                raise ValueError
+            limit = min(int(params.get('limit', settings.NEARBY_DEFAULT_LIMIT)), settings.NEARBY_MAX_LIMIT)
+            if limit <= 0:
+                raise ValueError
+        except ValueError:
+            return Response({"error": "Cần lat, lng (và radius km) hoặc bbox=min_lng,min_lat,max_lng,max_lat hợp lệ."},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        results = geo.nearby(Event.objects.active(), lat, lng, radius_km=radius, bbox=bbox, limit=limit)
+        ids = [event_id for event_id, _ in results]
+        if params.get('compact'):
+            events = {e['id']: e for e in Event.objects.filter(pk__in=ids).values(
+                'id', 'title', 'category', 'latitude', 'longitude', 'start_time', 'ticket_price')}
+            data = [events[event_id] for event_id in ids]
+        else:
+            events = Event.objects.filter(pk__in=ids).prefetch_related('tags').in_bulk()
+            data = self.get_serializer([events[event_id] for event_id in ids], many=True).data
+        for item, (_, distance) in zip(data, results):
+            item['distance_km'] = round(distance, 3)
+        return Response(data)
+
     @action(detail=False, methods=['get'], url_path='categories')
+    @cached_response('categories', settings.CATEGORIES_CACHE_SECONDS, vary_on_role=False)
     def categories(self, request):
         categories = dict(Event.CATEGORY_CHOICES)
         return Response(categories)
@@ -389,28 +463,12 @@ class EventViewSet(viewsets.ViewSet, generics.ListAPIView, generics.RetrieveAPIV
         if not user.is_authenticated:
             return Response({"error": "Authentication required to get suggested events."}, status=status.HTTP_401_UNAUTHORIZED)
 
-        # Lấy danh sách tag và category liên quan đến người dùng
-        user_tags = user.tags.all()
-        user_ticket_categories = Ticket.objects.filter(
-            user=user
-        ).values_list('event__category', flat=True).distinct()
-
-        # Truy vấn sự kiện theo tag hoặc category
-        suggested_events = Event.objects.active().filter(
-            Q(tags__in=user_tags) | Q(category__in=user_ticket_categories),
-            start_time__gte=timezone.now()
-        ).annotate(
-            matching_tags=Count('tags', filter=Q(tags__in=user_tags)),
-            is_matching_category=Case(
-                When(category__in=user_ticket_categories, then=1),
-                default=0,
-                output_field=IntegerField()
-            )
-        ).order_by(
-            '-matching_tags',
-            '-is_matching_category',
-            'start_time'
-        ).distinct()[:10]
+        # Gợi ý đã tính sẵn theo tag và category đã mua vé (bem/suggestions.py), chỉ còn lấy sự kiện theo id
+        event_ids = suggestions.suggested_event_ids(user)
+        events = Event.objects.active().filter(
+            pk__in=event_ids, start_time__gte=timezone.now()
+        ).prefetch_related('tags').in_bulk()
+        suggested_events = [events[event_id] for event_id in event_ids if event_id in events]
 
         serializer = EventSerializer(suggested_events, many=True, context={'request': request})
         return Response(serializer.data)
@@ -430,6 +488,10 @@ class TagViewSet(viewsets.ViewSet, generics.ListAPIView, generics.CreateAPIView,
             return [IsAdminUser()]
         return [permissions.AllowAny()] 
 
+    @cached_response('tags', settings.TAG_LIST_CACHE_SECONDS, vary_on_role=False)
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
 
 class TicketViewSet(viewsets.ViewSet, generics.ListAPIView,generics.UpdateAPIView):
     queryset = Ticket.objects.all()
@@ -438,7 +500,7 @@ class TicketViewSet(viewsets.ViewSet, generics.ListAPIView,generics.UpdateAPIVie
     pagination_class = ItemPaginator
 
     def get_permissions(self):
-        if self.action in ['book_ticket', 'check_in']:
+        if self.action in ['book_ticket', 'book_tickets', 'check_in']:
             return [permissions.IsAuthenticated()]
         elif self.action in ['update', 'destroy', 'retrieve']:
             return [IsTicketOwner()]
@@ -447,7 +509,7 @@ class TicketViewSet(viewsets.ViewSet, generics.ListAPIView,generics.UpdateAPIVie
     def get_queryset(self):
         if not self.request.user.is_authenticated:
             return self.queryset.none()
-        return self.queryset.filter(user=self.request.user).select_related('event')
+        return self.queryset.filter(user=self.request.user).select_related('event', 'user')
 
     #Xem chi tiết vé (xem chi tiết,hiện QR để scan check-in)
     # Chỉ cho phép người dùng xem vé của mình
@@ -467,20 +529,48 @@ class TicketViewSet(viewsets.ViewSet, generics.ListAPIView,generics.UpdateAPIVie
         except Event.DoesNotExist:
             return Response({"error": "Sự kiện không tồn tại hoặc không khả dụng."}, status=status.HTTP_404_NOT_FOUND)
 
-        if event.tickets.filter(is_paid=True).count() >= event.total_tickets:
-            return Response({"error": "Hết vé."}, status=status.HTTP_400_BAD_REQUEST)
-
-        #Tạo vé, KHÔNG tạo QR
+        #Tạo vé (giữ chỗ trong TICKET_HOLD_MINUTES phút), KHÔNG tạo QR
         ticket = Ticket(event=event, user=request.user)
-        ticket.save()
+        try:
+            ticket.save()
+        except ValidationError:
+            return Response({"error": "Hết vé."}, status=status.HTTP_400_BAD_REQUEST)
 
         return Response({
             "message": "Vé đã được đặt thành công.",
-            "ticket": TicketSerializer(ticket).data,
+            "ticket": TicketSerializer(ticket, context={'request': request}).data,
             "qr_code_url": None  # Chưa có QR
         }, status=status.HTTP_201_CREATED)
 
 
+    #đặt nhiều vé cho sự kiện trong một giao dịch
+    @action(detail=False, methods=['post'], url_path='book-tickets')
+    def book_tickets(self, request):
+        event_id = request.data.get('event_id')
+        try:
+            quantity = int(request.data.get('quantity', 1))
+        except (TypeError, ValueError):
+            return Response({"error": "Số lượng vé không hợp lệ."}, status=status.HTTP_400_BAD_REQUEST)
+        if not 1 <= quantity <= settings.MAX_TICKETS_PER_BOOKING:
+            return Response(
+                {"error": f"Số lượng vé phải từ 1 đến {settings.MAX_TICKETS_PER_BOOKING}."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        try:
+            event = Event.objects.get(id=event_id, is_active=True, start_time__gte=timezone.now())
+        except (Event.DoesNotExist, ValueError):
+            return Response({"error": "Sự kiện không tồn tại hoặc không khả dụng."}, status=status.HTTP_404_NOT_FOUND)
+
+        try:
+            tickets = hold_tickets(event, request.user, quantity)
+        except ValidationError:
+            return Response({"error": "Không đủ vé."}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response({
+            "message": f"Đã đặt thành công {len(tickets)} vé.",
+            "tickets": TicketSerializer(tickets, many=True, context={'request': request}).data,
+        }, status=status.HTTP_201_CREATED)
+
     @action(detail=False, methods=['post'], url_path='check-in')
     def check_in(self, request):
         ticket_uuid = request.data.get('uuid')
@@ -493,7 +583,7 @@ class TicketViewSet(viewsets.ViewSet, generics.ListAPIView,generics.UpdateAPIVie
             return Response({"error": "Vé đã được check-in."}, status=status.HTTP_400_BAD_REQUEST)
 
         ticket.check_in()
-        return Response({"message": "Check-in thành công.", "ticket": TicketSerializer(ticket).data})
+        return Response({"message": "Check-in thành công.", "ticket": TicketSerializer(ticket, context={'request': request}).data})
 
 
 def vnpay_encode(value):
@@ -686,7 +776,11 @@ class PaymentViewSet(viewsets.ViewSet, generics.ListAPIView, generics.UpdateAPIV
 
         payment.status = True
         payment.paid_at = timezone.now()
-        payment.save()
+        try:
+            payment.save()
+        except ValidationError:
+            # Vé không còn giữ chỗ và sự kiện đã hết vé: không xác nhận thanh toán
+            return Response({"error": "Hết vé cho sự kiện này."}, status=status.HTTP_400_BAD_REQUEST)
 
         # Cập nhật total_spent của user
         user = payment.user
@@ -701,71 +795,32 @@ class PaymentViewSet(viewsets.ViewSet, generics.ListAPIView, generics.UpdateAPIV
             discount_obj.save()
 
         tickets = payment.tickets.all()
-        # Tạo QR code cho các vé vừa thanh toán thành công (nếu chưa có)
-
-        for ticket in tickets:
-            if not ticket.qr_code:
-                qr = qrcode.QRCode(version=1, box_size=10, border=5)
-                qr.add_data(str(ticket.uuid))
-                qr.make(fit=True)
-                img = qr.make_image(fill='black', back_color='white')
-                buffer = io.BytesIO()
-                img.save(buffer, format="PNG")
-                buffer.seek(0)
-                upload_result = upload(buffer, folder="ticket_qr_codes")
-                ticket.qr_code = upload_result['secure_url']
-                ticket.save()
+        # Tạo QR code cho các vé vừa thanh toán thành công (nếu chưa có) ở nền
+        enqueue_qr_uploads(tickets)
 
         if tickets:
             event = tickets.first().event
 
-            event.sold_tickets = event.tickets.filter(is_paid=True).count()
-            event.save(update_fields=['sold_tickets'])
-
             message = (f"Thanh toán {payment.amount} cho {tickets.count()} vé sự kiện {event.title} đã hoàn tất.")
-            print("Nội dung thông báo:", message)
-            try:
-                notification, created = Notification.objects.get_or_create(
-                    event=event,
-                    notification_type='reminder',
-                    title="Thanh toán thành công",
-                    message=message
-                )
-                notification.save()
-                UserNotification.objects.get_or_create(user=request.user, notification=notification)
-                print(f"Notification created: {notification.title} - {notification.message}")
-                # Gửi thông báo FCM
-                send_fcm_v1(
-                    user,
-                    title="Thanh toán thành công",
-                    body=message,
-                    data={"event_id": event.id, "notification_id": notification.id}
-                )
-                print(f"Sent FCM notification to user: {user.username}")
-            except Exception as e:
-                print("Lỗi khi gửi notification hoặc FCM:", e)
-
-
-            # Tạo tin nhắn từ organizer đến attendee
-            organizer = event.organizer
-            ChatMessage.objects.create(
+            notification, created = Notification.objects.get_or_create(
                 event=event,
-                sender=organizer,
-                receiver=user,
-                message="Tôi có thể giúp gì cho bạn ?",
-                is_from_organizer=True
+                notification_type='reminder',
+                title="Thanh toán thành công",
+                message=message
+            )
+            # Các side effect chạy ở job nền: UserNotification + FCM, tin nhắn chào, email
+            tasks.notify_users.delay(notification.id, [user.id])
+            # Tạo tin nhắn từ organizer đến attendee
+            tasks.send_chat_welcome.delay(event.id, user.id)
+            queue_email(
+                subject=f"Thanh toán thành công ",
+                body=f"Kính gửi {user.username},\n\nThanh toán {payment.amount} cho {tickets.count()} vé sự kiện {event.title} đã được xác nhận thành công.\n\nTrân trọng!",
+                recipient_list=[user.email],
             )
-        send_mail(
-            subject=f"Thanh toán thành công ",
-            message=f"Kính gửi {user.username},\n\nThanh toán {payment.amount} cho {tickets.count()} vé sự kiện {event.title} đã được xác nhận thành công.\n\nTrân trọng!",
-            from_email=settings.EMAIL_HOST_USER,
-            recipient_list=[user.email],
-            fail_silently=False,
-        )
 
         return Response({
             "message": "Thanh toán xác nhận thành công.",
-            "payment": PaymentSerializer(payment).data
+            "payment": PaymentSerializer(payment, context={'request': request}).data
         })
 
     @action(detail=False, methods=['post'], url_path='pay-unpaid-tickets')
@@ -792,7 +847,7 @@ class PaymentViewSet(viewsets.ViewSet, generics.ListAPIView, generics.UpdateAPIV
         if unpaid_tickets.count() != len(ticket_ids):
             return Response({"error": "Một số vé không hợp lệ hoặc đã thanh toán."}, status=status.HTTP_400_BAD_REQUEST)
         
-        total_amount = sum(ticket.event.ticket_price for ticket in unpaid_tickets)
+        total_amount = event.ticket_price * len(ticket_ids)
 
         #Xử lý mã giảm giá
         discount_obj = None
@@ -824,9 +879,9 @@ class PaymentViewSet(viewsets.ViewSet, generics.ListAPIView, generics.UpdateAPIV
             discount_code=discount_obj
         )
         payment.save()
-        for ticket in (unpaid_tickets):
-            ticket.payment = payment
-            ticket.save()
+        unpaid_tickets.update(payment=payment)
+        # Gia hạn giữ chỗ để người dùng có đủ thời gian hoàn tất thanh toán
+        extend_holds(unpaid_tickets)
 
         # notification = Notification(
         #     event=event,
@@ -867,7 +922,7 @@ class PaymentViewSet(viewsets.ViewSet, generics.ListAPIView, generics.UpdateAPIV
 
         return Response({
             "message": "Tạo payment thành công. Vui lòng thanh toán.",
-            "payment": PaymentSerializer(payment).data,
+            "payment": PaymentSerializer(payment, context={'request': request}).data,
             "payment_url": payment_url
         })
 
@@ -927,20 +982,17 @@ class NotificationViewSet(viewsets.ViewSet):
         if not request.user.is_authenticated:
             return Response({"error": "Yêu cầu xác thực."}, status=status.HTTP_401_UNAUTHORIZED)
 
-        user_notifications = UserNotification.objects.filter(user=request.user).select_related('notification__event').order_by('-notification__created_at')
-        notifications = [un.notification for un in user_notifications]
+        user_notifications = UserNotification.objects.filter(user=request.user).select_related('notification__event')
 
-        paginator = ItemPaginator()
-        page = paginator.paginate_queryset(notifications, request)
+        # Phân trang con trỏ ở DB theo (created_at, id) rồi mới dựng Notification kèm is_read cho trang hiện tại
+        paginator = CursorItemPaginator()
+        page = paginator.paginate_queryset(user_notifications, request)
         serializer = NotificationSerializer(
-            page or notifications,
+            notifications_with_read_state(page),
             many=True,
-            context={'request': request}  # Truyền context để get_is_read truy cập request.user
+            context={'request': request}
         )
-
-        if page is not None:
-            return paginator.get_paginated_response(serializer.data)
-        return Response(serializer.data)
+        return paginator.get_paginated_response(serializer.data)
 
     @action(detail=False, methods=['get'], url_path='event-notifications')
     def event_notifications(self, request):
@@ -949,16 +1001,16 @@ class NotificationViewSet(viewsets.ViewSet):
             return Response({"error": "Thiếu tham số event_id."}, status=status.HTTP_400_BAD_REQUEST)
 
         try:
-            notifications = Notification.objects.filter(event_id=event_id).order_by('id')
+            notifications = Notification.objects.filter(event_id=event_id).select_related('event').order_by('id')
         except ValueError:
             return Response({"error": "event_id không hợp lệ."}, status=status.HTTP_400_BAD_REQUEST)
 
         paginator = ItemPaginator()
         page = paginator.paginate_queryset(notifications, request)
         serializer = NotificationSerializer(
-            page or notifications,
+            page if page is not None else notifications,
             many=True,
-            context={'request': request}  # Truyền context
+            context={'request': request}  # Truyền context, is_read được lấy một lần cho cả trang
         )
 
         if page is not None:
@@ -1031,7 +1083,7 @@ class NotificationViewSet(viewsets.ViewSet):
 class ChatMessageViewSet(viewsets.ViewSet, generics.ListCreateAPIView):
     serializer_class = ChatMessageSerializer
     permission_classes = [permissions.IsAuthenticated]
-    pagination_class = ItemPaginator
+    pagination_class = CursorItemPaginator
 
     def get_queryset(self):
         event_id = self.request.query_params.get('event_id')
@@ -1039,11 +1091,11 @@ class ChatMessageViewSet(viewsets.ViewSet, generics.ListCreateAPIView):
             return ChatMessage.objects.none()
         return ChatMessage.objects.filter(
             event_id=event_id
-        ).filter(
+        ).select_related('sender', 'receiver').filter(
             Q(receiver_id=self.request.user.id) |
             Q(sender_id=self.request.user.id) |
             Q(receiver_id__isnull=True)
-        ).order_by('-created_at')
+        )
 
     def list(self, request, *args, **kwargs):
         event_id = request.query_params.get('event_id')
@@ -1052,8 +1104,8 @@ class ChatMessageViewSet(viewsets.ViewSet, generics.ListCreateAPIView):
         
         queryset = self.get_queryset()
         page = self.paginate_queryset(queryset)
-        serializer = self.get_serializer(page or queryset, many=True)
-        return self.get_paginated_response(serializer.data) if page else Response(serializer.data)
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
 
     def create(self, request, *args, **kwargs):
         serializer = self.get_serializer(data=request.data)
@@ -1081,8 +1133,8 @@ class ChatMessageViewSet(viewsets.ViewSet, generics.ListCreateAPIView):
         receiver = serializer.validated_data.get('receiver')
         if receiver:
             message_body = f"Bạn có tin nhắn mới từ {request.user.username} trong sự kiện {event.title}: {chat_message.message[:50]}..."
-            send_fcm_v1(
-                receiver,
+            tasks.send_push.delay(
+                [receiver.id],
                 title="Tin nhắn mới",
                 body=message_body,
                 data={
@@ -1091,7 +1143,6 @@ class ChatMessageViewSet(viewsets.ViewSet, generics.ListCreateAPIView):
                     "type": "chat_message"
                 }
             )
-            print(f"Sent FCM notification to {receiver.username} for new chat message in event {event.title}")
 
 
         return Response(serializer.data, status=status.HTTP_201_CREATED)
@@ -1163,19 +1214,14 @@ class ReviewViewSet(viewsets.ViewSet, generics.ListCreateAPIView, generics.Updat
             )
             notification.save()
 
-            # Tạo UserNotification để liên kết với người dùng gốc
-            UserNotification.objects.get_or_create(
-                user=parent_review.user,
-                notification=notification
-            )
+            # Tạo UserNotification để liên kết với người dùng gốc (job nền)
+            tasks.notify_users.delay(notification.id, [parent_review.user_id], push=False)
 
             # Gửi email thông báo (tùy chọn)
-            send_mail(
+            queue_email(
                 subject=f"Phản hồi từ người tổ chức cho sự kiện {event.title}",
-                message=f"Kính gửi {parent_review.user.username},\n\nNgười tổ chức đã phản hồi đánh giá của bạn cho sự kiện {event.title}. Vui lòng kiểm tra ứng dụng để xem chi tiết.\n\nTrân trọng!",
-                from_email=settings.EMAIL_HOST_USER,
+                body=f"Kính gửi {parent_review.user.username},\n\nNgười tổ chức đã phản hồi đánh giá của bạn cho sự kiện {event.title}. Vui lòng kiểm tra ứng dụng để xem chi tiết.\n\nTrân trọng!",
                 recipient_list=[parent_review.user.email],
-                fail_silently=False,
             )
         else:
             # Nếu là review gốc, kiểm tra user chưa review event
@@ -1218,13 +1264,14 @@ class ReviewViewSet(viewsets.ViewSet, generics.ListCreateAPIView, generics.Updat
 
 
 class EventTrendingLogViewSet(viewsets.ViewSet,generics.ListAPIView, generics.RetrieveAPIView):
-    queryset = EventTrendingLog.objects.filter(event__is_active=True)
+    queryset = EventTrendingLog.objects.filter(event__is_active=True).select_related('event')
     serializer_class = EventTrendingLogSerializer
-    pagination_class = ItemPaginator
+    pagination_class = TrendingCursorPaginator
     permission_classes = [permissions.AllowAny]
 
     def retrieve(self, request, *args, **kwargs):
         trending_log = self.get_object()
         event = trending_log.event
-        serializer = EventDetailSerializer(event)
+        serializer = EventDetailSerializer(event, context={'request': request})
+        trending.record_view(request, event.pk)
         return Response(serializer.data)
\ No newline at end of file
@@ -27,6 +27,9 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 SECRET_KEY = os.environ.get('SECRET_KEY')
 DEBUG = True
 
+# manage.py test: job nền chạy ngay (eager), không có thread nền ghi bộ đệm vào DB test
+TESTING = len(sys.argv) > 1 and sys.argv[1] == 'test'
+
 # ALLOWED_HOSTS = ["*"]
 
 
@@ -45,6 +48,9 @@ if firebase_json:
     with open(SERVICE_ACCOUNT_PATH, "w") as f:
         f.write(firebase_json)
 
+# Số request gửi FCM song song tối đa khi gửi cho nhiều thiết bị
+FCM_MAX_CONCURRENCY = int(os.environ.get('FCM_MAX_CONCURRENCY', 32))
+
 #End setting của Firebase push notification HTTP V1 API
 
 INSTALLED_APPS = [
@@ -80,9 +86,9 @@ OAUTH2_PROVIDER = {
 
 
 REST_FRAMEWORK = {
+    # OAuth2 access token hoặc JWT, kết quả xác thực được cache (bem/authentication.py)
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'oauth2_provider.contrib.rest_framework.OAuth2Authentication',
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'bem.authentication.CachedTokenAuthentication',
     ),
     'DEFAULT_FILTER_BACKENDS': (
         'django_filters.rest_framework.DjangoFilterBackend',
@@ -118,6 +124,8 @@ MIDDLEWARE = [
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.common.CommonMiddleware',
+    # ETag/Last-Modified -> 304 cho các response GET (xem bem/response_cache.py)
+    'django.middleware.http.ConditionalGetMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
@@ -244,6 +252,85 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 #     'django.contrib.auth.backends.ModelBackend',
 # ]
 
+# Thời gian giữ chỗ (phút) cho vé đã đặt nhưng chưa thanh toán
+TICKET_HOLD_MINUTES = int(os.environ.get('TICKET_HOLD_MINUTES', 15))
+# Số vé tối đa cho một lần đặt nhóm (tickets/book-tickets/)
+MAX_TICKETS_PER_BOOKING = 50
+
+# QR code của vé được render theo yêu cầu từ uuid; bật TICKET_QR_UPLOAD để lưu thêm ảnh lên Cloudinary
+TICKET_QR_UPLOAD = os.environ.get('TICKET_QR_UPLOAD', 'False') == 'True'
+QR_RENDER_CACHE_SIZE = 1024
+
+# Thời gian cache danh sách người tham gia chat của sự kiện (giây), bị xóa khi vé thay đổi
+CHAT_ROSTER_CACHE_SECONDS = 300
+
+# Ghi tin nhắn chat theo lô (bem/chat_buffer.py): tin nhắn được broadcast ngay, ghi xuống DB bằng bulk_create
+# sau CHAT_FLUSH_MILLISECONDS hoặc khi đủ CHAT_FLUSH_BATCH_SIZE tin nhắn; id được lấy trước theo khối CHAT_ID_BLOCK_SIZE.
+# Tiến trình bị kill đột ngột làm mất các tin nhắn đã hiển thị nhưng chưa ghi (xem docstring của module)
+CHAT_WRITE_BEHIND = os.environ.get('CHAT_WRITE_BEHIND', 'False') == 'True'
+CHAT_FLUSH_MILLISECONDS = 20
+CHAT_FLUSH_BATCH_SIZE = 200
+CHAT_ID_BLOCK_SIZE = 1000
+# Lô ghi lỗi quá số lần này thì được ghi lại từng dòng; dòng lỗi không phải do DB tạm thời bị bỏ và lưu vào FailedTask
+CHAT_FLUSH_MAX_ATTEMPTS = 3
+# Lịch sử chat (bem/chat_history.py): số tin nhắn giữ trong bộ nhớ mỗi phòng, số tin nhắn gửi khi connect
+# và số tin nhắn mỗi lần client xem tin nhắn cũ hơn ({"action": "history", "before_id": ...})
+CHAT_HISTORY_SIZE = 200
+CHAT_HISTORY_INITIAL = 50
+CHAT_HISTORY_PAGE_SIZE = 50
+
+# Thread nền (và flush khi thoát) ghi bộ đệm trending / chat write-behind xuống DB. Tắt khi chạy test:
+# bộ đệm chỉ được ghi khi gọi flush()
+BUFFER_FLUSH_THREADS = not TESTING
+# Trending (bem/trending.py): chu kỳ ghi bộ đệm thay đổi xuống DB và chu kỳ tính lại điểm (giây)
+TRENDING_FLUSH_SECONDS = 5
+TRENDING_RESCORE_SECONDS = 60
+# Mỗi user/IP chỉ được tính một lượt xem cho một sự kiện trong khoảng này (giây)
+VIEW_DEDUPE_SECONDS = 1800
+# Danh sách sự kiện hot (events/hot/): số sự kiện và thời gian cache (giây)
+HOT_EVENTS_LIMIT = 5
+HOT_EVENTS_CACHE_SECONDS = 60
+
+# Gợi ý sự kiện (bem/suggestions.py): số sự kiện gợi ý, trọng số category (< 1 để xếp sau số tag trùng),
+# thời gian dùng lại ma trận sự kiện trong tiến trình, cache mỗi user và chu kỳ dựng lại toàn bộ (giây)
+SUGGESTION_LIMIT = 10
+SUGGESTION_CATEGORY_WEIGHT = 0.5
+SUGGESTION_EVENT_INDEX_SECONDS = 300
+SUGGESTION_CACHE_SECONDS = 600
+SUGGESTION_REBUILD_SECONDS = 3600
+
+# Số gợi ý tối đa của events/autocomplete/ (bem/search.py)
+SEARCH_AUTOCOMPLETE_LIMIT = 8
+
+# Sự kiện gần vị trí (events/nearby/, bem/geo.py): bán kính mặc định/tối đa (km), số kết quả mặc định/tối đa
+NEARBY_DEFAULT_RADIUS_KM = 10
+NEARBY_MAX_RADIUS_KM = 200
+NEARBY_DEFAULT_LIMIT = 100
+NEARBY_MAX_LIMIT = 2000
+# Trọng số điểm: trending = sold_ratio, velocity (vé/ngày), views (log); interest = trending, vé đã bán, review
+TRENDING_WEIGHTS = {
+    'sold_ratio': 0.5,
+    'velocity': 0.3,
+    'views': 0.2,
+    'interest_trending': 0.5,
+    'interest_sold': 0.3,
+    'interest_reviews': 0.2,
+}
+
+# Hàng đợi job nền (bem/tasks.py): 'thread' chạy trong thread pool của tiến trình, 'eager' chạy ngay (test)
+TASK_BACKEND = os.environ.get('TASK_BACKEND', 'eager' if TESTING else 'thread')
+TASK_WORKERS = int(os.environ.get('TASK_WORKERS', 8))
+TASK_MAX_RETRIES = 3
+
+# Bộ lập lịch trong tiến trình (bem/scheduler.py) chạy các job định kỳ như nhắc lịch, dọn vé giữ chỗ.
+# Chỉ một tiến trình trên mỗi máy giữ được khóa SCHEDULER_LOCK_FILE và chạy lịch; không chạy trong
+# management command (trừ runserver) và với TASK_BACKEND = 'eager'.
+SCHEDULER_ENABLED = os.environ.get('SCHEDULER_ENABLED', 'True') == 'True'
+SCHEDULER_LOCK_FILE = os.environ.get('SCHEDULER_LOCK_FILE', '/tmp/bem-scheduler.lock')
+# Nhắc lịch trước bao nhiêu ngày và chu kỳ quét (giây)
+REMINDER_DAYS = (7, 1)
+REMINDER_INTERVAL_SECONDS = 3600
+
 # OAuth2 Configuration - Required environment variables
 CLIENT_ID = os.environ.get('CLIENT_ID')
 CLIENT_SECRET = os.environ.get('CLIENT_SECRET')
@@ -267,6 +354,37 @@ CSRF_TRUSTED_ORIGINS = [
 
 
 
+# Cache dùng chung (response catalog, hot events, roster chat, token...): Redis nếu có CACHE_REDIS_URL
+# (mặc định dùng REDIS_URL của channels), ngược lại bộ nhớ riêng của từng tiến trình.
+# KEY_PREFIX đổi theo commit khi deploy để không đọc lại dữ liệu cache của phiên bản cũ.
+CACHE_REDIS_URL = os.environ.get('CACHE_REDIS_URL', os.environ.get('REDIS_URL'))
+if CACHE_REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': CACHE_REDIS_URL,
+            'KEY_PREFIX': os.environ.get('CACHE_KEY_PREFIX', os.environ.get('RENDER_GIT_COMMIT', '')[:12]),
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'OPTIONS': {'MAX_ENTRIES': 10000},
+        }
+    }
+
+# Thời gian cache token đã xác thực (user id, scope, hạn dùng) và các trường phân quyền của User
+# cho REST API (giây), xem bem/authentication.py
+AUTH_TOKEN_CACHE_SECONDS = 300
+AUTH_USER_CACHE_SECONDS = 300
+
+# Thời gian cache response (giây) của danh sách sự kiện cho khách, tags, categories và swagger schema
+CATALOG_CACHE_SECONDS = 120
+TAG_LIST_CACHE_SECONDS = 600
+CATEGORIES_CACHE_SECONDS = 86400
+SCHEMA_CACHE_SECONDS = 3600
+
 CHANNEL_LAYERS = {
     "default": {
         "BACKEND": "channels_redis.core.RedisChannelLayer",
@@ -335,7 +453,9 @@ LOGGING = {
 STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 
 # Email
-EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
+# Dùng 'django.core.mail.backends.filebased.EmailBackend' (+ EMAIL_FILE_PATH) hoặc locmem để chạy offline
+EMAIL_BACKEND = os.environ.get('EMAIL_BACKEND', 'django.core.mail.backends.smtp.EmailBackend')
+EMAIL_FILE_PATH = os.environ.get('EMAIL_FILE_PATH', os.path.join(BASE_DIR, 'sent_emails'))
 EMAIL_HOST = 'smtp.gmail.com'
 EMAIL_PORT = 587
 EMAIL_USE_TLS = True
@@ -344,3 +464,14 @@ EMAIL_HOST_USER = os.environ.get('EMAIL_HOST_USER')
 EMAIL_HOST_PASSWORD = os.environ.get('EMAIL_HOST_PASSWORD')  # App password vừa tạo
 # DEFAULT_FROM_EMAIL = EMAIL_HOST_USER
 DEFAULT_FROM_EMAIL = 'Event management and online booking system <{}>'.format(EMAIL_HOST_USER)
+
+# Outbox email (bem/mailer.py): số mail mỗi lô, giới hạn tốc độ gửi (mail/giây, 0 = không giới hạn),
+# số mail tối đa trên một kết nối SMTP trước khi mở lại, số lần thử trước khi đánh dấu failed
+EMAIL_BATCH_SIZE = 100
+EMAIL_MAX_PER_SECOND = float(os.environ.get('EMAIL_MAX_PER_SECOND', 10))
+EMAIL_MAX_PER_CONNECTION = 100
+EMAIL_MAX_ATTEMPTS = 3
+# Mail gửi lỗi được thử lại sau EMAIL_RETRY_BACKOFF_SECONDS * 2^(lần thử - 1) giây
+EMAIL_RETRY_BACKOFF_SECONDS = 60
+# Dòng 'sending' lâu hơn khoảng này (giây) được coi là bỏ dở và nhận lại
+EMAIL_CLAIM_TIMEOUT_SECONDS = int(os.environ.get('EMAIL_CLAIM_TIMEOUT_SECONDS', 600))
@@ -197,10 +197,7 @@ def load_dummy_data():
             )
             try:
                 ticket.full_clean()
-                ticket.save()
-                if ticket.is_paid:
-                    event.sold_tickets += 1
-                    event.save(update_fields=['sold_tickets'])
+                ticket.save()  # sold_tickets được Ticket.save cập nhật
                 tickets_map[f"{event_title}_{user_username}"] = ticket
                 print(f"Đã tạo ticket cho user {user.username} tại event {event.title}")
             except ValidationError as e: